@@ -0,0 +1,59 @@
+"""Throughput of the vectorized transform against the per-element implementation it replaced.
+
+Usage: python -m benchmarks.bench_transform [--sizes 10 10000 1000000] [--legacy]
+"""
+import argparse
+import logging
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import generate_market_frame
+from etl_pipeline import transform
+from etl_pipeline.transform import parse_roi, safe_convert, transform_market_data
+
+
+def legacy_coerce_numeric(series: pd.Series) -> pd.Series:
+    return series.apply(lambda x: safe_convert(x, float))
+
+
+def legacy_flatten_roi(roi: pd.Series) -> pd.DataFrame:
+    parsed = roi.apply(parse_roi)
+    return pd.DataFrame({
+        'roi_times': parsed.apply(lambda x: x['times']),
+        'roi_currency': parsed.apply(lambda x: x['currency']),
+        'roi_percentage': parsed.apply(lambda x: x['percentage']),
+    }, index=roi.index)
+
+
+def run_transform(frame: pd.DataFrame, legacy: bool = False) -> float:
+    """Seconds taken by transform_market_data on a copy of `frame`."""
+    originals = transform.coerce_numeric, transform.flatten_roi
+    if legacy:
+        transform.coerce_numeric, transform.flatten_roi = legacy_coerce_numeric, legacy_flatten_roi
+    try:
+        data = frame.copy()
+        start = time.perf_counter()
+        transform_market_data(data)
+        return time.perf_counter() - start
+    finally:
+        transform.coerce_numeric, transform.flatten_roi = originals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 10_000, 1_000_000])
+    parser.add_argument('--legacy', action='store_true', help="also time the per-element implementation")
+    args = parser.parse_args()
+
+    logging.getLogger('etl_pipeline.transform').setLevel(logging.WARNING)
+    print(f"{'rows':>10} {'vectorized rows/s':>18} {'legacy rows/s':>14}")
+    for size in args.sizes:
+        frame = generate_market_frame(size)
+        vectorized = size / run_transform(frame)
+        legacy = f"{size / run_transform(frame, legacy=True):>14,.0f}" if args.legacy else f"{'-':>14}"
+        print(f"{size:>10,} {vectorized:>18,.0f} {legacy}")
+
+
+if __name__ == '__main__':
+    main()
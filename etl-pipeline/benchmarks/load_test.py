@@ -0,0 +1,340 @@
+"""Load test of the web_app: drives `/` and `/api/crypto_data` at a fixed concurrency and reports latency SLOs.
+
+With --pg-dsn (or BENCH_PG_DSN) a local PostgreSQL is seeded with --coins synthetic coins in the
+web_bench schema and the app is started against it, under gunicorn with web_app/gunicorn.conf.py
+(--server production) or the Flask development server (--server development). --url targets an
+app that is already running instead. p50/p95/p99 latency, throughput and errors are reported per
+path, with the database connections the app held, sampled from pg_stat_activity:
+
+    python -m benchmarks.load_test --pg-dsn postgresql://localhost/crypto --concurrency 50 --duration 30
+    python -m benchmarks.load_test --url http://localhost:8000 --concurrency 20 --slo-p95-ms 200 --output load.json
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+import psycopg2
+import requests
+from psycopg2.extensions import parse_dsn
+
+from benchmarks.run_benchmarks import environment
+from benchmarks.synthetic import generate_market_payload
+from etl_pipeline.extract_load import upsert_crypto_data
+from etl_pipeline.schema import reset_schema
+from etl_pipeline.transform import transform_market_data
+
+BENCH_SCHEMA = 'web_bench'
+# application_name of the app's connections, so they can be told apart in pg_stat_activity
+APP_NAME = 'crypto-web-load-test'
+DEFAULT_PATHS = ['/', '/api/crypto_data', '/api/crypto_data?limit=100']
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+def seed_database(dsn: str, coins: int):
+    """Recreate the web_bench schema and load `coins` synthetic, transformed coins into its crypto_data."""
+    conn = psycopg2.connect(dsn, options=f'-c search_path={BENCH_SCHEMA}')
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE; CREATE SCHEMA {BENCH_SCHEMA}")
+        conn.commit()
+        reset_schema()
+        upsert_crypto_data(conn, transform_market_data(pd.DataFrame(generate_market_payload(coins))))
+    finally:
+        reset_schema()
+        conn.close()
+
+
+def server_env(dsn: str) -> dict:
+    """Environment pointing the web app's pool at `dsn` and the web_bench schema."""
+    params = parse_dsn(dsn)
+    env = dict(os.environ)
+    env.update({
+        'RDS_HOST': params.get('host', 'localhost'),
+        'RDS_PORT': params.get('port', '5432'),
+        'RDS_DB_NAME': params.get('dbname', ''),
+        'RDS_USERNAME': params.get('user', ''),
+        'RDS_PASSWORD': params.get('password', ''),
+        # Read by libpq for every connection the app opens
+        'PGOPTIONS': f'-c search_path={BENCH_SCHEMA}',
+        'PGAPPNAME': APP_NAME,
+    })
+    return env
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def drain_lines(stream, tail: deque):
+    """Read `stream` to its end, keeping the last decoded lines in `tail`."""
+    for line in stream:
+        tail.append(line.decode(errors='replace'))
+    stream.close()
+
+
+def start_server(mode: str, env: dict, port: int, timeout: float = 30.0) -> subprocess.Popen:
+    """Start the app under gunicorn (production) or the Flask dev server, and wait until it answers."""
+    if mode == 'production':
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'web_app/gunicorn.conf.py', 'web_app.app:app']
+        env = {**env, 'WEB_PORT': str(port), 'WEB_ACCESS_LOG': ''}
+    else:
+        command = [sys.executable, '-m', 'flask', '--app', 'web_app.app', 'run', '--port', str(port)]
+    process = subprocess.Popen(command, cwd=PROJECT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    # Both servers log to stderr per request: drain it all the time, or a full pipe blocks the
+    # server mid-run and the harness measures the stall. Only the tail is kept for errors.
+    tail = deque(maxlen=50)
+    drainer = threading.Thread(target=drain_lines, args=(process.stderr, tail), daemon=True)
+    drainer.start()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            drainer.join(1)
+            raise RuntimeError(f"{mode} server exited: {''.join(tail)[-2000:]}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{mode} server did not answer on port {port} within {timeout}s")
+
+
+class ConnectionSampler:
+    """Samples the app's database connections from pg_stat_activity in a background thread."""
+
+    def __init__(self, dsn: str, application_name: Optional[str] = APP_NAME, interval: float = 0.5):
+        self.dsn = dsn
+        self.application_name = application_name
+        self.interval = interval
+        self.samples = []
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        conn = psycopg2.connect(self.dsn)
+        conn.autocommit = True
+        try:
+            while not self.stopping.is_set():
+                with conn.cursor() as cur:
+                    # Without an application_name, every other connection to the database counts
+                    cur.execute("""
+                        SELECT count(*), count(*) FILTER (WHERE state = 'active')
+                        FROM pg_stat_activity
+                        WHERE datname = current_database() AND pid <> pg_backend_pid()
+                          AND (%s::text IS NULL OR application_name = %s)
+                    """, (self.application_name, self.application_name))
+                    self.samples.append(cur.fetchone())
+                self.stopping.wait(self.interval)
+        finally:
+            conn.close()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopping.set()
+        self.thread.join()
+
+    def report(self) -> dict:
+        if not self.samples:
+            return {'db_connections_max': None, 'db_connections_mean': None, 'db_connections_active_max': None}
+        totals = [total for total, _ in self.samples]
+        return {
+            'db_connections_max': max(totals),
+            'db_connections_mean': round(sum(totals) / len(totals), 1),
+            'db_connections_active_max': max(active for _, active in self.samples),
+        }
+
+
+def run_load(base_url: str, paths: List[str], concurrency: int, duration: Optional[float] = None,
+             total_requests: Optional[int] = None, timeout: float = 10.0):
+    """Issue requests from `concurrency` keep-alive clients until `duration` passes or `total_requests` are sent.
+
+    Returns the `(path, status, seconds)` of every request (status None for connection errors and
+    timeouts) and the wall time of the run.
+    """
+    if duration is None and total_requests is None:
+        raise ValueError("Set a duration or a number of requests")
+    lock = threading.Lock()
+    samples = []
+    issued = [0]
+    deadline = time.perf_counter() + duration if duration is not None else None
+
+    def claim():
+        with lock:
+            if total_requests is not None and issued[0] >= total_requests:
+                return None
+            issued[0] += 1
+            return issued[0]
+
+    def worker(offset: int):
+        session = requests.Session()
+        local = []
+        try:
+            while deadline is None or time.perf_counter() < deadline:
+                number = claim()
+                if number is None:
+                    break
+                path = paths[(number + offset) % len(paths)]
+                start = time.perf_counter()
+                try:
+                    response = session.get(base_url + path, timeout=timeout)
+                    response.content
+                    status = response.status_code
+                except requests.RequestException:
+                    status = None
+                local.append((path, status, time.perf_counter() - start))
+        finally:
+            session.close()
+            with lock:
+                samples.extend(local)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - started
+
+
+def _latency_row(name: str, group: pd.DataFrame, elapsed: float) -> dict:
+    ms = group['seconds'].to_numpy() * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99]) if len(ms) else (np.nan,) * 3
+    errors = int((group['status'].isna() | (group['status'] >= 500)).sum())
+    return {
+        'path': name,
+        'requests': len(group),
+        'errors': errors,
+        'error_rate': round(errors / len(group), 4) if len(group) else None,
+        'requests_per_second': round(len(group) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(float(p50), 2),
+        'p95_ms': round(float(p95), 2),
+        'p99_ms': round(float(p99), 2),
+        'max_ms': round(float(ms.max()), 2) if len(ms) else None,
+    }
+
+
+def summarize(samples, elapsed: float) -> List[dict]:
+    """Latency percentiles, throughput and errors per path, then for all paths together."""
+    frame = pd.DataFrame(samples, columns=['path', 'status', 'seconds'])
+    rows = [_latency_row(path, group, elapsed) for path, group in frame.groupby('path', sort=False)]
+    return rows + [_latency_row('all', frame, elapsed)]
+
+
+def check_slo(summary: List[dict], p95_ms: Optional[float] = None, p99_ms: Optional[float] = None,
+              max_error_rate: Optional[float] = None) -> List[str]:
+    """Descriptions of every SLO the overall row misses."""
+    overall = summary[-1]
+    violations = []
+    if p95_ms is not None and overall['p95_ms'] > p95_ms:
+        violations.append(f"p95 {overall['p95_ms']}ms > {p95_ms}ms")
+    if p99_ms is not None and overall['p99_ms'] > p99_ms:
+        violations.append(f"p99 {overall['p99_ms']}ms > {p99_ms}ms")
+    if max_error_rate is not None and (overall['error_rate'] or 0) > max_error_rate:
+        violations.append(f"error rate {overall['error_rate']} > {max_error_rate}")
+    return violations
+
+
+def print_report(summary: List[dict], connections: dict):
+    print(f"\n{'path':<32} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for row in summary:
+        print(f"{row['path']:<32} {row['requests']:>9,} {row['errors']:>7,} {row['requests_per_second'] or 0:>9,.1f}"
+              f" {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f}")
+    if connections.get('db_connections_max') is not None:
+        print(f"\nDB connections: max {connections['db_connections_max']}, mean {connections['db_connections_mean']},"
+              f" max active {connections['db_connections_active_max']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help="base URL of a running app; otherwise one is started against --pg-dsn")
+    parser.add_argument('--pg-dsn', default=os.getenv('BENCH_PG_DSN'),
+                        help=f"local PostgreSQL DSN; the {BENCH_SCHEMA} schema is dropped and recreated")
+    parser.add_argument('--server', choices=['production', 'development'], default='production',
+                        help="how to start the app: gunicorn with web_app/gunicorn.conf.py, or the Flask dev server")
+    parser.add_argument('--coins', type=int, default=10_000, help="synthetic coins seeded into crypto_data")
+    parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS, help="paths requested in turn")
+    parser.add_argument('--concurrency', type=int, default=20, help="simultaneous keep-alive clients")
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds to run for")
+    parser.add_argument('--requests', type=int, help="stop after this many requests instead of --duration")
+    parser.add_argument('--warmup', type=float, default=2.0, help="seconds of unmeasured load first")
+    parser.add_argument('--slo-p95-ms', type=float, help="fail when overall p95 latency exceeds this")
+    parser.add_argument('--slo-p99-ms', type=float, help="fail when overall p99 latency exceeds this")
+    parser.add_argument('--max-error-rate', type=float, help="fail when the share of errors exceeds this")
+    parser.add_argument('--output', help="write the report to this JSON file")
+    args = parser.parse_args(argv)
+    if not args.url and not args.pg_dsn:
+        parser.error("either --url or --pg-dsn is required")
+
+    process = None
+    base_url = args.url
+    try:
+        if not base_url:
+            print(f"Seeding {args.coins:,} coins into {BENCH_SCHEMA}.crypto_data", flush=True)
+            logging.disable(logging.INFO)
+            seed_database(args.pg_dsn, args.coins)
+            port = free_port()
+            process = start_server(args.server, server_env(args.pg_dsn), port)
+            base_url = f"http://127.0.0.1:{port}"
+        base_url = base_url.rstrip('/')
+
+        if args.warmup:
+            run_load(base_url, args.paths, args.concurrency, duration=args.warmup)
+        print(f"Driving {base_url} with {args.concurrency} clients", flush=True)
+
+        sampler = ConnectionSampler(args.pg_dsn, None if args.url else APP_NAME) if args.pg_dsn else None
+        with sampler or nullcontext():
+            samples, elapsed = run_load(
+                base_url, args.paths, args.concurrency,
+                duration=None if args.requests else args.duration, total_requests=args.requests
+            )
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    summary = summarize(samples, elapsed)
+    connections = sampler.report() if sampler else {}
+    print_report(summary, connections)
+
+    violations = check_slo(summary, args.slo_p95_ms, args.slo_p99_ms, args.max_error_rate)
+    for violation in violations:
+        print(f"SLO MISSED: {violation}")
+
+    if args.output:
+        settings = {
+            'server': 'external' if args.url else args.server,
+            'concurrency': args.concurrency,
+            'coins': None if args.url else args.coins,
+            'seconds': round(elapsed, 3),
+        }
+        with open(args.output, 'w') as f:
+            json.dump({
+                'environment': environment(),
+                'settings': settings,
+                'results': summary,
+                'connections': connections,
+                'slo_violations': violations,
+            }, f, indent=2)
+        print(f"\nReport written to {args.output}")
+    return 1 if violations else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
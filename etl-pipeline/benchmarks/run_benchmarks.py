@@ -0,0 +1,258 @@
+"""Extract/transform/load benchmark suite over synthetic CoinGecko /coins/markets data.
+
+Runs the HTTP extraction against a local stub, transform_market_data, the binary COPY stream built by
+load_data_task (next to the former StringIO CSV buffer), dataframe_to_json_serializable, the capped
+artifact preview and, with --pg-dsn (or BENCH_PG_DSN), both COPY paths and the crypto_data upsert
+against a local PostgreSQL. Throughput and peak traced memory are written
+to a JSON file that later runs can be compared against:
+
+    python -m benchmarks.run_benchmarks --sizes 10 10000 100000 --output benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --sizes 10 10000 100000 --compare benchmarks/baseline.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from io import StringIO
+
+import pandas as pd
+import psycopg2
+
+from benchmarks.http_stub import StubServer
+from benchmarks.synthetic import generate_market_payload
+from etl_pipeline.artifacts import DEFAULT_MAX_BYTES, DEFAULT_MAX_ROWS, bounded_records, summary_records
+from etl_pipeline.coingecko import MAX_PER_PAGE, CoinGeckoClient
+from etl_pipeline.copy_writer import FLOAT4, TEXT, TIMESTAMP, binary_copy_chunks, copy_dataframe
+from etl_pipeline.extract_load import dataframe_to_json_serializable, upsert_crypto_data
+from etl_pipeline.schema import reset_schema
+from etl_pipeline.transform import transform_market_data
+
+BENCH_SCHEMA = 'etl_bench'
+
+CRYPTO_DATA_COLUMNS = [
+    'id', 'symbol', 'name', 'current_price', 'market_cap', 'total_volume', 'high_24h', 'low_24h',
+    'price_change_24h', 'price_change_percentage_24h', 'market_cap_change_24h',
+    'market_cap_change_percentage_24h', 'circulating_supply', 'total_supply', 'max_supply', 'ath',
+    'ath_change_percentage', 'atl', 'atl_change_percentage', 'last_updated', 'ath_date', 'atl_date',
+]
+
+
+def measure(func, repeat: int = 1, memory: bool = True):
+    """Best wall time over `repeat` runs of `func(setup())`, plus peak traced memory of one more run."""
+    setup, run = func
+    seconds = float('inf')
+    for _ in range(repeat):
+        arg = setup()
+        start = time.perf_counter()
+        run(arg)
+        seconds = min(seconds, time.perf_counter() - start)
+
+    peak = None
+    if memory:
+        arg = setup()
+        tracemalloc.start()
+        run(arg)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return seconds, peak
+
+
+def artifact_preview(df):
+    """What create_dataframe_artifact encodes for a frame: a capped row sample plus column statistics."""
+    bounded_records(df, DEFAULT_MAX_ROWS, DEFAULT_MAX_BYTES)
+    summary_records(df)
+
+
+def crypto_data_frame(transformed):
+    """The crypto_data columns of a transformed frame and their pg_type OIDs, as load_data_task sends them."""
+    frame = transformed[[col for col in transformed.columns if col in CRYPTO_DATA_COLUMNS]]
+    types = [
+        TIMESTAMP if pd.api.types.is_datetime64_any_dtype(frame[col]) else
+        FLOAT4 if pd.api.types.is_numeric_dtype(frame[col]) else TEXT
+        for col in frame.columns
+    ]
+    return frame, types
+
+
+def legacy_copy_buffer(data):
+    """The whole-frame CSV text the loader used to hand to copy_from before the binary COPY stream."""
+    buffer = StringIO()
+    data.to_csv(buffer, index=False, header=False, na_rep='NULL')
+    buffer.seek(0)
+    return buffer
+
+
+def http_benchmark(payload):
+    """Fetch the payload page by page from a local stub through CoinGeckoClient."""
+    pages = [json.dumps(payload[i:i + MAX_PER_PAGE]).encode() for i in range(0, len(payload), MAX_PER_PAGE)] or [b'[]']
+
+    def handler(path, params, headers):
+        return 200, pages[int(params['page']) - 1], {}
+
+    stub = StubServer(handler).__enter__()
+    client = CoinGeckoClient(base_url=stub.url, rate_limit_per_minute=1e9, max_concurrency=8, api_key='bench')
+
+    def run(_):
+        pd.DataFrame(client.fetch_markets(len(pages), per_page=MAX_PER_PAGE))
+
+    return (lambda: None, run), lambda: (client.close(), stub.__exit__())
+
+
+def pg_benchmarks(dsn, transformed):
+    conn = psycopg2.connect(dsn, options=f'-c search_path={BENCH_SCHEMA}')
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE; CREATE SCHEMA {BENCH_SCHEMA}")
+        conn.commit()
+    except psycopg2.Error:
+        conn.close()
+        raise
+
+    def truncate():
+        with conn.cursor() as cur:
+            cur.execute("DROP TABLE IF EXISTS crypto_data")
+        conn.commit()
+        reset_schema()
+        return transformed
+
+    frame, _ = crypto_data_frame(transformed)
+
+    def empty_target():
+        with conn.cursor() as cur:
+            cur.execute("DROP TABLE IF EXISTS copy_target; CREATE TABLE copy_target (LIKE crypto_data)")
+        conn.commit()
+        return frame
+
+    def copy_csv(data):
+        with conn.cursor() as cur:
+            cur.copy_from(legacy_copy_buffer(data), 'copy_target', sep=',', columns=data.columns, null='NULL')
+        conn.commit()
+
+    def copy_binary(data):
+        with conn.cursor() as cur:
+            copy_dataframe(cur, data, 'copy_target')
+        conn.commit()
+
+    insert = (truncate, lambda data: upsert_crypto_data(conn, data))
+    # Second pass over an already loaded table: every row conflicts and is updated
+    update = (lambda: transformed, lambda data: upsert_crypto_data(conn, data))
+    # COPY alone into a plain table, through the former CSV text path and the binary stream
+    copies = {'copy_load_csv': (empty_target, copy_csv), 'copy_load_binary': (empty_target, copy_binary)}
+    return {'load_insert': insert, 'load_update': update, **copies}, conn
+
+
+def run_suite(sizes, repeat, pg_dsn=None, memory=True):
+    results = []
+    for size in sizes:
+        payload = generate_market_payload(size)
+        raw = pd.DataFrame(payload)
+        transformed = transform_market_data(raw.copy())
+        frame, types = crypto_data_frame(transformed)
+        benchmarks = {
+            'transform': (lambda: raw.copy(), transform_market_data),
+            'copy_buffer': (lambda: frame, lambda data: sum(map(len, binary_copy_chunks(data, types)))),
+            'copy_buffer_csv': (lambda: frame, legacy_copy_buffer),
+            'artifact_json': (lambda: transformed, dataframe_to_json_serializable),
+            'artifact_preview': (lambda: transformed, artifact_preview),
+        }
+        http, http_cleanup = http_benchmark(payload)
+        benchmarks = {'http_extract': http, **benchmarks}
+        conn = None
+        try:
+            # Inside the try, so a failed connect still shuts the stub server down
+            if pg_dsn:
+                pg, conn = pg_benchmarks(pg_dsn, transformed)
+                benchmarks.update(pg)
+
+            for name, func in benchmarks.items():
+                seconds, peak = measure(func, repeat=repeat if size <= 100_000 else 1, memory=memory)
+                result = {
+                    'benchmark': name,
+                    'rows': size,
+                    'seconds': round(seconds, 6),
+                    'rows_per_second': round(size / seconds, 1) if seconds else None,
+                    'peak_memory_bytes': peak,
+                }
+                results.append(result)
+                print(f"{name:>16} {size:>10,} rows {seconds:>10.4f}s {result['rows_per_second'] or 0:>14,.0f} rows/s"
+                      + (f" {peak / 2 ** 20:>9.1f} MiB" if peak is not None else ''), flush=True)
+        finally:
+            http_cleanup()
+            if conn is not None:
+                conn.close()
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'commit': commit or None,
+        'recorded_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def compare(results, baseline_path, threshold):
+    """Print throughput and memory relative to a baseline; returns the regressions beyond `threshold`."""
+    with open(baseline_path) as f:
+        baseline = {(r['benchmark'], r['rows']): r for r in json.load(f)['results']}
+
+    regressions = []
+    print(f"\n{'benchmark':>16} {'rows':>10} {'throughput':>11} {'memory':>8}")
+    for result in results:
+        base = baseline.get((result['benchmark'], result['rows']))
+        if not base or not base['rows_per_second'] or not result['rows_per_second']:
+            continue
+        speed = result['rows_per_second'] / base['rows_per_second']
+        memory = (result['peak_memory_bytes'] / base['peak_memory_bytes']
+                  if result['peak_memory_bytes'] and base['peak_memory_bytes'] else None)
+        flag = ''
+        if speed < 1 - threshold or (memory is not None and memory > 1 + threshold):
+            regressions.append(result)
+            flag = '  REGRESSION'
+        memory_text = f"{memory:>7.2f}x" if memory is not None else f"{'-':>8}"
+        print(f"{result['benchmark']:>16} {result['rows']:>10,} {speed:>10.2f}x {memory_text}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 10_000, 100_000],
+                        help="coin counts to generate (10 to 1,000,000)")
+    parser.add_argument('--repeat', type=int, default=3, help="timing runs per benchmark (best is kept)")
+    parser.add_argument('--pg-dsn', default=os.getenv('BENCH_PG_DSN'),
+                        help=f"local PostgreSQL DSN; the {BENCH_SCHEMA} schema is dropped and recreated")
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc pass")
+    parser.add_argument('--output', help="write results to this JSON file")
+    parser.add_argument('--compare', help="baseline JSON file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="relative slowdown or memory growth reported as a regression")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    results = run_suite(args.sizes, args.repeat, args.pg_dsn, memory=not args.no_memory)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+CURRENCIES = np.array(['usd', 'btc', 'eth'])
+
+
+def _iso(timestamps: pd.DatetimeIndex) -> np.ndarray:
+    return timestamps.strftime('%Y-%m-%dT%H:%M:%S.%f').str[:-3].values + 'Z'
+
+
+def generate_market_frame(n: int, seed: int = 0, null_rate: float = 0.05) -> pd.DataFrame:
+    """Synthetic raw /coins/markets frame with `n` coins, shaped like `pd.DataFrame(response.json())`.
+
+    Numeric columns are sprinkled with nulls at `null_rate`, timestamps are ISO strings and
+    `roi` holds dicts for roughly a tenth of the coins and None elsewhere.
+    """
+    rng = np.random.default_rng(seed)
+    ranks = np.arange(1, n + 1)
+    market_cap = 1e12 / ranks ** 1.1 * rng.uniform(0.8, 1.2, n)
+    price = np.exp(rng.uniform(-8, 11, n))
+    change_pct = rng.normal(0, 4, n)
+    total_supply = market_cap / price * rng.uniform(1.0, 2.0, n)
+    now = pd.Timestamp('2024-06-28T04:19:50Z')
+
+    frame = pd.DataFrame({
+        'id': [f'coin-{i}' for i in range(n)],
+        'symbol': [f'c{i % 5000}' for i in range(n)],
+        'name': [f'Coin {i}' for i in range(n)],
+        'image': 'https://assets.coingecko.com/coins/images/1/large/coin.png',
+        'current_price': price,
+        'market_cap': market_cap,
+        'market_cap_rank': ranks.astype(float),
+        'fully_diluted_valuation': market_cap * rng.uniform(1.0, 1.5, n),
+        'total_volume': market_cap * rng.uniform(0.001, 0.2, n),
+        'high_24h': price * rng.uniform(1.0, 1.1, n),
+        'low_24h': price * rng.uniform(0.9, 1.0, n),
+        'price_change_24h': price * change_pct / 100,
+        'price_change_percentage_24h': change_pct,
+        'market_cap_change_24h': market_cap * change_pct / 100,
+        'market_cap_change_percentage_24h': change_pct,
+        'circulating_supply': total_supply * rng.uniform(0.3, 1.0, n),
+        'total_supply': total_supply,
+        'max_supply': np.where(rng.random(n) < 0.3, total_supply * 1.5, np.nan),
+        'ath': price * rng.uniform(1.0, 20.0, n),
+        'ath_change_percentage': rng.uniform(-99, 0, n),
+        'ath_date': _iso(now - pd.to_timedelta(rng.integers(0, 2000, n), unit='D')),
+        'atl': price * rng.uniform(0.001, 1.0, n),
+        'atl_change_percentage': rng.uniform(0, 1e5, n),
+        'atl_date': _iso(now - pd.to_timedelta(rng.integers(0, 4000, n), unit='D')),
+        'last_updated': _iso(now - pd.to_timedelta(rng.integers(0, 600, n), unit='s')),
+    })
+
+    numeric = frame.select_dtypes('number').columns.drop('market_cap_rank')
+    for col in numeric:
+        frame.loc[rng.random(n) < null_rate, col] = np.nan
+
+    has_roi = rng.random(n) < 0.1
+    roi_times = rng.uniform(0, 500, n)
+    roi_currency = rng.choice(CURRENCIES, n)
+    frame['roi'] = [
+        {'times': t, 'currency': c, 'percentage': t * 100} if r else None
+        for r, t, c in zip(has_roi, roi_times, roi_currency)
+    ]
+    return frame
+
+
+def generate_market_payload(n: int, seed: int = 0, null_rate: float = 0.05) -> list:
+    """Synthetic /coins/markets JSON payload (list of dicts) with `n` coins."""
+    frame = generate_market_frame(n, seed, null_rate).astype(object)
+    return frame.where(frame.notna(), None).to_dict(orient='records')
@@ -0,0 +1,95 @@
+import pandas as pd
+from prefect.artifacts import create_table_artifact
+from typing import List, Optional
+import json
+import logging
+import os
+from etl_pipeline.dtypes import frame_bytes, memory_report
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Artifacts are previews: cap what a task sends to the Prefect API whatever the extraction size
+DEFAULT_MAX_ROWS = 50
+DEFAULT_MAX_BYTES = 256 * 1024
+
+
+def _encode(df: pd.DataFrame) -> str:
+    # One vectorized pass: NaN/NA become null and datetimes ISO strings inside pandas' encoder
+    return df.to_json(orient='records', date_format='iso', double_precision=15, default_handler=str)
+
+
+def dataframe_to_json_serializable(df):
+    """Convert a DataFrame to a JSON-serializable format"""
+    return json.loads(_encode(df))
+
+
+def sample_rows(df: pd.DataFrame, max_rows: int, sample: str = 'head') -> pd.DataFrame:
+    """At most `max_rows` rows: the first ones, or an evenly spaced sample across the frame."""
+    if len(df) <= max_rows:
+        return df
+    if sample == 'spread':
+        positions = (pd.RangeIndex(max_rows) * len(df)) // max_rows
+        return df.iloc[positions]
+    return df.head(max_rows)
+
+
+def summary_records(df: pd.DataFrame) -> List[dict]:
+    """Per-column count, nulls and numeric/datetime min, max and mean, standing in for the full table."""
+    counts = df.count()
+    numeric = df.select_dtypes(include='number')
+    stats = numeric.agg(['min', 'max', 'mean']).T if not numeric.empty else pd.DataFrame()
+    datetimes = df.select_dtypes(include=['datetime', 'datetimetz'])
+
+    summary = pd.DataFrame({
+        'column': df.columns,
+        'dtype': df.dtypes.astype(str).values,
+        'non_null': counts.values,
+        'nulls': len(df) - counts.values,
+    }, index=df.columns)
+    for stat in ('min', 'max', 'mean'):
+        summary[stat] = (stats[stat] if stat in stats else pd.Series(dtype=float)).astype(object)
+    for column in datetimes.columns:
+        summary.at[column, 'min'] = datetimes[column].min()
+        summary.at[column, 'max'] = datetimes[column].max()
+    return dataframe_to_json_serializable(summary)
+
+
+def bounded_records(df: pd.DataFrame, max_rows: int, max_bytes: int, sample: str = 'head') -> List[dict]:
+    """Encode a row sample, halving it until the encoded JSON fits in `max_bytes`."""
+    rows = sample_rows(df, max_rows, sample)
+    encoded = _encode(rows)
+    while len(encoded) > max_bytes and len(rows) > 1:
+        rows = sample_rows(rows, len(rows) // 2, sample)
+        encoded = _encode(rows)
+    return json.loads(encoded)
+
+
+def create_dataframe_artifact(key: str, df: pd.DataFrame, description: str,
+                              max_rows: Optional[int] = None, max_bytes: Optional[int] = None,
+                              sample: str = 'head', memory: bool = False) -> int:
+    """Create a table artifact previewing `df` within a row and byte budget; returns the rows shown.
+
+    Budgets default to ARTIFACT_MAX_ROWS and ARTIFACT_MAX_BYTES. When rows are left out, a
+    `{key}-summary` artifact with per-column statistics of the whole frame is created as well.
+    With `memory`, a `{key}-memory` artifact lists each column's dtype and memory.
+    """
+    max_rows = max_rows if max_rows is not None else int(os.getenv('ARTIFACT_MAX_ROWS', DEFAULT_MAX_ROWS))
+    max_bytes = max_bytes if max_bytes is not None else int(os.getenv('ARTIFACT_MAX_BYTES', DEFAULT_MAX_BYTES))
+
+    records = bounded_records(df, max_rows, max_bytes, sample)
+    if len(records) < len(df):
+        description = f"{description} ({len(records)} of {len(df)} rows)"
+        create_table_artifact(
+            key=f"{key}-summary",
+            table=summary_records(df),
+            description=f"Column statistics for all {len(df)} rows of {key}"
+        )
+    if memory:
+        create_table_artifact(
+            key=f"{key}-memory",
+            table=memory_report(df),
+            description=f"Dtype and memory per column of {key}, {frame_bytes(df):,} bytes in all"
+        )
+    create_table_artifact(key=key, table=records, description=description)
+    return len(records)
@@ -0,0 +1,350 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+COINGECKO_API_URL = "https://api.coingecko.com/api/v3"
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+MAX_PER_PAGE = 250
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` acquisitions per `per` seconds."""
+
+    def __init__(self, rate: float, per: float = 60.0, capacity: Optional[float] = None):
+        if rate <= 0 or per <= 0:
+            raise ValueError("rate and per must be positive")
+        self.fill_rate = rate / per
+        self.capacity = capacity if capacity is not None else 1.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.fill_rate)
+        self.updated_at = now
+
+    def acquire(self):
+        """Block until a token is available, then consume it."""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.fill_rate
+            time.sleep(wait)
+
+
+class ChangeTracker:
+    """Remembers the last response to each request to tell whether upstream data changed.
+
+    Requests carry If-None-Match / If-Modified-Since from the previous response's ETag and
+    Last-Modified, and 200 bodies are hashed, since CoinGecko often serves identical data
+    without validators. A new response is only staged by `record`: the caller commits it once
+    the data it carried is loaded, or rolls it back so the next poll reloads the same snapshot.
+    Committed validators, body hashes and the poll counts behind `skip_rate` are kept in
+    `state_path` (CG_CHANGE_STATE_FILE) when set, so runs in fresh processes compare against
+    the previous run; parsed bodies are only kept in memory.
+    """
+
+    def __init__(self, state_path: Optional[str] = None):
+        self.state_path = state_path
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.staged = {}
+        self.bodies = {}
+        self.polls = 0
+        self.skipped = 0
+        if state_path and os.path.exists(state_path):
+            try:
+                with open(state_path) as f:
+                    state = json.load(f)
+                self.entries = state.get('entries', {})
+                self.polls = state.get('polls', 0)
+                self.skipped = state.get('skipped', 0)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable change state {state_path}: {str(e)}")
+
+    @staticmethod
+    def request_key(url: str, params: Optional[Dict[str, Any]] = None) -> str:
+        return url + '?' + '&'.join(f"{k}={v}" for k, v in sorted((params or {}).items()))
+
+    def _latest(self, key: str) -> Optional[Dict[str, Any]]:
+        # A response still being loaded counts as seen, so a poll repeating it is not loaded twice
+        return self.staged.get(key) or self.entries.get(key)
+
+    def conditional_headers(self, key: str) -> Dict[str, str]:
+        """Validator headers for `key`; empty unless this process still holds the body they refer to."""
+        with self.lock:
+            entry = self._latest(key)
+            if entry is None or key not in self.bodies:
+                return {}
+            headers = {}
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+            return headers
+
+    def record(self, key: str, response: requests.Response, body: Any = None) -> Tuple[Any, bool]:
+        """The parsed body of `response` and whether it differs from the last one seen for `key`.
+
+        `body` is the already parsed JSON of a 200, if the caller has it. A changed response is
+        staged until `commit` or `rollback`.
+        """
+        with self.lock:
+            if response.status_code == 304:
+                return self.bodies[key], False
+            digest = sha256(response.content).hexdigest()
+            changed = (self._latest(key) or {}).get('digest') != digest
+            if changed:
+                self.staged[key] = {
+                    'digest': digest,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                }
+        body = response.json() if body is None else body
+        with self.lock:
+            self.bodies[key] = body
+        return body, changed
+
+    def pending(self) -> Dict[str, Dict[str, Any]]:
+        """The responses staged so far, to hand to `commit` or `rollback` once their data is handled."""
+        with self.lock:
+            return dict(self.staged)
+
+    def commit(self, staged: Optional[Dict[str, Dict[str, Any]]] = None):
+        """Mark `staged` (default: everything staged) as loaded and persist it."""
+        with self.lock:
+            staged = dict(self.staged) if staged is None else staged
+            for key, entry in staged.items():
+                self.entries[key] = entry
+                # A later poll may have staged a newer response for the key meanwhile
+                if self.staged.get(key) is entry:
+                    del self.staged[key]
+        self._save()
+
+    def rollback(self, staged: Optional[Dict[str, Dict[str, Any]]] = None):
+        """Forget `staged` (default: everything staged), so the next poll of those requests counts as changed."""
+        with self.lock:
+            staged = dict(self.staged) if staged is None else staged
+            for key, entry in staged.items():
+                if self.staged.get(key) is entry:
+                    del self.staged[key]
+                    # Without the body no conditional request is sent, and the 200 is compared
+                    # against the last committed digest
+                    self.bodies.pop(key, None)
+
+    def record_poll(self, changed: bool):
+        """Count one poll of the whole payload, skipped when nothing changed, and persist the state."""
+        with self.lock:
+            self.polls += 1
+            self.skipped += 0 if changed else 1
+        self._save()
+
+    def _save(self):
+        with self.lock:
+            state = {'entries': dict(self.entries), 'polls': self.polls, 'skipped': self.skipped}
+        if self.state_path:
+            try:
+                tmp = f"{self.state_path}.tmp"
+                with open(tmp, 'w') as f:
+                    json.dump(state, f)
+                os.replace(tmp, self.state_path)
+            except OSError as e:
+                logger.warning(f"Failed to save change state to {self.state_path}: {str(e)}")
+
+    @property
+    def skip_rate(self) -> Optional[float]:
+        with self.lock:
+            return round(self.skipped / self.polls, 4) if self.polls else None
+
+
+_change_tracker = {'value': None}
+
+
+def get_change_tracker() -> ChangeTracker:
+    """Process-wide ChangeTracker, so successive clients and flow runs compare against each other."""
+    if _change_tracker['value'] is None:
+        _change_tracker['value'] = ChangeTracker(os.getenv('CG_CHANGE_STATE_FILE'))
+    return _change_tracker['value']
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def shared_rate_limiter(rate_limit_per_minute: float, capacity: float) -> TokenBucket:
+    """Process-wide TokenBucket for `rate_limit_per_minute`, so every client in the process draws on one budget.
+
+    The markets extraction and the fan-out each build their own client; with a bucket apiece they
+    could together send twice the configured rate. `capacity` applies when the bucket is created.
+    """
+    with _rate_limiters_lock:
+        if rate_limit_per_minute not in _rate_limiters:
+            _rate_limiters[rate_limit_per_minute] = TokenBucket(rate_limit_per_minute, per=60.0, capacity=capacity)
+        return _rate_limiters[rate_limit_per_minute]
+
+
+def new_transfer() -> Dict[str, Any]:
+    return {'responses': 0, 'bytes': 0, 'parse_seconds': 0.0, 'parse_cpu_seconds': 0.0}
+
+
+class CoinGeckoClient:
+    """CoinGecko API client sharing one keep-alive session across worker threads.
+
+    Requests are paced by `rate_limiter`, by default the process-wide bucket for the configured
+    rate (CG_RATE_LIMIT_PER_MIN), which other clients in the process share.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        rate_limit_per_minute: Optional[float] = None,
+        max_retries: int = 5,
+        backoff_factor: float = 1.0,
+        timeout: float = 30.0,
+        change_tracker: Optional[ChangeTracker] = None,
+        rate_limiter: Optional[TokenBucket] = None,
+    ):
+        self.base_url = (base_url or os.getenv('CG_API_URL', COINGECKO_API_URL)).rstrip('/')
+        self.max_concurrency = max_concurrency or int(os.getenv('CG_MAX_CONCURRENCY', 4))
+        rate_limit_per_minute = rate_limit_per_minute or float(os.getenv('CG_RATE_LIMIT_PER_MIN', 30))
+        self.rate_limiter = rate_limiter or shared_rate_limiter(rate_limit_per_minute, self.max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.changes = change_tracker or get_change_tracker()
+        self.transfer_lock = threading.Lock()
+        self.transfer = new_transfer()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'accept': 'application/json'})
+        api_key = api_key or os.getenv('CG_API_KEY')
+        if api_key:
+            self.session.headers['x-cg-api-key'] = api_key
+
+    def _backoff_delay(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        """Seconds to wait before the next attempt, honouring Retry-After when present."""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                return float(retry_after)
+        return min(60.0, self.backoff_factor * 2 ** attempt) + random.uniform(0, self.backoff_factor)
+
+    def get(self, path: str, params: Optional[Dict[str, Any]] = None,
+            headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        """GET `path`, retrying connection errors, 429 and 5xx responses with backoff."""
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff_delay(attempt)
+                logger.warning(f"Request to {url} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                response.raise_for_status()
+                return response
+
+            delay = self._backoff_delay(attempt, response)
+            logger.warning(f"Received {response.status_code} from {url}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    def get_if_changed(self, path: str, params: Optional[Dict[str, Any]] = None) -> Tuple[Any, bool]:
+        """GET `path` as a conditional request; returns the parsed body and whether it changed."""
+        key = self.changes.request_key(f"{self.base_url}/{path.lstrip('/')}", params)
+        response = self.get(path, params=params, headers=self.changes.conditional_headers(key))
+        wall, cpu = time.perf_counter(), time.thread_time()
+        body = response.json() if response.status_code != 304 else None
+        wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+        with self.transfer_lock:
+            self.transfer['responses'] += 1
+            self.transfer['bytes'] += len(response.content)
+            self.transfer['parse_seconds'] += wall
+            self.transfer['parse_cpu_seconds'] += cpu
+        return self.changes.record(key, response, body)
+
+    def drain_transfer(self) -> Dict[str, Any]:
+        """Responses, body bytes and JSON parse time since the last drain, summed over worker threads."""
+        with self.transfer_lock:
+            transfer, self.transfer = self.transfer, new_transfer()
+        return transfer
+
+    def fetch_markets_page_if_changed(self, page: int, per_page: int = MAX_PER_PAGE,
+                                      vs_currency: str = 'usd') -> Tuple[List[Dict[str, Any]], bool]:
+        """Fetch a single page of /coins/markets, and whether it changed since it was last fetched."""
+        params = {
+            "vs_currency": vs_currency,
+            "order": "market_cap_desc",
+            "per_page": per_page,
+            "page": page,
+            "sparkline": "false"
+        }
+        return self.get_if_changed('/coins/markets', params=params)
+
+    def fetch_markets_page(self, page: int, per_page: int = MAX_PER_PAGE, vs_currency: str = 'usd') -> List[Dict[str, Any]]:
+        """Fetch a single page of /coins/markets."""
+        return self.fetch_markets_page_if_changed(page, per_page, vs_currency)[0]
+
+    def fetch_markets_if_changed(self, pages: int, per_page: int = MAX_PER_PAGE,
+                                 vs_currency: str = 'usd') -> Tuple[List[Dict[str, Any]], bool]:
+        """Fetch pages 1..`pages` of /coins/markets concurrently and merge them in page order.
+
+        Also returns whether any page changed since the previous fetch. Pages that still fail
+        after retries are logged and skipped. Coins that move across a page boundary between
+        requests are deduplicated, keeping the first occurrence.
+        """
+        per_page = min(per_page, MAX_PER_PAGE)
+
+        def fetch(page):
+            try:
+                return self.fetch_markets_page_if_changed(page, per_page, vs_currency)
+            except requests.RequestException as e:
+                logger.error(f"Failed to fetch markets page {page}: {str(e)}")
+                return [], False
+
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, pages)) as executor:
+            results = list(executor.map(fetch, range(1, pages + 1)))
+
+        records, seen = [], set()
+        for page_records, _ in results:
+            for record in page_records:
+                if record.get('id') not in seen:
+                    seen.add(record.get('id'))
+                    records.append(record)
+        changed = any(page_changed for _, page_changed in results)
+        if records:
+            self.changes.record_poll(changed)
+        logger.info(f"Fetched {len(records)} coins across {pages} pages ({'changed' if changed else 'unchanged'})")
+        return records, changed
+
+    def fetch_markets(self, pages: int, per_page: int = MAX_PER_PAGE, vs_currency: str = 'usd') -> List[Dict[str, Any]]:
+        """Records of fetch_markets_if_changed, whether or not they changed."""
+        return self.fetch_markets_if_changed(pages, per_page, vs_currency)[0]
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+from psycopg2 import sql
+from io import RawIOBase
+from itertools import chain, repeat
+from typing import Dict, Iterable, Iterator, List, Optional
+import logging
+import os
+import struct
+from etl_pipeline.dtypes import to_wire_dtypes
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_ROWS = 2_000
+
+BINARY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+BINARY_TRAILER = struct.pack('>h', -1)
+NULL_FIELD = struct.pack('>i', -1)
+
+# PostgreSQL type OIDs (pg_type.oid) of the column types the binary writer can encode
+BOOL, INT8, INT2, INT4, TEXT, FLOAT4, FLOAT8, VARCHAR, TIMESTAMP, TIMESTAMPTZ = 16, 20, 21, 23, 25, 700, 701, 1043, 1114, 1184
+FIXED_WIDTH = {BOOL: '?', INT2: '>i2', INT4: '>i4', INT8: '>i8', FLOAT4: '>f4', FLOAT8: '>f8', TIMESTAMP: '>i8', TIMESTAMPTZ: '>i8'}
+TEXT_TYPES = {TEXT, VARCHAR}
+
+# Binary timestamps count microseconds from 2000-01-01 UTC
+PG_EPOCH_NS = pd.Timestamp('2000-01-01').value
+
+
+class IteratorReader(RawIOBase):
+    """Read-only file object over an iterator of byte chunks, so COPY pulls data as it is produced."""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self.chunks = iter(chunks)
+        # The current chunk and how far into it COPY has read; slicing a memoryview copies nothing
+        self.pending = memoryview(b'')
+        self.offset = 0
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self.offset >= len(self.pending):
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return 0
+            self.pending, self.offset = memoryview(chunk), 0
+        size = min(len(buffer), len(self.pending) - self.offset)
+        buffer[:size] = self.pending[self.offset:self.offset + size]
+        self.offset += size
+        self.bytes_read += size
+        return size
+
+
+def _chunks(data: pd.DataFrame, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    for start in range(0, len(data), chunk_rows):
+        yield data.iloc[start:start + chunk_rows]
+
+
+def _timestamp_micros(series: pd.Series):
+    """Microseconds since 2000-01-01 UTC (tz-aware values are converted to UTC), and the NaT mask."""
+    values = pd.to_datetime(series, utc=True).dt.tz_localize(None)
+    mask = values.isna().to_numpy()
+    micros = (values.to_numpy(dtype='datetime64[ns]').view('i8') - PG_EPOCH_NS) // 1000
+    return micros, mask
+
+
+def _fixed_width_fields(series: pd.Series, type_code: int) -> List[bytes]:
+    """Length-prefixed binary fields of one column, built with numpy and sliced per row."""
+    if type_code in (TIMESTAMP, TIMESTAMPTZ):
+        values, mask = _timestamp_micros(series)
+    else:
+        mask = series.isna().to_numpy()
+        if type_code in (FLOAT4, FLOAT8):
+            values = series.to_numpy(dtype='float64', na_value=np.nan)
+        elif type_code == BOOL:
+            values = np.where(mask, False, series.to_numpy(dtype=object)).astype(bool)
+        elif pd.api.types.is_integer_dtype(series.dtype):
+            # Packed exactly: through float64, INT8 values beyond 2**53 would silently change
+            values = series.to_numpy(dtype='int64', na_value=0)
+        elif series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) == 'integer':
+            values = np.where(mask, 0, series.to_numpy(dtype=object)).astype('int64')
+        else:
+            # Float columns (NaN for NULL) bound for an integer column are rounded
+            values = np.where(mask, 0, series.to_numpy(dtype=object)).astype('float64').round().astype('int64')
+
+    value_type = np.dtype(FIXED_WIDTH[type_code])
+    fields = np.empty(len(series), dtype=[('length', '>i4'), ('value', value_type)])
+    fields['length'] = value_type.itemsize
+    fields['value'] = values
+    raw = fields.tobytes()
+    width = fields.dtype.itemsize
+    cells = [raw[i:i + width] for i in range(0, len(raw), width)]
+    for i in np.flatnonzero(mask):
+        cells[i] = NULL_FIELD
+    return cells
+
+
+def _text_fields(series: pd.Series) -> List[bytes]:
+    pack = struct.Struct('>i').pack
+    cells = []
+    for value in series.to_numpy(dtype=object):
+        if value is None or (isinstance(value, float) and np.isnan(value)) or value is pd.NA or value is pd.NaT:
+            cells.append(NULL_FIELD)
+        else:
+            encoded = str(value).encode('utf-8')
+            cells.append(pack(len(encoded)) + encoded)
+    return cells
+
+
+def binary_copy_chunks(data: pd.DataFrame, type_codes: List[int], chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[bytes]:
+    """PostgreSQL binary COPY stream of `data`, one chunk of rows at a time.
+
+    `type_codes` are the pg_type OIDs of the target columns, in frame column order.
+    """
+    field_count = struct.pack('>h', len(data.columns))
+    yield BINARY_HEADER
+    for chunk in _chunks(data, chunk_rows):
+        columns = [
+            _text_fields(chunk[column]) if type_code in TEXT_TYPES else _fixed_width_fields(chunk[column], type_code)
+            for column, type_code in zip(chunk.columns, type_codes)
+        ]
+        yield b''.join(chain.from_iterable(zip(repeat(field_count, len(chunk)), *columns)))
+    yield BINARY_TRAILER
+
+
+def csv_copy_chunks(data: pd.DataFrame, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[bytes]:
+    """Quoted CSV for `COPY ... WITH (FORMAT csv)`, one chunk of rows at a time; NaN/NaT become NULL."""
+    for chunk in _chunks(data, chunk_rows):
+        yield to_wire_dtypes(chunk).to_csv(index=False, header=False, date_format='%Y-%m-%d %H:%M:%S.%f').encode('utf-8')
+
+
+def supports_binary(type_codes: Iterable[int]) -> bool:
+    return all(code in FIXED_WIDTH or code in TEXT_TYPES for code in type_codes)
+
+
+def column_types(cur, table: str, columns: List[str]) -> Dict[str, int]:
+    """pg_type OIDs of `columns` in `table`, read from a zero-row SELECT."""
+    cur.execute(sql.SQL("SELECT {columns} FROM {table} LIMIT 0").format(
+        columns=sql.SQL(', ').join(map(sql.Identifier, columns)),
+        table=sql.Identifier(table)
+    ))
+    return {desc[0]: desc[1] for desc in cur.description}
+
+
+def copy_dataframe(cur, data: pd.DataFrame, table: str, types: Optional[Dict[str, int]] = None,
+                   copy_format: Optional[str] = None, chunk_rows: Optional[int] = None) -> int:
+    """Stream `data` into `table` with COPY, without materializing the whole payload; returns bytes sent.
+
+    Binary COPY is used when every column type has a binary encoder, otherwise quoted CSV.
+    COPY_FORMAT=csv forces CSV and COPY_CHUNK_ROWS sets the rows encoded per chunk.
+    """
+    copy_format = (copy_format or os.getenv('COPY_FORMAT', 'binary')).lower()
+    chunk_rows = chunk_rows or int(os.getenv('COPY_CHUNK_ROWS', DEFAULT_CHUNK_ROWS))
+    columns = list(data.columns)
+    if copy_format == 'binary':
+        types = types or column_types(cur, table, columns)
+        type_codes = [types[column] for column in columns]
+        if not supports_binary(type_codes):
+            logger.info(f"No binary encoder for some columns of {table}; using CSV COPY")
+            copy_format = 'csv'
+
+    if copy_format == 'binary':
+        reader = IteratorReader(binary_copy_chunks(data, type_codes, chunk_rows))
+        options = sql.SQL("FORMAT binary")
+    else:
+        reader = IteratorReader(csv_copy_chunks(data, chunk_rows))
+        options = sql.SQL("FORMAT csv")
+
+    cur.copy_expert(sql.SQL("COPY {table} ({columns}) FROM STDIN WITH ({options})").format(
+        table=sql.Identifier(table),
+        columns=sql.SQL(', ').join(map(sql.Identifier, columns)),
+        options=options
+    ).as_string(cur), reader)
+    return reader.bytes_read
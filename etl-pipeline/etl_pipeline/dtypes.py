@@ -0,0 +1,121 @@
+"""Explicit dtypes for the /coins/markets frame.
+
+The frame is typed once at extraction (`apply_market_dtypes`) and compacted at the end of the
+transform (`compact_market_frame`):
+
+- `symbol`, `roi_currency` and `market_cap_category` are categoricals
+- ranks, day counts and calendar fields are nullable Int32/Int16
+- timestamps are `datetime64[ns, UTC]`
+- float64 columns become float32 only where every value survives the round trip exactly
+
+Every conversion is lossless, so RDS receives the same values and the binary COPY stream is
+unchanged. Before a frame is serialized, `to_wire_dtypes` restores the dtypes the outputs were
+written with, so S3 snapshots and CSV COPY text hold the same values as before; the one visible
+difference is that a fully ranked `market_cap_rank` is written as `1` where a page with unranked
+coins used to give `1.0`.
+"""
+import numpy as np
+import pandas as pd
+from typing import Iterable, List, Optional
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_DTYPE = 'datetime64[ns, UTC]'
+TIMESTAMP_COLUMNS = ['last_updated', 'ath_date', 'atl_date']
+
+# Few distinct values repeated across coins and across snapshots in history
+CATEGORY_COLUMNS = ['symbol', 'roi_currency', 'market_cap_category']
+# Categorical before this schema existed, so it stays categorical on output
+WIRE_CATEGORY_COLUMNS = {'market_cap_category'}
+
+INTEGER_DTYPES = {
+    'market_cap_rank': 'Int32',
+    'days_since_ath': 'Int32',
+    'year': 'Int16',
+    'month': 'Int16',
+}
+
+
+def frame_bytes(data: pd.DataFrame) -> int:
+    """Memory held by `data`, including the Python strings in object columns."""
+    return int(data.memory_usage(deep=True).sum())
+
+
+def memory_report(data: pd.DataFrame) -> List[dict]:
+    """Per-column dtype and memory, largest first."""
+    usage = data.memory_usage(deep=True, index=False)
+    return [
+        {'column': column, 'dtype': str(data[column].dtype), 'bytes': int(usage[column])}
+        for column in usage.sort_values(ascending=False).index
+    ]
+
+
+def _to_integer(series: pd.Series, dtype: str) -> pd.Series:
+    """`series` as nullable `dtype`, or unchanged when a value is fractional or out of range."""
+    if isinstance(series.dtype, pd.api.extensions.ExtensionDtype) and str(series.dtype) == dtype:
+        return series
+    values = pd.to_numeric(series, errors='coerce')
+    finite = values.dropna().to_numpy(dtype='float64')
+    info = np.iinfo(dtype.lower())
+    if len(finite) and (np.any(finite != np.round(finite)) or finite.min() < info.min or finite.max() > info.max):
+        logger.debug(f"Keeping {series.name} as {series.dtype}: values do not fit {dtype}")
+        return series
+    return values.astype(dtype)
+
+
+def apply_market_dtypes(data: pd.DataFrame) -> pd.DataFrame:
+    """Categorical, nullable integer and UTC timestamp dtypes for the columns of `data` that have them."""
+    for column in TIMESTAMP_COLUMNS:
+        if column in data.columns and str(data[column].dtype) != TIMESTAMP_DTYPE:
+            data[column] = pd.to_datetime(data[column], utc=True)
+    for column in CATEGORY_COLUMNS:
+        if column in data.columns and not isinstance(data[column].dtype, pd.CategoricalDtype):
+            data[column] = data[column].astype('category')
+    for column, dtype in INTEGER_DTYPES.items():
+        if column in data.columns:
+            data[column] = _to_integer(data[column], dtype)
+    return data
+
+
+def downcast_floats(data: pd.DataFrame, columns: Optional[Iterable[str]] = None) -> List[str]:
+    """Store float64 columns as float32 where that is exact for every value; returns the columns changed."""
+    columns = data.select_dtypes(include='float64').columns if columns is None else columns
+    downcast = []
+    for column in columns:
+        values = data[column].to_numpy()
+        if values.dtype != np.float64:
+            continue
+        with np.errstate(over='ignore'):
+            compact = values.astype(np.float32)
+        if np.array_equal(compact.astype(np.float64), values, equal_nan=True):
+            data[column] = compact
+            downcast.append(column)
+    return downcast
+
+
+def compact_market_frame(data: pd.DataFrame) -> pd.DataFrame:
+    """Apply the market dtypes and the lossless float32 downcast."""
+    apply_market_dtypes(data)
+    downcast_floats(data)
+    return data
+
+
+def to_wire_dtypes(data: pd.DataFrame) -> pd.DataFrame:
+    """`data` with the dtypes outputs were written with before the compact schema; no copy when none differ.
+
+    float32 goes back to float64, since float32 prints a shorter repr of the same value; nullable
+    integers become int64, or float64 when they hold missing values; categoricals other than
+    `market_cap_category` become object.
+    """
+    restore = {}
+    for column, dtype in data.dtypes.items():
+        if dtype == np.float32:
+            restore[column] = 'float64'
+        elif isinstance(dtype, pd.CategoricalDtype):
+            if column not in WIRE_CATEGORY_COLUMNS:
+                restore[column] = object
+        elif pd.api.types.is_integer_dtype(dtype) and isinstance(dtype, pd.api.extensions.ExtensionDtype):
+            restore[column] = 'float64' if data[column].hasnans else 'int64'
+    return data.astype(restore) if restore else data
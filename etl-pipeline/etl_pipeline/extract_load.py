@@ -1,187 +1,252 @@
 import pandas as pd
-import boto3
 from prefect import task
 from prefect.artifacts import create_table_artifact
-from prefect_aws import AwsCredentials
-import requests
-import psycopg2
 from dotenv import load_dotenv
 import os
 import logging
-import json
-from io import StringIO
-import time
-from psycopg2 import sql
+from etl_pipeline.coingecko import ChangeTracker, CoinGeckoClient, get_change_tracker
+from etl_pipeline.copy_writer import copy_dataframe
+from etl_pipeline.dtypes import apply_market_dtypes, frame_bytes
+from etl_pipeline.artifacts import create_dataframe_artifact, dataframe_to_json_serializable  # noqa: F401
+from etl_pipeline.profiling import recorder
+from etl_pipeline.raw_cache import cache_raw_response
+from etl_pipeline.resources import db_connection, get_s3_client
+from etl_pipeline.rollups import update_rollups
+from etl_pipeline.schema import (
+    STAGING_TABLE, ensure_schema, ensure_staging, execute_upsert, notify_changes, reset_schema, reset_session
+)
+from etl_pipeline.storage import archive, get_object_store, get_serializer
 
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def json_serial(obj):
-    """JSON serializer for objects not serializable by default json code"""
-    if isinstance(obj, (pd.Timestamp, pd.Timedelta)):
-        return obj.isoformat()
-    raise TypeError(f"Type {type(obj)} not serializable")
+def fetch_market_pages(pages: int, per_page: int, max_concurrency: int = None):
+    """Fetch several /coins/markets pages concurrently over a shared keep-alive session.
 
-def dataframe_to_json_serializable(df):
-    """Convert a DataFrame to a JSON-serializable format"""
-    return json.loads(json.dumps(df.to_dict(orient="records"), default=json_serial))
-
-@task(name="Extract Data from CoinGecko")
-def extract_data_task():
-    url = "https://api.coingecko.com/api/v3/coins/markets"
-    params = {
-        "vs_currency": "usd",
-        "order": "market_cap_desc",
-        "per_page": 10,
-        "page": 1,
-        "sparkline": False
-    }
-    headers = {
-        'accept': 'application/json',
-        'x-cg-api-key': os.getenv('CG_API_KEY')
-    }
-
-    logger.info("Sending request to CoinGecko API")
-    response = requests.get(url, headers=headers, params=params)
-    logger.info(f"Received response with status code: {response.status_code}")
+    Returns the records, whether any page changed since the previous fetch, and the client's
+    transfer counts (bytes received, JSON parse time).
+    """
+    client = CoinGeckoClient(max_concurrency=max_concurrency)
+    try:
+        data, changed = client.fetch_markets_if_changed(pages, per_page=per_page)
+        return data, changed, client.drain_transfer()
+    finally:
+        client.close()
+
+def record_json_parse(transfer: dict, rows: int):
+    """Record the JSON parsing done on the fetch threads as its own stage (it is also inside the fetch's wall time)."""
+    recorder.add(
+        'extract.json_parse',
+        wall_seconds=transfer['parse_seconds'],
+        cpu_seconds=transfer['parse_cpu_seconds'],
+        rows=rows,
+        bytes=transfer['bytes'],
+    )
 
-    if response.status_code != 200:
-        logger.error(f"Failed to fetch data: {response.text}")
-        return pd.DataFrame()  # Return an empty DataFrame on failure
+def record_change_detection(changed: bool, pages_unchanged: int = None, tracker: ChangeTracker = None):
+    """Record whether this poll found new upstream data, and the running share of skipped polls."""
+    tracker = tracker or get_change_tracker()
+    with recorder.stage('extract.change_detection') as stage:
+        stage.update({
+            'upstream_changed': int(changed),
+            'pages_unchanged': pages_unchanged,
+            'skip_rate': tracker.skip_rate,
+        })
+    if not changed:
+        logger.info(f"Upstream data unchanged since the last poll; skipping (skip rate {tracker.skip_rate})")
+
+def unchanged_frame(data: list) -> pd.DataFrame:
+    """The extracted frame, flagged so the flow skips transform, load and archival."""
+    df = apply_market_dtypes(pd.DataFrame(data))
+    df.attrs['upstream_unchanged'] = True
+    return df
 
-    data = response.json()
-    df = pd.DataFrame(data)
+@task(name="Extract Data from CoinGecko")
+def extract_data_task(pages: int = 1, per_page: int = 10, max_concurrency: int = None):
+    # One page or many, requests go through the client: CG_API_URL, timeouts, rate limiting,
+    # retries with backoff and conditional requests against the previous poll
+    logger.info(f"Fetching {pages} page(s) of {per_page} coins from CoinGecko API")
+    with recorder.stage('extract.http_fetch') as stage:
+        data, changed, transfer = fetch_market_pages(pages, per_page, max_concurrency)
+        stage.rows = len(data)
+        stage.bytes = transfer['bytes']
+    record_json_parse(transfer, len(data))
+    if not data:
+        logger.error("Failed to fetch any market pages")
+        return pd.DataFrame()
+
+    record_change_detection(changed)
+    if not changed:
+        return unchanged_frame(data)
+
+    # Local copy for replays; a no-op unless RAW_CACHE_DIR is set
+    cache_raw_response(data)
+
+    with recorder.stage('extract.dataframe', rows=len(data)) as stage:
+        df = apply_market_dtypes(pd.DataFrame(data))
+        stage.update(frame_bytes=frame_bytes(df))
     logger.info(f"Extracted data: {df.head()}")
 
-    # Load AWS credentials
-    aws_credentials = AwsCredentials.load("my-aws-creds")
-    logger.info(f"AWS Access Key ID: {aws_credentials.aws_access_key_id[:5]}...")
-    logger.info(f"AWS Secret Access Key: {'*' * 5}...")  # Just log asterisks for the secret key
-
-    s3 = boto3.client('s3', 
-                      aws_access_key_id=aws_credentials.aws_access_key_id,
-                      aws_secret_access_key=aws_credentials.aws_secret_access_key.get_secret_value(),
-                      region_name='ap-southeast-2')  # Make sure this is your correct AWS region
-    
-    bucket_name = os.getenv('AWS_S3_BUCKET_RAW')
-    file_name = f'raw_crypto_data_{pd.Timestamp.now().strftime("%Y%m%d%H%M%S")}.json'
-    
-    logger.info(f"Attempting to save data to S3 bucket: {bucket_name}")
+    s3 = get_s3_client()
+    store = get_object_store(os.getenv('AWS_S3_BUCKET_RAW'), s3)
+    serializer = get_serializer(os.getenv('RAW_FORMAT', 'json'))
+
+    logger.info(f"Attempting to save data to {store}")
     try:
-        s3.put_object(Bucket=bucket_name, Key=file_name, Body=json.dumps(data))
-        logger.info(f"Raw data saved to S3: {bucket_name}/{file_name}")
+        key = archive(store, data, 'raw_crypto_data', serializer)
+        logger.info(f"Raw data saved to {store}/{key}")
     except Exception as e:
         logger.error(f"Failed to save data to S3: {str(e)}")
 
-    create_table_artifact(
-        key="extracted-data",
-        table=dataframe_to_json_serializable(df),
-        description="Extracted data from CoinGecko API"
-    )
+    create_dataframe_artifact("extracted-data", df, "Extracted data from CoinGecko API", memory=True)
 
     return df
-@task(name="Load Data into RDS")
-def load_data_task(data: pd.DataFrame):
-    if data.empty:
-        logger.warning("No data to load into RDS")
+
+# Latest `last_updated` loaded per coin id, seeded from crypto_data on the first incremental load
+_loaded_fingerprints = {}
+
+def filter_unchanged(data: pd.DataFrame, fingerprints: dict):
+    """Drop rows whose `last_updated` is not newer than the fingerprint already loaded for that coin.
+
+    Returns the changed rows and the number of rows skipped.
+    """
+    known = pd.to_datetime(data['id'].map(fingerprints), utc=True)
+    last_updated = pd.to_datetime(data['last_updated'], utc=True)
+    changed = known.isna() | last_updated.isna() | (last_updated > known)
+    return data[changed], int((~changed).sum())
+
+def seed_fingerprints(cur, ids):
+    """Fill the fingerprint cache from crypto_data for coins this process has not loaded yet."""
+    missing = [coin_id for coin_id in ids if coin_id not in _loaded_fingerprints]
+    if not missing:
         return
+    cur.execute("SELECT id, last_updated FROM crypto_data WHERE id = ANY(%s)", (missing,))
+    for coin_id, last_updated in cur.fetchall():
+        if last_updated is not None:
+            _loaded_fingerprints[coin_id] = pd.Timestamp(last_updated).tz_localize('UTC')
+
+def freshness_stats(data: pd.DataFrame, committed_at: pd.Timestamp = None) -> dict:
+    """Median and worst seconds from each row's CoinGecko `last_updated` to its commit in RDS."""
+    committed_at = committed_at or pd.Timestamp.now(tz='UTC')
+    if data.empty or 'last_updated' not in data.columns:
+        return {'freshness_p50_seconds': None, 'freshness_max_seconds': None}
+    age = (committed_at - pd.to_datetime(data['last_updated'], utc=True)).dt.total_seconds()
+    return {
+        'freshness_p50_seconds': None if age.isna().all() else round(float(age.median()), 3),
+        'freshness_max_seconds': None if age.isna().all() else round(float(age.max()), 3),
+    }
 
-    aws_credentials = AwsCredentials.load("my-aws-creds")
-    
-    conn = psycopg2.connect(
-        host=os.getenv('RDS_HOST'),
-        database=os.getenv('RDS_DB_NAME'),
-        user=os.getenv('RDS_USERNAME'),
-        password=os.getenv('RDS_PASSWORD')
-    )
-    
-    cur = conn.cursor()
+def upsert_crypto_data(conn, data: pd.DataFrame, incremental: bool = False):
+    """Upsert `data` into crypto_data on `conn` and commit.
 
-    try:
-        # Check if table exists
-        cur.execute("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'crypto_data')")
-        table_exists = cur.fetchone()[0]
-
-        if not table_exists:
-            # Create table if it doesn't exist
-            create_table_query = """
-            CREATE TABLE crypto_data (
-                id TEXT PRIMARY KEY,
-                symbol TEXT,
-                name TEXT,
-                current_price REAL,
-                market_cap REAL,
-                total_volume REAL,
-                high_24h REAL,
-                low_24h REAL,
-                price_change_24h REAL,
-                price_change_percentage_24h REAL,
-                market_cap_change_24h REAL,
-                market_cap_change_percentage_24h REAL,
-                circulating_supply REAL,
-                total_supply REAL,
-                max_supply REAL,
-                ath REAL,
-                ath_change_percentage REAL,
-                atl REAL,
-                atl_change_percentage REAL,
-                last_updated TIMESTAMP,
-                ath_date TIMESTAMP,
-                atl_date TIMESTAMP
-                -- Add any additional columns here
-            )
-            """
-            cur.execute(create_table_query)
-            logger.info("Created new crypto_data table")
-
-        # Get the current columns in the database table
-        cur.execute("SELECT * FROM crypto_data LIMIT 0")
-        db_columns = [desc[0] for desc in cur.description]
-
-        # Filter the DataFrame to only include columns that exist in the database
-        data_to_insert = data[[col for col in data.columns if col in db_columns]]
-
-        # Create a temporary table
-        temp_table_name = f"temp_crypto_data_{int(time.time())}"
-        cur.execute(f"CREATE TEMP TABLE {temp_table_name} (LIKE crypto_data INCLUDING ALL)")
-
-        # Use StringIO for efficient data insertion into temp table
-        buffer = StringIO()
-        data_to_insert.to_csv(buffer, index=False, header=False, na_rep='NULL')
-        buffer.seek(0)
-
-        cur.copy_from(buffer, temp_table_name, sep=',', columns=data_to_insert.columns, null='NULL')
-        
-        # Upsert from temp table to main table
-        update_cols = [col for col in data_to_insert.columns if col != 'id']
-        update_stmt = ", ".join([f"{col} = excluded.{col}" for col in update_cols])
-        
-        cur.execute(sql.SQL("""
-            INSERT INTO crypto_data
-            SELECT * FROM {temp_table}
-            ON CONFLICT (id) DO UPDATE SET
-            {update_stmt}
-        """).format(
-            temp_table=sql.Identifier(temp_table_name),
-            update_stmt=sql.SQL(update_stmt)
-        ))
+    Returns the load stats and the rows actually sent to the database.
+    """
+    stats = {'rows_received': len(data), 'rows_skipped': 0, 'rows_written': 0}
 
-        conn.commit()
-        logger.info(f"Data loaded into RDS successfully. Upserted {len(data_to_insert)} rows.")
+    # DDL, migrations and the column list are handled once per process by the schema layer
+    db_types = ensure_schema(conn)
+    # Filter the DataFrame to only include columns that exist in the database
+    data_to_insert = data[[col for col in data.columns if col in db_types]]
+
+    cur = conn.cursor()
+    try:
+        incremental = incremental and 'last_updated' in data_to_insert.columns
+        if incremental:
+            # Drop coins whose last_updated has not moved since they were last loaded
+            seed_fingerprints(cur, data_to_insert['id'].tolist())
+            data_to_insert, stats['rows_skipped'] = filter_unchanged(data_to_insert, _loaded_fingerprints)
+            logger.info(f"Incremental load: {stats['rows_skipped']} unchanged rows skipped")
+
+        if not data_to_insert.empty:
+            # Session-reused staging table, emptied by every commit
+            statements = ensure_staging(conn, cur)
+
+            with recorder.stage('load.copy', rows=len(data_to_insert)) as stage:
+                # Streamed in chunks as binary COPY, typed by the crypto_data columns
+                stage.bytes = copy_dataframe(cur, data_to_insert, STAGING_TABLE, types=db_types)
+
+            # Upsert from the staging table to the main table; in incremental mode only rows with
+            # a newer last_updated overwrite the stored ones
+            with recorder.stage('load.upsert', rows=len(data_to_insert)):
+                execute_upsert(cur, statements, list(data_to_insert.columns), newer_only=incremental)
+            stats['rows_written'] = cur.rowcount
+            stats['rows_skipped'] += len(data_to_insert) - cur.rowcount
+            if stats['rows_written']:
+                # Sent on commit, so dashboards are only pushed rows that were stored
+                notify_changes(cur, data_to_insert['id'].tolist())
+
+        with recorder.stage('load.commit', rows=len(data_to_insert)) as stage:
+            conn.commit()
+            freshness = freshness_stats(data_to_insert)
+            stage.update(freshness)
+        stats.update(freshness)
+        if incremental:
+            loaded = data_to_insert.dropna(subset=['last_updated'])
+            _loaded_fingerprints.update(zip(loaded['id'], pd.to_datetime(loaded['last_updated'], utc=True)))
+        logger.info(
+            f"Data loaded into RDS successfully. Upserted {stats['rows_written']} rows, "
+            f"skipped {stats['rows_skipped']} unchanged of {stats['rows_received']}."
+        )
 
     except Exception as e:
         conn.rollback()
+        # The rollback may have undone this session's staging table, or the table itself changed
+        reset_session(conn)
+        reset_schema()
         logger.error(f"Error loading data into RDS: {str(e)}")
         raise
     finally:
-        cur.execute(f"DROP TABLE IF EXISTS {temp_table_name}")
         cur.close()
-        conn.close()
 
+    return stats, data_to_insert
+
+def update_market_metrics(conn, data: pd.DataFrame):
+    """Set the whole-market columns (dominance, filled rank) of rows loaded page by page, and commit."""
+    if data.empty:
+        return 0
+    cur = conn.cursor()
+    try:
+        with recorder.stage('load.market_metrics', rows=len(data)):
+            cur.execute("""
+                UPDATE crypto_data AS c
+                SET market_dominance = m.market_dominance, market_cap_rank = m.market_cap_rank
+                FROM unnest(%s::text[], %s::real[], %s::integer[]) AS m(id, market_dominance, market_cap_rank)
+                WHERE c.id = m.id
+            """, (
+                data['id'].tolist(),
+                [None if pd.isna(value) else float(value) for value in data['market_dominance']],
+                [None if pd.isna(value) else int(value) for value in data['market_cap_rank']],
+            ))
+        updated = cur.rowcount
+        notify_changes(cur, data['id'].tolist())
+        conn.commit()
+        return updated
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error updating market metrics: {str(e)}")
+        raise
+    finally:
+        cur.close()
+
+@task(name="Load Data into RDS")
+def load_data_task(data: pd.DataFrame, incremental: bool = False, rollups: bool = True):
+    if data.empty:
+        logger.warning("No data to load into RDS")
+        return
+
+    with db_connection() as conn:
+        stats, data_to_insert = upsert_crypto_data(conn, data, incremental)
+        if rollups:
+            # Candles merge every coin in the snapshot, including those skipped as unchanged
+            update_rollups(conn, data)
+
+    create_dataframe_artifact("loaded-data", data_to_insert, "Data loaded into RDS database", max_rows=10)
     create_table_artifact(
-        key="loaded-data",
-        table=dataframe_to_json_serializable(data_to_insert.head(10)),
-        description="Data loaded into RDS database (first 10 rows)"
-    )
\ No newline at end of file
+        key="load-stats",
+        table=[stats],
+        description="Rows written versus skipped as unchanged by the RDS load"
+    )
+
+    return stats
@@ -0,0 +1,288 @@
+import pandas as pd
+from prefect import task
+from prefect.artifacts import create_table_artifact
+from psycopg2 import sql
+from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import logging
+import os
+import threading
+import time
+import requests
+from etl_pipeline.coingecko import MAX_PER_PAGE, CoinGeckoClient
+from etl_pipeline.copy_writer import copy_dataframe
+from etl_pipeline.profiling import recorder
+from etl_pipeline.resources import db_connection
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+QUOTES_TABLE = "market_quotes"
+DEFAULT_CURRENCIES = ['usd', 'eur', 'aud', 'btc']
+ENDPOINTS = ['markets', 'global', 'trending']
+# Row id of the whole-market totals from /global, one row per currency
+GLOBAL_ID = '_global'
+
+QUOTE_COLUMNS = [
+    'id', 'vs_currency', 'ts', 'current_price', 'market_cap', 'total_volume',
+    'price_change_percentage_24h', 'market_cap_rank', 'trending_rank', 'last_updated'
+]
+
+CREATE_QUOTES_TABLE = f"""
+CREATE TABLE IF NOT EXISTS {QUOTES_TABLE} (
+    id TEXT NOT NULL,
+    vs_currency TEXT NOT NULL,
+    ts TIMESTAMP NOT NULL,
+    current_price DOUBLE PRECISION,
+    market_cap DOUBLE PRECISION,
+    total_volume DOUBLE PRECISION,
+    price_change_percentage_24h REAL,
+    market_cap_rank INTEGER,
+    trending_rank INTEGER,
+    last_updated TIMESTAMP,
+    PRIMARY KEY (id, vs_currency, ts)
+)
+"""
+
+# Set once this process has created the quotes table, so steady-state loads issue no DDL
+_table_ready = {'value': False}
+
+# One planned request: (endpoint label, currency or None, path, params)
+Request = Tuple[str, Optional[str], str, Dict[str, Any]]
+
+
+def parse_list(value: Optional[str], default: Sequence[str]) -> List[str]:
+    """Comma-separated `value` as a lower-case list, or `default` when unset."""
+    if value is None:
+        return list(default)
+    return [item.strip().lower() for item in value.split(',') if item.strip()]
+
+
+class EndpointStats:
+    """Latency and error counts per endpoint label, shared by the fan-out worker threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.rows = {}
+
+    def record(self, label: str, seconds: float, rows: int = 0, error: bool = False):
+        with self.lock:
+            self.latencies.setdefault(label, []).append(seconds)
+            self.errors[label] = self.errors.get(label, 0) + int(error)
+            self.rows[label] = self.rows.get(label, 0) + rows
+
+    def report(self) -> List[dict]:
+        with self.lock:
+            return [
+                {
+                    'endpoint': label,
+                    'requests': len(latencies),
+                    'errors': self.errors[label],
+                    'rows': self.rows[label],
+                    'latency_p50_seconds': round(float(pd.Series(latencies).median()), 6),
+                    'latency_max_seconds': round(max(latencies), 6),
+                    'latency_total_seconds': round(sum(latencies), 6),
+                }
+                for label, latencies in sorted(self.latencies.items())
+            ]
+
+    def publish(self):
+        """One `extract.fanout.<endpoint>` stage record per endpoint, for the metrics exports."""
+        for row in self.report():
+            record = recorder.add(
+                f"extract.fanout.{row['endpoint']}",
+                wall_seconds=row['latency_total_seconds'],
+                cpu_seconds=0.0,
+                rows=row['rows'],
+            )
+            record.update(
+                requests=row['requests'],
+                errors=row['errors'],
+                latency_p50_seconds=row['latency_p50_seconds'],
+                latency_max_seconds=row['latency_max_seconds'],
+            )
+
+
+def plan_requests(currencies: Sequence[str], endpoints: Sequence[str], pages: int, per_page: int) -> List[Request]:
+    """Every request of one fan-out: market pages per currency, then the currency-independent endpoints."""
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        raise ValueError(f"Unknown fan-out endpoints {sorted(unknown)}; expected some of {ENDPOINTS}")
+    planned = []
+    if 'markets' in endpoints:
+        for currency in currencies:
+            for page in range(1, pages + 1):
+                planned.append((f"markets.{currency}", currency, '/coins/markets', {
+                    "vs_currency": currency,
+                    "order": "market_cap_desc",
+                    "per_page": min(per_page, MAX_PER_PAGE),
+                    "page": page,
+                    "sparkline": "false"
+                }))
+    if 'global' in endpoints:
+        planned.append(('global', None, '/global', {}))
+    if 'trending' in endpoints:
+        planned.append(('trending', None, '/search/trending', {}))
+    return planned
+
+
+def _row_count(body: Any) -> int:
+    if isinstance(body, list):
+        return len(body)
+    if isinstance(body, dict) and isinstance(body.get('coins'), list):
+        return len(body['coins'])
+    return 1
+
+
+def fan_out(client: CoinGeckoClient, planned: List[Request], stats: EndpointStats) -> List[Tuple[Request, Any]]:
+    """Run `planned` concurrently on `client`, so every request draws on its one rate budget.
+
+    Returns each request with its parsed body, or None when it failed after retries. Latency
+    covers the whole call, including rate-limit waits and retries.
+    """
+    def fetch(request: Request):
+        label, _, path, params = request
+        start = time.perf_counter()
+        try:
+            body = client.get(path, params=params or None).json()
+        except (requests.RequestException, ValueError) as e:
+            stats.record(label, time.perf_counter() - start, error=True)
+            logger.error(f"Fan-out request {label} {params.get('page', '')} failed: {str(e)}")
+            return request, None
+        stats.record(label, time.perf_counter() - start, rows=_row_count(body))
+        return request, body
+
+    if not planned:
+        return []
+    with ThreadPoolExecutor(max_workers=min(client.max_concurrency, len(planned))) as executor:
+        return list(executor.map(fetch, planned))
+
+
+def normalize(results: List[Tuple[Request, Any]], currencies: Sequence[str], ts: datetime) -> pd.DataFrame:
+    """Long table of the fan-out keyed by `(id, vs_currency, ts)`.
+
+    Market rows are deduplicated per currency keeping the first page's copy, /global adds a
+    `_global` row per currency with the whole-market cap and volume, and /search/trending
+    sets `trending_rank` (1 is the most searched) on that coin's rows in every currency.
+    """
+    rows, seen, trending = [], set(), {}
+    for (label, currency, _, _), body in results:
+        if body is None:
+            continue
+        if label.startswith('markets.'):
+            for record in body:
+                if (record.get('id'), currency) in seen:
+                    continue
+                seen.add((record.get('id'), currency))
+                rows.append({
+                    'id': record.get('id'),
+                    'vs_currency': currency,
+                    'current_price': record.get('current_price'),
+                    'market_cap': record.get('market_cap'),
+                    'total_volume': record.get('total_volume'),
+                    'price_change_percentage_24h': record.get('price_change_percentage_24h'),
+                    'market_cap_rank': record.get('market_cap_rank'),
+                    'last_updated': record.get('last_updated'),
+                })
+        elif label == 'global':
+            totals = body.get('data', {})
+            updated_at = pd.Timestamp(totals['updated_at'], unit='s') if totals.get('updated_at') else None
+            for currency in currencies:
+                rows.append({
+                    'id': GLOBAL_ID,
+                    'vs_currency': currency,
+                    'market_cap': totals.get('total_market_cap', {}).get(currency),
+                    'total_volume': totals.get('total_volume', {}).get(currency),
+                    'last_updated': updated_at,
+                })
+        elif label == 'trending':
+            for position, coin in enumerate(body.get('coins', [])):
+                item = coin.get('item', {})
+                trending[item.get('id')] = item.get('score', position) + 1
+
+    data = pd.DataFrame(rows, columns=[col for col in QUOTE_COLUMNS if col not in ('ts', 'trending_rank')])
+    ts = pd.Timestamp(ts)
+    # Naive UTC, like the other TIMESTAMP columns
+    data.insert(2, 'ts', ts.tz_convert(None) if ts.tzinfo else ts)
+    data['trending_rank'] = data['id'].map(trending).astype('Int32')
+    for col in ['current_price', 'market_cap', 'total_volume', 'price_change_percentage_24h']:
+        data[col] = pd.to_numeric(data[col], errors='coerce').astype('float64')
+    data['market_cap_rank'] = pd.to_numeric(data['market_cap_rank'], errors='coerce').astype('Int32')
+    data['last_updated'] = pd.to_datetime(data['last_updated'], utc=True).dt.tz_localize(None)
+    return data[QUOTE_COLUMNS]
+
+
+@task(name="Fan-out Extract from CoinGecko")
+def fanout_extract_task(currencies: Optional[List[str]] = None, endpoints: Optional[List[str]] = None,
+                        pages: int = 1, per_page: int = MAX_PER_PAGE, max_concurrency: int = None,
+                        base_url: str = None):
+    currencies = currencies or parse_list(os.getenv('FANOUT_CURRENCIES'), DEFAULT_CURRENCIES)
+    endpoints = endpoints or parse_list(os.getenv('FANOUT_ENDPOINTS'), ENDPOINTS)
+    planned = plan_requests(currencies, endpoints, pages, per_page)
+    logger.info(f"Fanning out {len(planned)} requests over {currencies} and {endpoints}")
+
+    stats = EndpointStats()
+    ts = datetime.now(timezone.utc)
+    client = CoinGeckoClient(base_url=base_url, max_concurrency=max_concurrency)
+    try:
+        with recorder.stage('extract.fanout', rows=len(planned)):
+            results = fan_out(client, planned, stats)
+    finally:
+        client.close()
+    stats.publish()
+
+    with recorder.stage('extract.fanout_normalize') as stage:
+        data = normalize(results, currencies, ts)
+        stage.rows = len(data)
+
+    create_table_artifact(
+        key="fanout-endpoints",
+        table=stats.report(),
+        description="Requests, errors and latency per CoinGecko endpoint in the fan-out extraction"
+    )
+    return data
+
+
+@task(name="Load Market Quotes into RDS")
+def load_quotes_task(data: pd.DataFrame):
+    if data.empty:
+        logger.warning("No market quotes to load into RDS")
+        return 0
+
+    with db_connection() as conn:
+        cur = conn.cursor()
+        try:
+            if not _table_ready['value']:
+                cur.execute(CREATE_QUOTES_TABLE)
+            cur.execute(sql.SQL(
+                "CREATE TEMP TABLE IF NOT EXISTS quotes_staging (LIKE {table}) ON COMMIT DELETE ROWS"
+            ).format(table=sql.Identifier(QUOTES_TABLE)))
+
+            columns = sql.SQL(', ').join(map(sql.Identifier, data.columns))
+            with recorder.stage('fanout.copy', rows=len(data)) as stage:
+                stage.bytes = copy_dataframe(cur, data, 'quotes_staging')
+
+            # Snapshots are keyed by fetch time, so a rerun of the same snapshot adds nothing
+            with recorder.stage('fanout.append', rows=len(data)):
+                cur.execute(sql.SQL(
+                    "INSERT INTO {table} ({columns}) SELECT {columns} FROM quotes_staging ON CONFLICT DO NOTHING"
+                ).format(table=sql.Identifier(QUOTES_TABLE), columns=columns))
+            appended = cur.rowcount
+            conn.commit()
+            _table_ready['value'] = True
+            logger.info(f"Appended {appended} of {len(data)} rows to {QUOTES_TABLE}")
+        except Exception as e:
+            conn.rollback()
+            _table_ready['value'] = False
+            logger.error(f"Error loading market quotes: {str(e)}")
+            raise
+        finally:
+            cur.close()
+
+    return appended
@@ -0,0 +1,169 @@
+import pandas as pd
+from prefect import task
+from prefect.artifacts import create_table_artifact
+from psycopg2 import sql
+from dotenv import load_dotenv
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, List
+import logging
+import os
+from etl_pipeline.copy_writer import copy_dataframe
+from etl_pipeline.profiling import recorder
+from etl_pipeline.resources import db_connection
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+HISTORY_TABLE = "crypto_prices_history"
+PARTITION_PREFIX = f"{HISTORY_TABLE}_p"
+
+HISTORY_COLUMNS = [
+    'id', 'symbol', 'current_price', 'market_cap', 'total_volume', 'high_24h', 'low_24h',
+    'price_change_percentage_24h', 'market_cap_rank', 'circulating_supply', 'last_updated'
+]
+
+CREATE_HISTORY_TABLE = f"""
+CREATE TABLE IF NOT EXISTS {HISTORY_TABLE} (
+    id TEXT NOT NULL,
+    symbol TEXT,
+    current_price REAL,
+    market_cap REAL,
+    total_volume REAL,
+    high_24h REAL,
+    low_24h REAL,
+    price_change_percentage_24h REAL,
+    market_cap_rank INTEGER,
+    circulating_supply REAL,
+    last_updated TIMESTAMP NOT NULL,
+    -- Also serves (id, last_updated) range scans for per-coin charts on every partition
+    PRIMARY KEY (id, last_updated)
+) PARTITION BY RANGE (last_updated)
+"""
+
+# Partitions this process has already created, so steady-state loads issue no DDL
+_known_partitions = set()
+
+def partition_name(day: date) -> str:
+    """Name of the daily partition holding rows with `last_updated` on `day`."""
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+def partition_day(name: str):
+    """Day covered by a partition name, or None if the name is not a daily partition."""
+    if not name.startswith(PARTITION_PREFIX):
+        return None
+    try:
+        return datetime.strptime(name[len(PARTITION_PREFIX):], "%Y%m%d").date()
+    except ValueError:
+        return None
+
+def expired_partitions(names: Iterable[str], today: date, retention_days: int) -> List[str]:
+    """Partitions whose whole day is older than the retention window, oldest first."""
+    cutoff = today - timedelta(days=retention_days)
+    days = {name: partition_day(name) for name in names}
+    return sorted(name for name, day in days.items() if day is not None and day < cutoff)
+
+def to_history_frame(data: pd.DataFrame) -> pd.DataFrame:
+    """Select the history columns, with `last_updated` as naive UTC and rows without it dropped."""
+    history = data[[col for col in HISTORY_COLUMNS if col in data.columns]].copy()
+    history['last_updated'] = pd.to_datetime(history['last_updated'], utc=True).dt.tz_localize(None)
+    if 'market_cap_rank' in history.columns:
+        history['market_cap_rank'] = history['market_cap_rank'].astype('Int64')
+    return history.dropna(subset=['last_updated'])
+
+def ensure_partitions(cur, days: Iterable[date]):
+    """Create the history table and any missing daily partitions for `days`."""
+    if not _known_partitions:
+        cur.execute(CREATE_HISTORY_TABLE)
+    for day in sorted(set(days)):
+        name = partition_name(day)
+        if name in _known_partitions:
+            continue
+        cur.execute(sql.SQL(
+            "CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)"
+        ).format(
+            partition=sql.Identifier(name),
+            table=sql.Identifier(HISTORY_TABLE)
+        ), (day.isoformat(), (day + timedelta(days=1)).isoformat()))
+        _known_partitions.add(name)
+
+@task(name="Load Price History into RDS")
+def load_history_task(data: pd.DataFrame, partitions_ahead: int = None):
+    if data.empty:
+        logger.warning("No data to append to price history")
+        return 0
+
+    partitions_ahead = partitions_ahead if partitions_ahead is not None else int(os.getenv('HISTORY_PARTITIONS_AHEAD', 3))
+    history = to_history_frame(data)
+    today = datetime.now(timezone.utc).date()
+    days = set(history['last_updated'].dt.date) | {today + timedelta(days=i) for i in range(partitions_ahead + 1)}
+
+    with db_connection() as conn:
+        cur = conn.cursor()
+        try:
+            ensure_partitions(cur, days)
+
+            # COPY into a session-local staging table, then append; rows already recorded for the
+            # same (id, last_updated) are ignored so reruns and stale coins don't duplicate history
+            cur.execute(sql.SQL(
+                "CREATE TEMP TABLE IF NOT EXISTS history_staging (LIKE {table}) ON COMMIT DELETE ROWS"
+            ).format(table=sql.Identifier(HISTORY_TABLE)))
+
+            columns = sql.SQL(', ').join(map(sql.Identifier, history.columns))
+            with recorder.stage('history.copy', rows=len(history)) as stage:
+                stage.bytes = copy_dataframe(cur, history, 'history_staging')
+
+            with recorder.stage('history.append', rows=len(history)):
+                cur.execute(sql.SQL(
+                    "INSERT INTO {table} ({columns}) SELECT {columns} FROM history_staging ON CONFLICT DO NOTHING"
+                ).format(table=sql.Identifier(HISTORY_TABLE), columns=columns))
+            appended = cur.rowcount
+            conn.commit()
+            logger.info(f"Appended {appended} of {len(history)} rows to {HISTORY_TABLE}")
+        except Exception as e:
+            conn.rollback()
+            _known_partitions.clear()
+            logger.error(f"Error appending price history: {str(e)}")
+            raise
+        finally:
+            cur.close()
+
+    return appended
+
+@task(name="Drop Expired Price History Partitions")
+def history_retention_task(retention_days: int = None):
+    retention_days = retention_days if retention_days is not None else int(os.getenv('HISTORY_RETENTION_DAYS', 90))
+
+    with db_connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                SELECT child.relname
+                FROM pg_inherits
+                JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE parent.relname = %s
+            """, (HISTORY_TABLE,))
+            expired = expired_partitions([row[0] for row in cur.fetchall()], datetime.now(timezone.utc).date(), retention_days)
+
+            # Dropping a whole partition is a catalog operation; no DELETE, no dead tuples to vacuum
+            for name in expired:
+                cur.execute(sql.SQL("DROP TABLE IF EXISTS {partition}").format(partition=sql.Identifier(name)))
+                _known_partitions.discard(name)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error dropping expired history partitions: {str(e)}")
+            raise
+        finally:
+            cur.close()
+
+    if expired:
+        logger.info(f"Dropped {len(expired)} expired history partitions: {expired}")
+        create_table_artifact(
+            key="history-retention",
+            table=[{'partition': name} for name in expired],
+            description=f"Price history partitions dropped (older than {retention_days} days)"
+        )
+    return expired
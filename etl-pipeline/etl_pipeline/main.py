@@ -1,23 +1,100 @@
 from prefect import flow
-from extract_load import extract_data_task, load_data_task
-from transform import transform_data_task
+from prefect.artifacts import create_table_artifact
+from etl_pipeline.coingecko import get_change_tracker
+from etl_pipeline.extract_load import extract_data_task, load_data_task
+from etl_pipeline.transform import transform_data_task
+from etl_pipeline.pipeline import pipelined_etl_task
+from etl_pipeline.fanout import fanout_extract_task, load_quotes_task, parse_list
+from etl_pipeline.history import load_history_task, history_retention_task
+from etl_pipeline.rollups import rollup_retention_task
+from etl_pipeline.schema import migrate
+from etl_pipeline.profiling import recorder, write_metrics
+from etl_pipeline.replay import run_replay
+from etl_pipeline.resources import metrics as resource_metrics
+from etl_pipeline.streaming import run_streaming
 import logging
+import os
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 @flow(name="Crypto ETL Pipeline", log_prints=True)
-def main():
+def main(pages: int = 1, per_page: int = 10, max_concurrency: int = None, incremental: bool = False,
+         history: bool = True, profile_dir: str = None, pipelined: bool = False, rollups: bool = True,
+         currencies: list = None):
     logger.info("Starting ETL process")
+    recorder.reset()
+    profile_dir = profile_dir or os.getenv('ETL_PROFILE_DIR')
+    if profile_dir:
+        recorder.enable_profiling()
+    # Create crypto_data and add any new columns before the first load needs them
+    migrate()
 
-    extracted_data = extract_data_task()
-    logger.info(f"Extracted data shape: {extracted_data.shape}")
+    changes = get_change_tracker()
+    try:
+        if pipelined:
+            # Load page N while page N+1 is transformed, with S3 archival in the background
+            transformed_data = pipelined_etl_task(
+                pages=pages, per_page=per_page, max_concurrency=max_concurrency, incremental=incremental,
+                rollups=rollups
+            )
+            logger.info(f"Pipelined run data shape: {transformed_data.shape}")
+            unchanged = transformed_data.attrs.get('upstream_unchanged', False)
+        else:
+            extracted_data = extract_data_task(pages=pages, per_page=per_page, max_concurrency=max_concurrency)
+            logger.info(f"Extracted data shape: {extracted_data.shape}")
+            unchanged = extracted_data.attrs.get('upstream_unchanged', False)
 
-    transformed_data = transform_data_task(extracted_data)
-    logger.info(f"Transformed data shape: {transformed_data.shape}")
+            # Nothing new upstream: the last run already transformed and loaded this exact data
+            if not unchanged:
+                transformed_data = transform_data_task(extracted_data)
+                logger.info(f"Transformed data shape: {transformed_data.shape}")
 
-    load_data_task(transformed_data)
+                load_data_task(transformed_data, incremental=incremental, rollups=rollups)
+
+        if history and not unchanged:
+            load_history_task(transformed_data)
+    except Exception:
+        # The next poll must not read this snapshot as already seen, or it never gets loaded
+        changes.rollback()
+        raise
+    changes.commit()
+
+    if history and not unchanged:
+        history_retention_task()
+    if rollups:
+        rollup_retention_task()
+
+    # Prices in other currencies plus global and trending data, in one rate budget; off unless
+    # `currencies` or FANOUT_CURRENCIES names at least one currency
+    currencies = currencies if currencies is not None else parse_list(os.getenv('FANOUT_CURRENCIES'), [])
+    if currencies:
+        quotes = fanout_extract_task(currencies=currencies, max_concurrency=max_concurrency)
+        load_quotes_task(quotes)
+
+    create_table_artifact(
+        key="resource-setup",
+        table=resource_metrics.report(),
+        description="Setup cost of shared credentials, S3 client and DB connection, and time saved by reuse"
+    )
+    create_table_artifact(
+        key="stage-metrics",
+        table=list(recorder.records),
+        description="Wall time, CPU time, peak memory, rows/s and bytes moved per pipeline stage"
+    )
+    write_metrics()
+    if profile_dir:
+        recorder.dump_profiles(profile_dir)
     logger.info("ETL process completed")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # ETL_MODE=streaming keeps one resident process polling on STREAM_INTERVAL_SECONDS instead
+    # of a fresh container per scheduled run; ETL_MODE=replay reprocesses raw snapshots from
+    # REPLAY_START to REPLAY_END across all cores
+    mode = os.getenv('ETL_MODE', 'batch')
+    if mode == 'streaming':
+        run_streaming()
+    elif mode == 'replay':
+        run_replay()
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,220 @@
+import pandas as pd
+import requests
+from prefect import task
+from prefect.artifacts import create_table_artifact
+from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import logging
+import os
+import queue
+import threading
+from etl_pipeline.artifacts import create_dataframe_artifact
+from etl_pipeline.dtypes import apply_market_dtypes
+from etl_pipeline.coingecko import MAX_PER_PAGE, CoinGeckoClient
+from etl_pipeline.extract_load import (
+    record_change_detection, record_json_parse, update_market_metrics, upsert_crypto_data
+)
+from etl_pipeline.raw_cache import cache_raw_response
+from etl_pipeline.resources import db_connection, get_s3_client
+from etl_pipeline.rollups import update_rollups
+from etl_pipeline.storage import BackgroundUploader, get_object_store, get_serializer
+from etl_pipeline.streaming import Batch, _STOP
+from etl_pipeline.transform import finalize_batches, transform_market_data
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class PipelinedRun:
+    """One ETL run with the stages overlapped page by page.
+
+    Pages are fetched concurrently and handed on in page order; page N is loaded into RDS
+    while page N+1 is transformed and later pages are still downloading. Raw and processed
+    snapshots are archived by a BackgroundUploader rather than inline. Metrics that depend on
+    the whole market are computed once over all pages before the processed snapshot is written.
+    Pages CoinGecko reports or hashes as unchanged are not reloaded, and a run in which no page
+    changed skips the market-wide updates and archival altogether.
+    """
+
+    def __init__(
+        self,
+        pages: int,
+        per_page: int,
+        max_concurrency: Optional[int] = None,
+        incremental: bool = False,
+        rollups: bool = True,
+        queue_size: Optional[int] = None,
+        client: Optional[CoinGeckoClient] = None,
+        uploader: Optional[BackgroundUploader] = None,
+    ):
+        self.pages = pages
+        self.per_page = min(per_page, MAX_PER_PAGE)
+        self.incremental = incremental
+        self.rollups = rollups
+        self.client = client or CoinGeckoClient(max_concurrency=max_concurrency)
+        self.uploader = uploader or BackgroundUploader()
+        queue_size = queue_size or int(os.getenv('PIPELINE_QUEUE_SIZE', 2))
+        self.raw_batches = queue.Queue(maxsize=queue_size)
+        self.transformed_batches = queue.Queue(maxsize=queue_size)
+        self.raw_records = []
+        self.transformed = []
+        self.batch_stats = []
+        self.unchanged_pages = set()
+        self.upstream_changed = False
+        self.error = None
+
+    def _fail(self, stage: str, error: Exception):
+        logger.error(f"Pipelined {stage} failed: {str(error)}")
+        if self.error is None:
+            self.error = error
+
+    def _archive(self, data, prefix: str, bucket_env: str, format_env: str, default_format: str):
+        try:
+            store = get_object_store(os.getenv(bucket_env), get_s3_client())
+            self.uploader.submit(store, data, prefix, get_serializer(os.getenv(format_env, default_format)))
+        except Exception as e:
+            logger.error(f"Failed to queue {prefix} for archival: {str(e)}")
+
+    def extract_loop(self):
+        seen = set()
+        try:
+            with ThreadPoolExecutor(max_workers=min(self.client.max_concurrency, self.pages)) as executor:
+                futures = [
+                    executor.submit(self.client.fetch_markets_page_if_changed, page, self.per_page)
+                    for page in range(1, self.pages + 1)
+                ]
+                for page, future in enumerate(futures, start=1):
+                    try:
+                        records, changed = future.result()
+                    except requests.RequestException as e:
+                        logger.error(f"Failed to fetch markets page {page}: {str(e)}")
+                        continue
+                    if changed:
+                        self.upstream_changed = True
+                    else:
+                        self.unchanged_pages.add(page)
+                    fetched_at = pd.Timestamp.now(tz='UTC')
+                    # Coins that moved across a page boundary between requests keep their first page
+                    records = [r for r in records if r.get('id') not in seen]
+                    seen.update(r.get('id') for r in records)
+                    if records and self.error is None:
+                        self.raw_records.extend(records)
+                        self.raw_batches.put(Batch(page, fetched_at, apply_market_dtypes(pd.DataFrame(records))))
+            if self.raw_records:
+                record_json_parse(self.client.drain_transfer(), len(self.raw_records))
+                self.client.changes.record_poll(self.upstream_changed)
+                record_change_detection(self.upstream_changed, len(self.unchanged_pages), self.client.changes)
+            if self.raw_records and self.upstream_changed:
+                self._archive(self.raw_records, 'raw_crypto_data', 'AWS_S3_BUCKET_RAW', 'RAW_FORMAT', 'json')
+                cache_raw_response(self.raw_records)
+        except Exception as e:
+            self._fail('extract', e)
+        finally:
+            self.raw_batches.put(_STOP)
+
+    def transform_loop(self):
+        while True:
+            batch = self.raw_batches.get()
+            if batch is _STOP:
+                self.transformed_batches.put(_STOP)
+                return
+            if self.error is not None:
+                continue
+            try:
+                data = transform_market_data(batch.data, cross_row=False)
+                self.transformed.append(data)
+                self.transformed_batches.put(batch._replace(data=data))
+            except Exception as e:
+                self._fail('transform', e)
+
+    def load_loop(self):
+        while True:
+            batch = self.transformed_batches.get()
+            if batch is _STOP:
+                return
+            # The previous run already loaded this exact page
+            if self.error is not None or batch.seq in self.unchanged_pages:
+                continue
+            try:
+                # Dominance needs the whole market and is set once all pages are in
+                data = batch.data.drop(columns=['market_dominance'], errors='ignore')
+                with db_connection() as conn:
+                    stats, _ = upsert_crypto_data(conn, data, self.incremental)
+                stats['batch'] = batch.seq
+                stats['fetch_to_visible_seconds'] = round(
+                    (pd.Timestamp.now(tz='UTC') - batch.fetched_at).total_seconds(), 3
+                )
+                self.batch_stats.append(stats)
+            except Exception as e:
+                self._fail('load', e)
+
+    def run(self) -> pd.DataFrame:
+        """Run the overlapped stages to completion and return the fully transformed frame."""
+        threads = [
+            threading.Thread(target=self.extract_loop, name='pipeline-extract', daemon=True),
+            threading.Thread(target=self.transform_loop, name='pipeline-transform', daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            self.load_loop()
+            for thread in threads:
+                thread.join()
+            if self.error is not None:
+                raise self.error
+            if not self.transformed:
+                logger.error("Failed to fetch any market pages")
+                return pd.DataFrame()
+
+            data = finalize_batches(self.transformed)
+            if not self.upstream_changed:
+                data.attrs['upstream_unchanged'] = True
+                logger.info("No page changed upstream; skipped loads, rollups and archival")
+                return data
+            with db_connection() as conn:
+                update_market_metrics(conn, data)
+                if self.rollups:
+                    # Category candles need the whole market, so they are merged once per run
+                    update_rollups(conn, data)
+            self._archive(data, 'transformed_crypto_data', 'AWS_S3_BUCKET_PROCESSED', 'PROCESSED_FORMAT', 'csv')
+        finally:
+            keys = self.uploader.close()
+            self.client.close()
+        logger.info(f"Pipelined run loaded {len(data)} coins in {len(self.batch_stats)} batches; archived {keys}")
+        return data
+
+    def totals(self) -> dict:
+        """Load stats summed over batches, with the worst freshness seen."""
+        totals = {
+            key: sum(stats[key] for stats in self.batch_stats)
+            for key in ('rows_received', 'rows_skipped', 'rows_written')
+        }
+        for key in ('freshness_max_seconds', 'fetch_to_visible_seconds'):
+            values = [stats[key] for stats in self.batch_stats if stats.get(key) is not None]
+            totals[key] = max(values) if values else None
+        return totals
+
+
+@task(name="Pipelined Extract, Transform and Load")
+def pipelined_etl_task(pages: int = 1, per_page: int = 10, max_concurrency: int = None, incremental: bool = False,
+                       rollups: bool = True):
+    run = PipelinedRun(pages, per_page, max_concurrency=max_concurrency, incremental=incremental, rollups=rollups)
+    data = run.run()
+    if data.empty or data.attrs.get('upstream_unchanged'):
+        return data
+
+    create_dataframe_artifact("loaded-data", data, "Data loaded into RDS database", max_rows=10)
+    create_table_artifact(
+        key="load-stats",
+        table=[run.totals()],
+        description="Rows written versus skipped as unchanged by the RDS load"
+    )
+    create_table_artifact(
+        key="pipeline-batches",
+        table=run.batch_stats,
+        description="Per-page load stats and freshness (CoinGecko last_updated and fetch time to row visible in RDS)"
+    )
+    return data
@@ -0,0 +1,276 @@
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import resource
+import threading
+import time
+import tracemalloc
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_METRICS = {
+    'wall_seconds': "Wall-clock time spent in the stage",
+    'cpu_seconds': "CPU time of the thread that ran the stage, excluding work handed to other threads",
+    'runs': "Times the stage ran; the other metrics aggregate over these runs",
+    'peak_memory_bytes': "Peak traced Python heap during the stage, recorded only when profiling",
+    'process_peak_rss_bytes': "Process RSS high-water mark since start as of the end of the stage, not a per-stage figure",
+    'rows': "Rows processed by the stage",
+    'bytes': "Bytes moved by the stage",
+    'rows_per_second': "Stage throughput in rows per second",
+    'freshness_p50_seconds': "Median seconds from CoinGecko last_updated to the row being committed to RDS",
+    'freshness_max_seconds': "Worst seconds from CoinGecko last_updated to the row being committed to RDS",
+    'upstream_changed': "1 when the CoinGecko poll returned new data, 0 when it matched the previous poll",
+    'pages_unchanged': "Pages answered 304 Not Modified or with a body identical to the previous poll",
+    'skip_rate': "Share of CoinGecko polls skipped because nothing changed upstream",
+    'frame_bytes': "Memory held by the DataFrame the stage produced, including strings in object columns",
+    'requests': "HTTP requests made to the endpoint, counting each call once whatever its retries",
+    'errors': "HTTP requests to the endpoint that still failed after retries",
+    'latency_p50_seconds': "Median seconds per call to the endpoint, including rate-limit waits and retries",
+    'latency_max_seconds': "Slowest call to the endpoint in seconds, including rate-limit waits and retries",
+}
+
+
+# How repeated records of one stage (per page, per archive, per lap) combine into its series;
+# metrics not listed keep the value of the stage's latest record
+PROMETHEUS_AGGREGATES = {
+    'wall_seconds': sum, 'cpu_seconds': sum, 'rows': sum, 'bytes': sum, 'requests': sum, 'errors': sum,
+    'pages_unchanged': sum, 'peak_memory_bytes': max, 'process_peak_rss_bytes': max, 'frame_bytes': max,
+    'freshness_max_seconds': max, 'latency_max_seconds': max,
+}
+
+
+def _peak_rss_bytes() -> int:
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _memory_metric() -> dict:
+    """Per-stage traced peak when tracemalloc runs; otherwise only the process-lifetime RSS peak is known."""
+    if tracemalloc.is_tracing():
+        return {'peak_memory_bytes': tracemalloc.get_traced_memory()[1]}
+    return {'process_peak_rss_bytes': _peak_rss_bytes()}
+
+
+def aggregate_stages(records) -> dict:
+    """One combined record per stage name, in first-seen order, for exports that need unique series."""
+    stages = {}
+    for record in records:
+        stages.setdefault(record['stage'], []).append(record)
+    combined = {}
+    for stage, runs in stages.items():
+        row = {'runs': len(runs)}
+        for metric in PROMETHEUS_METRICS:
+            values = [run[metric] for run in runs if run.get(metric) is not None]
+            if values:
+                row[metric] = PROMETHEUS_AGGREGATES.get(metric, lambda v: v[-1])(values)
+        if row.get('rows') is not None and row.get('wall_seconds'):
+            row['rows_per_second'] = round(row['rows'] / row['wall_seconds'], 2)
+        for metric in ('wall_seconds', 'cpu_seconds'):
+            if metric in row:
+                row[metric] = round(row[metric], 6)
+        combined[stage] = row
+    return combined
+
+
+class StageRecord(dict):
+    """Measurements for one stage; `rows` and `bytes` may be filled in while the stage runs."""
+
+    @property
+    def rows(self):
+        return self.get('rows')
+
+    @rows.setter
+    def rows(self, value):
+        self['rows'] = value
+
+    @property
+    def bytes(self):
+        return self.get('bytes')
+
+    @bytes.setter
+    def bytes(self, value):
+        self['bytes'] = value
+
+
+class StepTimer:
+    """Times consecutive steps of one stage; each `lap` records the time since the previous one."""
+
+    def __init__(self, recorder, prefix: str, rows: Optional[int] = None):
+        self.recorder = recorder
+        self.prefix = prefix
+        self.rows = rows
+        self._start()
+
+    def _start(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+
+    def lap(self, name: str, rows: Optional[int] = None):
+        record = self.recorder.add(
+            f"{self.prefix}.{name}",
+            wall_seconds=time.perf_counter() - self.wall,
+            cpu_seconds=time.thread_time() - self.cpu,
+            rows=rows if rows is not None else self.rows,
+        )
+        self._start()
+        return record
+
+
+class StageRecorder:
+    """Collects wall time, CPU time, peak memory, rows and bytes for each pipeline stage.
+
+    With profiling enabled, tracemalloc traces allocations and the outermost stage on each thread
+    runs under cProfile, so hot paths in Prefect task threads are captured too.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records = []
+        self.profiles = []
+        self.profiling = False
+        self.local = threading.local()
+
+    def reset(self):
+        with self.lock:
+            self.records = []
+            self.profiles = []
+
+    def drain(self):
+        """Return the records collected so far and start a fresh list, for long-running processes."""
+        with self.lock:
+            records, self.records = self.records, []
+        return records
+
+    def add(self, stage: str, wall_seconds: float, cpu_seconds: float, rows=None, bytes=None):
+        record = StageRecord(
+            stage=stage,
+            wall_seconds=round(wall_seconds, 6),
+            cpu_seconds=round(cpu_seconds, 6),
+            **_memory_metric(),
+            rows=rows,
+            bytes=bytes,
+        )
+        self._finish(record)
+        return record
+
+    def _finish(self, record):
+        if record.rows is not None and record['wall_seconds'] > 0:
+            record['rows_per_second'] = round(record.rows / record['wall_seconds'], 2)
+        with self.lock:
+            self.records.append(record)
+
+    @contextmanager
+    def stage(self, name: str, rows: Optional[int] = None, bytes: Optional[int] = None):
+        """Measure the enclosed block as stage `name`."""
+        record = StageRecord(stage=name, rows=rows, bytes=bytes)
+        depth = getattr(self.local, 'depth', 0)
+        profiler = cProfile.Profile() if self.profiling and depth == 0 else None
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.thread_time()
+        self.local.depth = depth + 1
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+                with self.lock:
+                    self.profiles.append(profiler)
+            self.local.depth = depth
+            record['wall_seconds'] = round(time.perf_counter() - wall, 6)
+            record['cpu_seconds'] = round(time.thread_time() - cpu, 6)
+            record.update(_memory_metric())
+            self._finish(record)
+
+    def steps(self, prefix: str, rows: Optional[int] = None) -> StepTimer:
+        return StepTimer(self, prefix, rows)
+
+    def to_jsonl(self, run_at: Optional[str] = None, records=None) -> str:
+        run_at = run_at or datetime.now(timezone.utc).isoformat()
+        with self.lock:
+            records = list(self.records if records is None else records)
+        return ''.join(json.dumps({'run_at': run_at, **record}) + '\n' for record in records)
+
+    def to_prometheus(self, records=None) -> str:
+        """Metrics in the Prometheus text exposition format, one gauge family per measurement.
+
+        A stage recorded several times in the run (per page, per archive) is exported as one
+        series per metric, aggregated by PROMETHEUS_AGGREGATES, since duplicate series make
+        Prometheus reject the whole scrape.
+        """
+        with self.lock:
+            records = list(self.records if records is None else records)
+        stages = aggregate_stages(records)
+        lines = []
+        for metric, help_text in PROMETHEUS_METRICS.items():
+            name = f"etl_stage_{metric}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for stage, row in stages.items():
+                if row.get(metric) is not None:
+                    lines.append(f'{name}{{stage="{stage}"}} {row[metric]}')
+        return '\n'.join(lines) + '\n'
+
+    def enable_profiling(self):
+        self.profiling = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+
+    def dump_profiles(self, output_dir: str) -> Path:
+        """Write the merged cProfile stats and the top tracemalloc allocations to `output_dir`."""
+        output = Path(output_dir)
+        output.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+
+        with self.lock:
+            profiles = list(self.profiles)
+        if profiles:
+            stats = pstats.Stats(profiles[0])
+            for profile in profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(output / f"profile_{stamp}.prof")
+            text = io.StringIO()
+            pstats.Stats(str(output / f"profile_{stamp}.prof"), stream=text).sort_stats('cumulative').print_stats(40)
+            (output / f"profile_{stamp}.txt").write_text(text.getvalue())
+
+        if tracemalloc.is_tracing():
+            top = tracemalloc.take_snapshot().statistics('lineno')[:30]
+            (output / f"tracemalloc_{stamp}.txt").write_text('\n'.join(str(stat) for stat in top) + '\n')
+            tracemalloc.stop()
+        self.profiling = False
+        logger.info(f"Profiles written to {output}")
+        return output
+
+
+recorder = StageRecorder()
+
+
+def write_metrics(jsonl_path: Optional[str] = None, prometheus_path: Optional[str] = None, records=None):
+    """Append the run's stage metrics as JSON lines and/or write a Prometheus textfile.
+
+    Paths default to ETL_METRICS_JSONL and ETL_METRICS_PROM; unset paths are skipped. `records`
+    defaults to everything the recorder holds.
+    """
+    jsonl_path = jsonl_path or os.getenv('ETL_METRICS_JSONL')
+    prometheus_path = prometheus_path or os.getenv('ETL_METRICS_PROM')
+    if jsonl_path:
+        with open(jsonl_path, 'a') as f:
+            f.write(recorder.to_jsonl(records=records))
+    if prometheus_path:
+        # Write then rename so a scraping textfile collector never sees a partial file
+        tmp_path = f"{prometheus_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(recorder.to_prometheus(records))
+        os.replace(tmp_path, prometheus_path)
@@ -0,0 +1,179 @@
+import pandas as pd
+from dotenv import load_dotenv
+from datetime import datetime
+from hashlib import sha256
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Union
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+DEFAULT_MAX_AGE_DAYS = 35
+# Eviction walks the whole cache, so writers run it at most this often
+EVICT_INTERVAL_SECONDS = 300
+
+TIMESTAMP_FORMAT = '%Y%m%dT%H%M%S%f'
+
+
+def naive_utc(value: Optional[datetime] = None) -> pd.Timestamp:
+    """`value` (default now) as a naive UTC timestamp; naive inputs are taken to be UTC already."""
+    value = pd.Timestamp(value) if value is not None else pd.Timestamp.now(tz='UTC')
+    return value.tz_convert('UTC').tz_localize(None) if value.tzinfo is not None else value
+
+
+class Snapshot(NamedTuple):
+    fetched_at: pd.Timestamp
+    digest: str
+
+
+class RawCache:
+    """Content-addressed on-disk cache of raw /coins/markets responses.
+
+    Each response is stored once under the SHA-256 of its JSON (`objects/ab/abcd....json.gz`),
+    and every fetch adds a small index entry `index/YYYY-MM-DD/<fetched_at>_<digest>` pointing
+    at it, so unchanged responses cost one empty file. Index entries older than `max_age_days`
+    are evicted, then the oldest until the objects fit in `max_bytes`; objects no entry
+    points at are deleted.
+    """
+
+    def __init__(self, root: Union[str, Path], max_bytes: Optional[int] = None, max_age_days: Optional[float] = None):
+        self.root = Path(root)
+        # An explicit 0 is a limit, not "unset"
+        if max_bytes is None:
+            max_bytes = int(os.getenv('RAW_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+        if max_age_days is None:
+            max_age_days = float(os.getenv('RAW_CACHE_MAX_AGE_DAYS', DEFAULT_MAX_AGE_DAYS))
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.lock = threading.RLock()
+        self.evicted_at = 0.0
+
+    def object_path(self, digest: str) -> Path:
+        return self.root / 'objects' / digest[:2] / f'{digest}.json.gz'
+
+    def _index_path(self, snapshot: Snapshot) -> Path:
+        return self.root / 'index' / f'{snapshot.fetched_at:%Y-%m-%d}' / (
+            f'{snapshot.fetched_at.strftime(TIMESTAMP_FORMAT)}_{snapshot.digest}'
+        )
+
+    @staticmethod
+    def _write(path: Path, body: bytes):
+        # Write then rename, so readers in other processes never see a partial file
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f'.{path.name}.{os.getpid()}.{threading.get_ident()}')
+        tmp.write_bytes(body)
+        os.replace(tmp, path)
+
+    def put(self, records: list, fetched_at: Optional[datetime] = None) -> Snapshot:
+        """Store one raw response fetched at `fetched_at` (UTC, default now)."""
+        body = json.dumps(records, separators=(',', ':'), sort_keys=True).encode('utf-8')
+        snapshot = Snapshot(naive_utc(fetched_at), sha256(body).hexdigest())
+        compressed = gzip.compress(body, compresslevel=6)
+        # Held so an eviction cannot take the object before its index entry exists
+        with self.lock:
+            path = self.object_path(snapshot.digest)
+            if not path.exists():
+                self._write(path, compressed)
+            self._write(self._index_path(snapshot), b'')
+
+            if time.monotonic() - self.evicted_at >= EVICT_INTERVAL_SECONDS:
+                self.evict()
+        return snapshot
+
+    def get(self, digest: str) -> list:
+        return json.loads(gzip.decompress(self.object_path(digest).read_bytes()))
+
+    def snapshots(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Snapshot]:
+        """Cached fetches with `start <= fetched_at < end` (naive UTC), oldest first."""
+        start = naive_utc(start) if start is not None else None
+        end = naive_utc(end) if end is not None else None
+        index = self.root / 'index'
+        if not index.exists():
+            return []
+        found = []
+        for day in sorted(index.iterdir()):
+            # Skip whole days outside the range without listing them
+            if start is not None and day.name < f'{start:%Y-%m-%d}':
+                continue
+            if end is not None and day.name > f'{end:%Y-%m-%d}':
+                break
+            for entry in day.iterdir():
+                stamp, _, digest = entry.name.partition('_')
+                if not digest or stamp.startswith('.'):
+                    continue
+                fetched_at = pd.Timestamp(datetime.strptime(stamp, TIMESTAMP_FORMAT))
+                if (start is None or fetched_at >= start) and (end is None or fetched_at < end):
+                    found.append(Snapshot(fetched_at, digest))
+        return sorted(found)
+
+    def evict(self, now: Optional[datetime] = None) -> dict:
+        """Apply the age and size limits; returns how many index entries and objects were removed."""
+        with self.lock:
+            self.evicted_at = time.monotonic()
+            now = naive_utc(now)
+            snapshots = self.snapshots()
+            cutoff = now - pd.Timedelta(days=self.max_age_days)
+            expired = [snapshot for snapshot in snapshots if snapshot.fetched_at < cutoff]
+            kept = snapshots[len(expired):]
+
+            sizes = {}
+            objects = self.root / 'objects'
+            for path in objects.glob('*/*.json.gz') if objects.exists() else []:
+                sizes[path.name.split('.')[0]] = path.stat().st_size
+            # Newest entries claim their objects first; everything past the budget goes
+            total, keep_digests = 0, set()
+            for i in range(len(kept) - 1, -1, -1):
+                digest = kept[i].digest
+                if digest not in keep_digests:
+                    if total + sizes.get(digest, 0) > self.max_bytes:
+                        expired.extend(kept[:i + 1])
+                        break
+                    total += sizes.get(digest, 0)
+                    keep_digests.add(digest)
+
+            for snapshot in expired:
+                self._index_path(snapshot).unlink(missing_ok=True)
+            orphans = [digest for digest in sizes if digest not in keep_digests]
+            for digest in orphans:
+                self.object_path(digest).unlink(missing_ok=True)
+            for day in (self.root / 'index').iterdir() if (self.root / 'index').exists() else []:
+                if day.is_dir() and not any(day.iterdir()):
+                    day.rmdir()
+
+        if expired or orphans:
+            logger.info(f"Raw cache evicted {len(expired)} snapshots and {len(orphans)} objects; {total} bytes kept")
+        return {'snapshots_evicted': len(expired), 'objects_evicted': len(orphans), 'bytes_kept': total}
+
+
+_cache = {'value': None}
+
+
+def get_raw_cache() -> Optional[RawCache]:
+    """The process-wide cache under RAW_CACHE_DIR, or None when caching is not configured."""
+    root = os.getenv('RAW_CACHE_DIR')
+    if not root:
+        return None
+    if _cache['value'] is None or _cache['value'].root != Path(root):
+        _cache['value'] = RawCache(root)
+    return _cache['value']
+
+
+def cache_raw_response(records: list, fetched_at: Optional[datetime] = None) -> Optional[Snapshot]:
+    """Add a raw response to the local cache when RAW_CACHE_DIR is set; failures are only logged."""
+    cache = get_raw_cache()
+    if cache is None or not records:
+        return None
+    try:
+        return cache.put(records, fetched_at)
+    except Exception as e:
+        logger.error(f"Failed to cache raw response: {str(e)}")
+        return None
@@ -0,0 +1,222 @@
+"""Backfill/replay: re-run transform and load over raw CoinGecko snapshots from a time range.
+
+Snapshots come from the local raw cache (RAW_CACHE_DIR) or from the raw archive bucket
+(AWS_S3_BUCKET_RAW, or OBJECT_STORE_ROOT locally), and are processed one file per task on a
+pool of worker processes:
+
+    python -m etl_pipeline.replay --start 2024-06-01 --end 2024-07-01 --source archive --workers 8
+"""
+import pandas as pd
+from psycopg2 import errors
+from dotenv import load_dotenv
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from io import BytesIO
+from typing import List, NamedTuple, Optional
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import re
+import time
+from etl_pipeline import history as history_module, rollups as rollups_module
+from etl_pipeline.extract_load import upsert_crypto_data
+from etl_pipeline.history import ensure_partitions, load_history_task
+from etl_pipeline.raw_cache import RawCache, get_raw_cache, naive_utc
+from etl_pipeline.resources import db_connection, get_s3_client
+from etl_pipeline.rollups import CREATE_ROLLUP_TABLES, update_rollups
+from etl_pipeline.schema import ensure_schema
+from etl_pipeline.storage import get_object_store
+from etl_pipeline.transform import transform_market_data
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Keys written by `archive` for raw snapshots, flat or Hive-partitioned
+ARCHIVE_KEY_PATTERN = re.compile(r'raw_crypto_data_(\d{14})\.(json|csv|parquet)$')
+
+# Workers loading overlapping coins can deadlock on row locks; the loser retries
+DEADLOCK_RETRIES = 3
+
+
+class ReplayFile(NamedTuple):
+    fetched_at: pd.Timestamp
+    source: str  # 'cache' or 'archive'
+    location: str  # cache root or bucket
+    key: str  # content digest or object key
+
+
+def cached_files(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                 cache: Optional[RawCache] = None) -> List[ReplayFile]:
+    cache = cache or get_raw_cache()
+    if cache is None:
+        raise ValueError("RAW_CACHE_DIR is not set")
+    return [
+        ReplayFile(snapshot.fetched_at, 'cache', str(cache.root), snapshot.digest)
+        for snapshot in cache.snapshots(start, end)
+    ]
+
+
+def _archive_store(bucket: str):
+    return get_object_store(bucket, None if os.getenv('OBJECT_STORE_ROOT') else get_s3_client())
+
+
+def archived_files(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                   bucket: Optional[str] = None) -> List[ReplayFile]:
+    """Raw snapshots in the archive bucket with `start <= timestamp < end`, oldest first."""
+    bucket = bucket or os.getenv('AWS_S3_BUCKET_RAW')
+    start = naive_utc(start) if start is not None else None
+    end = naive_utc(end) if end is not None else None
+    files = []
+    for key in _archive_store(bucket).list('raw_crypto_data'):
+        match = ARCHIVE_KEY_PATTERN.search(key)
+        if not match:
+            continue
+        fetched_at = pd.Timestamp(datetime.strptime(match.group(1), '%Y%m%d%H%M%S'))
+        if (start is None or fetched_at >= start) and (end is None or fetched_at < end):
+            files.append(ReplayFile(fetched_at, 'archive', bucket, key))
+    return sorted(files)
+
+
+def read_raw(file: ReplayFile) -> pd.DataFrame:
+    """The raw /coins/markets frame stored in a cached or archived snapshot."""
+    if file.source == 'cache':
+        return pd.DataFrame(RawCache(file.location).get(file.key))
+    body = _archive_store(file.location).get(file.key)
+    extension = file.key.rsplit('.', 1)[-1]
+    if extension == 'json':
+        return pd.DataFrame(json.loads(body))
+    if extension == 'parquet':
+        return pd.read_parquet(BytesIO(body))
+    return pd.read_csv(BytesIO(body), index_col=0)
+
+
+def _init_worker(partitions):
+    # Per-column quality logging for every replayed file would swamp the output
+    logging.getLogger('etl_pipeline.transform').setLevel(logging.WARNING)
+    # prepare_replay already ran the DDL; workers repeating it would contend for table locks
+    rollups_module._tables_ready = True
+    history_module._known_partitions.update(partitions)
+
+
+def replay_file(file: ReplayFile, history: bool = True, rollups: bool = True) -> dict:
+    """Transform one snapshot and load it; runs in a worker process with its own connection.
+
+    Rows only overwrite crypto_data when their last_updated is newer, so files can be loaded in
+    any order and the table ends at the latest state.
+    """
+    started = time.perf_counter()
+    result = {'fetched_at': file.fetched_at.isoformat(), 'key': file.key, 'rows': 0, 'rows_written': 0, 'error': None}
+    try:
+        # Sorted by id so concurrent workers take row locks in the same order
+        data = transform_market_data(read_raw(file)).sort_values('id', ignore_index=True)
+        result['rows'] = len(data)
+        for attempt in range(DEADLOCK_RETRIES + 1):
+            try:
+                with db_connection() as conn:
+                    stats, _ = upsert_crypto_data(conn, data, incremental=True)
+                    if rollups:
+                        update_rollups(conn, data)
+                break
+            except errors.DeadlockDetected:
+                if attempt == DEADLOCK_RETRIES:
+                    raise
+        result['rows_written'] = stats['rows_written']
+        if history:
+            load_history_task.fn(data)
+    except Exception as e:
+        result['error'] = str(e)
+        logger.error(f"Replay of {file.key} failed: {str(e)}")
+    result['seconds'] = round(time.perf_counter() - started, 4)
+    return result
+
+
+def prepare_replay(files: List[ReplayFile], history: bool = True, rollups: bool = True) -> set:
+    """Run the DDL the workers would otherwise race on: table, migrations, rollup tables, partitions.
+
+    Returns the history partitions that now exist.
+    """
+    with db_connection() as conn:
+        ensure_schema(conn)
+        cur = conn.cursor()
+        try:
+            if rollups:
+                cur.execute(CREATE_ROLLUP_TABLES)
+            if history:
+                today = naive_utc().date()
+                ahead = int(os.getenv('HISTORY_PARTITIONS_AHEAD', 3))
+                days = {today + timedelta(days=i) for i in range(ahead + 1)}
+                # Coins' last_updated can trail the fetch time across midnight
+                for file in files:
+                    days.update({file.fetched_at.date(), (file.fetched_at - timedelta(days=1)).date()})
+                ensure_partitions(cur, days)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+    return set(history_module._known_partitions)
+
+
+def replay(start: Optional[datetime] = None, end: Optional[datetime] = None, source: str = 'cache',
+           workers: Optional[int] = None, history: bool = True, rollups: bool = True) -> dict:
+    """Replay every snapshot from `source` ('cache' or 'archive') in [start, end) on `workers` processes."""
+    files = cached_files(start, end) if source == 'cache' else archived_files(start, end)
+    summary = {'files': len(files), 'replayed': 0, 'failed': 0, 'rows': 0, 'rows_written': 0}
+    if not files:
+        logger.warning(f"No {source} snapshots between {start} and {end}")
+        return summary
+
+    workers = workers or int(os.getenv('REPLAY_WORKERS', os.cpu_count() or 1))
+    partitions = prepare_replay(files, history, rollups)
+    logger.info(f"Replaying {len(files)} {source} snapshots from {files[0].fetched_at} to "
+                f"{files[-1].fetched_at} on {workers} processes")
+
+    started = time.perf_counter()
+    # Spawned rather than forked, so no worker inherits the parent's database connection
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(partitions,)) as executor:
+        chunksize = max(1, min(32, len(files) // (workers * 4)))
+        for result in executor.map(partial(replay_file, history=history, rollups=rollups), files, chunksize=chunksize):
+            if result['error']:
+                summary['failed'] += 1
+            else:
+                summary['replayed'] += 1
+                summary['rows'] += result['rows']
+                summary['rows_written'] += result['rows_written']
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    summary['files_per_second'] = round(len(files) / summary['seconds'], 2) if summary['seconds'] else None
+    logger.info(f"Replay finished: {summary}")
+    return summary
+
+
+def run_replay():
+    """Replay configured by REPLAY_START, REPLAY_END, REPLAY_SOURCE and REPLAY_WORKERS."""
+    return replay(
+        start=os.getenv('REPLAY_START'),
+        end=os.getenv('REPLAY_END'),
+        source=os.getenv('REPLAY_SOURCE', 'cache'),
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--start', help="first fetch time to replay (UTC, inclusive)")
+    parser.add_argument('--end', help="fetch time to stop at (UTC, exclusive)")
+    parser.add_argument('--source', choices=['cache', 'archive'], default='cache')
+    parser.add_argument('--workers', type=int, help="worker processes (default: REPLAY_WORKERS or CPU count)")
+    parser.add_argument('--no-history', action='store_true', help="skip the price history append")
+    parser.add_argument('--no-rollups', action='store_true', help="skip the candle rollups")
+    args = parser.parse_args(argv)
+    summary = replay(args.start, args.end, args.source, args.workers,
+                     history=not args.no_history, rollups=not args.no_rollups)
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
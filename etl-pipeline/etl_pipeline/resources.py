@@ -0,0 +1,178 @@
+from prefect_aws import AwsCredentials
+import boto3
+import psycopg2
+from psycopg2 import extensions
+from dotenv import load_dotenv
+from contextlib import contextmanager
+import logging
+import os
+import threading
+import time
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+AWS_CREDENTIALS_BLOCK = "my-aws-creds"
+AWS_REGION = 'ap-southeast-2'  # Make sure this is your correct AWS region
+
+# Refresh cached credentials this long before they are due to expire
+EXPIRY_MARGIN_SECONDS = 60
+
+
+class ResourceMetrics:
+    """Counts how often each shared resource was built versus reused, and what building cost."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def _entry(self, name):
+        return self.stats.setdefault(name, {'created': 0, 'reused': 0, 'setup_seconds': 0.0})
+
+    def created(self, name: str, seconds: float):
+        with self.lock:
+            entry = self._entry(name)
+            entry['created'] += 1
+            entry['setup_seconds'] += seconds
+
+    def reused(self, name: str):
+        with self.lock:
+            self._entry(name)['reused'] += 1
+
+    def report(self):
+        """One row per resource, estimating the setup time saved as reuses x average setup cost."""
+        with self.lock:
+            return [
+                {
+                    'resource': name,
+                    'created': entry['created'],
+                    'reused': entry['reused'],
+                    'setup_seconds': round(entry['setup_seconds'], 4),
+                    'saved_seconds': round(entry['reused'] * entry['setup_seconds'] / max(entry['created'], 1), 4),
+                }
+                for name, entry in self.stats.items()
+            ]
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+
+
+metrics = ResourceMetrics()
+
+_lock = threading.RLock()
+_credentials = {'value': None, 'expires_at': 0.0}
+_s3 = {'client': None, 'credentials': None}
+_db = {'conn': None, 'checked_at': 0.0}
+_db_lock = threading.RLock()
+
+
+def get_aws_credentials() -> AwsCredentials:
+    """AwsCredentials block loaded once and refreshed when its TTL (AWS_CREDENTIALS_TTL) runs out."""
+    with _lock:
+        if _credentials['value'] is not None and time.monotonic() < _credentials['expires_at'] - EXPIRY_MARGIN_SECONDS:
+            metrics.reused('aws_credentials')
+            return _credentials['value']
+
+        start = time.perf_counter()
+        aws_credentials = AwsCredentials.load(AWS_CREDENTIALS_BLOCK)
+        metrics.created('aws_credentials', time.perf_counter() - start)
+        logger.info(f"AWS Access Key ID: {aws_credentials.aws_access_key_id[:5]}...")
+
+        _credentials['value'] = aws_credentials
+        _credentials['expires_at'] = time.monotonic() + float(os.getenv('AWS_CREDENTIALS_TTL', 900))
+        return aws_credentials
+
+
+def invalidate_aws_credentials():
+    """Force the next caller to reload credentials, e.g. after an ExpiredToken error."""
+    with _lock:
+        _credentials['value'] = None
+        _s3['client'] = None
+
+
+def get_s3_client():
+    """S3 client shared across tasks and flow runs, rebuilt only when the credentials are refreshed."""
+    with _lock:
+        aws_credentials = get_aws_credentials()
+        if _s3['client'] is not None and _s3['credentials'] is aws_credentials:
+            metrics.reused('s3_client')
+            return _s3['client']
+
+        start = time.perf_counter()
+        session_token = getattr(aws_credentials, 'aws_session_token', None)
+        client = boto3.client(
+            's3',
+            aws_access_key_id=aws_credentials.aws_access_key_id,
+            aws_secret_access_key=aws_credentials.aws_secret_access_key.get_secret_value(),
+            aws_session_token=session_token,
+            region_name=AWS_REGION
+        )
+        metrics.created('s3_client', time.perf_counter() - start)
+
+        _s3['client'] = client
+        _s3['credentials'] = aws_credentials
+        return client
+
+
+def _connection_usable(conn) -> bool:
+    if conn is None or conn.closed:
+        return False
+    if conn.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    if time.monotonic() - _db['checked_at'] < float(os.getenv('DB_HEALTH_CHECK_INTERVAL', 30)):
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+@contextmanager
+def db_connection():
+    """Persistent RDS connection shared by the load tasks; callers hold it exclusively in the block.
+
+    The connection is opened on first use, health-checked when it has been idle for
+    DB_HEALTH_CHECK_INTERVAL seconds and reopened if broken. Callers commit or roll back
+    themselves; a connection left in a failed state is replaced on the next checkout.
+    """
+    with _db_lock:
+        conn = _db['conn']
+        if _connection_usable(conn):
+            metrics.reused('db_connection')
+        else:
+            if conn is not None and not conn.closed:
+                conn.close()
+            start = time.perf_counter()
+            conn = psycopg2.connect(
+                host=os.getenv('RDS_HOST'),
+                database=os.getenv('RDS_DB_NAME'),
+                user=os.getenv('RDS_USERNAME'),
+                password=os.getenv('RDS_PASSWORD')
+            )
+            metrics.created('db_connection', time.perf_counter() - start)
+            _db['conn'] = conn
+
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            conn.close()
+            _db['conn'] = None
+            raise
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        _db['checked_at'] = time.monotonic()
+
+
+def close_db_connection():
+    with _db_lock:
+        if _db['conn'] is not None and not _db['conn'].closed:
+            _db['conn'].close()
+        _db['conn'] = None
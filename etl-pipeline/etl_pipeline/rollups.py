@@ -0,0 +1,266 @@
+import pandas as pd
+from prefect import task
+from psycopg2 import sql
+from dotenv import load_dotenv
+from datetime import datetime, timedelta, timezone
+import logging
+import os
+from etl_pipeline.copy_writer import FLOAT8, TEXT, TIMESTAMP, copy_dataframe
+from etl_pipeline.profiling import recorder
+from etl_pipeline.resources import db_connection
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+COIN_CANDLES_TABLE = "coin_candles"
+CATEGORY_CANDLES_TABLE = "category_candles"
+
+# Candle width -> date_trunc unit, and how long candles of that width are kept by default
+INTERVALS = {'1m': 'minute', '1h': 'hour', '1d': 'day'}
+DEFAULT_RETENTION_DAYS = {'1m': 7, '1h': 180, '1d': None}
+
+# Upper edges of the volatility histogram bins; the last bin is open-ended
+VOLATILITY_BINS = [0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0]
+
+STAGING_COLUMNS = [
+    'id', 'last_updated', 'current_price', 'market_cap', 'total_volume', 'market_dominance',
+    'volatility', 'market_cap_category'
+]
+# pg_type OIDs of rollup_staging, so the binary COPY needs no lookup
+STAGING_TYPES = dict(zip(STAGING_COLUMNS, [TEXT, TIMESTAMP, FLOAT8, FLOAT8, FLOAT8, FLOAT8, FLOAT8, TEXT]))
+
+CREATE_ROLLUP_TABLES = f"""
+CREATE TABLE IF NOT EXISTS {COIN_CANDLES_TABLE} (
+    id TEXT NOT NULL,
+    width TEXT NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    opened_at TIMESTAMP NOT NULL,
+    closed_at TIMESTAMP NOT NULL,
+    open DOUBLE PRECISION,
+    high DOUBLE PRECISION,
+    low DOUBLE PRECISION,
+    close DOUBLE PRECISION,
+    market_cap DOUBLE PRECISION,
+    total_volume DOUBLE PRECISION,
+    market_dominance DOUBLE PRECISION,
+    volatility DOUBLE PRECISION,
+    samples INTEGER NOT NULL,
+    PRIMARY KEY (id, width, bucket_start)
+);
+CREATE INDEX IF NOT EXISTS {COIN_CANDLES_TABLE}_width_bucket_idx ON {COIN_CANDLES_TABLE} (width, bucket_start);
+CREATE TABLE IF NOT EXISTS {CATEGORY_CANDLES_TABLE} (
+    market_cap_category TEXT NOT NULL,
+    width TEXT NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    opened_at TIMESTAMP NOT NULL,
+    closed_at TIMESTAMP NOT NULL,
+    market_cap_open DOUBLE PRECISION,
+    market_cap_high DOUBLE PRECISION,
+    market_cap_low DOUBLE PRECISION,
+    market_cap_close DOUBLE PRECISION,
+    dominance_open DOUBLE PRECISION,
+    dominance_high DOUBLE PRECISION,
+    dominance_low DOUBLE PRECISION,
+    dominance_close DOUBLE PRECISION,
+    total_volume DOUBLE PRECISION,
+    avg_volatility DOUBLE PRECISION,
+    coins INTEGER,
+    volatility_histogram JSONB,
+    samples INTEGER NOT NULL,
+    PRIMARY KEY (market_cap_category, width, bucket_start)
+);
+"""
+
+INTERVALS_VALUES = "(VALUES " + ", ".join(f"('{name}', '{unit}')" for name, unit in INTERVALS.items()) + ") AS w(width, unit)"
+
+# Merging a new observation into an existing candle: high/low widen, open belongs to the
+# earliest observation and close (plus the point-in-time columns) to the latest one. Re-loading
+# an observation already merged leaves the candle unchanged.
+UPSERT_COIN_CANDLES = f"""
+INSERT INTO {COIN_CANDLES_TABLE} AS c (
+    id, width, bucket_start, opened_at, closed_at, open, high, low, close,
+    market_cap, total_volume, market_dominance, volatility, samples
+)
+SELECT id, w.width, date_trunc(w.unit, last_updated), last_updated, last_updated,
+       current_price, current_price, current_price, current_price,
+       market_cap, total_volume, market_dominance, volatility, 1
+FROM rollup_staging CROSS JOIN {INTERVALS_VALUES}
+WHERE last_updated IS NOT NULL AND current_price IS NOT NULL
+ON CONFLICT (id, width, bucket_start) DO UPDATE SET
+    high = GREATEST(c.high, excluded.high),
+    low = LEAST(c.low, excluded.low),
+    open = CASE WHEN excluded.opened_at < c.opened_at THEN excluded.open ELSE c.open END,
+    opened_at = LEAST(c.opened_at, excluded.opened_at),
+    close = CASE WHEN excluded.closed_at >= c.closed_at THEN excluded.close ELSE c.close END,
+    market_cap = CASE WHEN excluded.closed_at >= c.closed_at THEN excluded.market_cap ELSE c.market_cap END,
+    total_volume = CASE WHEN excluded.closed_at >= c.closed_at THEN excluded.total_volume ELSE c.total_volume END,
+    market_dominance = CASE WHEN excluded.closed_at >= c.closed_at
+                            THEN excluded.market_dominance ELSE c.market_dominance END,
+    volatility = CASE WHEN excluded.closed_at >= c.closed_at THEN excluded.volatility ELSE c.volatility END,
+    closed_at = GREATEST(c.closed_at, excluded.closed_at),
+    samples = c.samples + CASE WHEN excluded.closed_at > c.closed_at OR excluded.opened_at < c.opened_at
+                               THEN 1 ELSE 0 END
+"""
+
+
+def volatility_histogram_sql() -> str:
+    """jsonb array of {lower, upper, coins} built with one FILTER aggregate per bin."""
+    edges = [0.0] + VOLATILITY_BINS + [None]
+    bins = []
+    for lower, upper in zip(edges, edges[1:]):
+        condition = f"volatility >= {lower}" + (f" AND volatility < {upper}" if upper is not None else "")
+        upper_sql = 'NULL' if upper is None else str(upper)
+        bins.append(
+            f"jsonb_build_object('lower', {lower}, 'upper', {upper_sql}, 'coins', count(*) FILTER (WHERE {condition}))"
+        )
+    return "jsonb_build_array(" + ", ".join(bins) + ")"
+
+
+# One snapshot per load: the category totals as of the newest last_updated in the batch
+UPSERT_CATEGORY_CANDLES = f"""
+WITH snapshot AS (
+    SELECT market_cap_category,
+           sum(market_cap) AS market_cap,
+           sum(market_dominance) AS dominance,
+           sum(total_volume) AS total_volume,
+           avg(volatility) AS avg_volatility,
+           count(*) AS coins,
+           {volatility_histogram_sql()} AS volatility_histogram
+    FROM rollup_staging
+    WHERE market_cap_category IS NOT NULL
+    GROUP BY market_cap_category
+), observed AS (
+    SELECT max(last_updated) AS observed_at FROM rollup_staging
+)
+INSERT INTO {CATEGORY_CANDLES_TABLE} AS c (
+    market_cap_category, width, bucket_start, opened_at, closed_at,
+    market_cap_open, market_cap_high, market_cap_low, market_cap_close,
+    dominance_open, dominance_high, dominance_low, dominance_close,
+    total_volume, avg_volatility, coins, volatility_histogram, samples
+)
+SELECT market_cap_category, w.width, date_trunc(w.unit, observed_at), observed_at, observed_at,
+       market_cap, market_cap, market_cap, market_cap,
+       dominance, dominance, dominance, dominance,
+       total_volume, avg_volatility, coins, volatility_histogram, 1
+FROM snapshot CROSS JOIN observed CROSS JOIN {INTERVALS_VALUES}
+WHERE observed_at IS NOT NULL
+ON CONFLICT (market_cap_category, width, bucket_start) DO UPDATE SET
+    market_cap_high = GREATEST(c.market_cap_high, excluded.market_cap_high),
+    market_cap_low = LEAST(c.market_cap_low, excluded.market_cap_low),
+    dominance_high = GREATEST(c.dominance_high, excluded.dominance_high),
+    dominance_low = LEAST(c.dominance_low, excluded.dominance_low),
+    market_cap_open = CASE WHEN excluded.opened_at < c.opened_at THEN excluded.market_cap_open ELSE c.market_cap_open END,
+    dominance_open = CASE WHEN excluded.opened_at < c.opened_at THEN excluded.dominance_open ELSE c.dominance_open END,
+    opened_at = LEAST(c.opened_at, excluded.opened_at),
+    market_cap_close = CASE WHEN excluded.closed_at >= c.closed_at
+                            THEN excluded.market_cap_close ELSE c.market_cap_close END,
+    dominance_close = CASE WHEN excluded.closed_at >= c.closed_at
+                           THEN excluded.dominance_close ELSE c.dominance_close END,
+    total_volume = CASE WHEN excluded.closed_at >= c.closed_at THEN excluded.total_volume ELSE c.total_volume END,
+    avg_volatility = CASE WHEN excluded.closed_at >= c.closed_at THEN excluded.avg_volatility ELSE c.avg_volatility END,
+    coins = CASE WHEN excluded.closed_at >= c.closed_at THEN excluded.coins ELSE c.coins END,
+    volatility_histogram = CASE WHEN excluded.closed_at >= c.closed_at
+                                THEN excluded.volatility_histogram ELSE c.volatility_histogram END,
+    closed_at = GREATEST(c.closed_at, excluded.closed_at),
+    samples = c.samples + CASE WHEN excluded.closed_at > c.closed_at OR excluded.opened_at < c.opened_at
+                               THEN 1 ELSE 0 END
+"""
+
+# Tables this process has already created, so steady-state loads issue no DDL
+_tables_ready = False
+
+
+def to_rollup_frame(data: pd.DataFrame) -> pd.DataFrame:
+    """The staging columns of a transformed frame, with `last_updated` as naive UTC."""
+    rollup = data.reindex(columns=STAGING_COLUMNS)
+    rollup['last_updated'] = pd.to_datetime(rollup['last_updated'], utc=True).dt.tz_localize(None)
+    rollup['market_cap_category'] = rollup['market_cap_category'].astype(object)
+    return rollup
+
+
+def update_rollups(conn, data: pd.DataFrame):
+    """Merge one complete market snapshot into the 1m/1h/1d coin and category candles, and commit.
+
+    Category candles sum over every coin in `data`, so pass the whole snapshot rather than a page.
+    """
+    global _tables_ready
+    if data.empty:
+        return
+
+    rollup = to_rollup_frame(data)
+    cur = conn.cursor()
+    try:
+        if not _tables_ready:
+            cur.execute(CREATE_ROLLUP_TABLES)
+        cur.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS rollup_staging ("
+            "id TEXT, last_updated TIMESTAMP, current_price DOUBLE PRECISION, market_cap DOUBLE PRECISION, "
+            "total_volume DOUBLE PRECISION, market_dominance DOUBLE PRECISION, volatility DOUBLE PRECISION, "
+            "market_cap_category TEXT) ON COMMIT DELETE ROWS"
+        )
+
+        with recorder.stage('rollups.copy', rows=len(rollup)) as stage:
+            stage.bytes = copy_dataframe(cur, rollup, 'rollup_staging', types=STAGING_TYPES)
+
+        with recorder.stage('rollups.coin_candles', rows=len(rollup)):
+            cur.execute(UPSERT_COIN_CANDLES)
+        with recorder.stage('rollups.category_candles', rows=len(rollup)):
+            cur.execute(UPSERT_CATEGORY_CANDLES)
+        conn.commit()
+        _tables_ready = True
+    except Exception as e:
+        conn.rollback()
+        _tables_ready = False
+        logger.error(f"Error updating rollups: {str(e)}")
+        raise
+    finally:
+        cur.close()
+
+
+def retention_cutoffs(now: datetime, retention_days: dict = None) -> dict:
+    """Oldest bucket_start kept per interval; intervals with no retention are left out.
+
+    Defaults come from ROLLUP_RETENTION_DAYS_1M / _1H / _1D (7 and 180 days, daily kept forever).
+    """
+    if retention_days is None:
+        retention_days = {}
+        for interval, default in DEFAULT_RETENTION_DAYS.items():
+            value = os.getenv(f'ROLLUP_RETENTION_DAYS_{interval.upper()}')
+            retention_days[interval] = int(value) if value else default
+    return {
+        interval: now - timedelta(days=days)
+        for interval, days in retention_days.items()
+        if days is not None
+    }
+
+
+@task(name="Prune Expired Rollup Candles")
+def rollup_retention_task(retention_days: dict = None):
+    cutoffs = retention_cutoffs(datetime.now(timezone.utc).replace(tzinfo=None), retention_days)
+    deleted = 0
+    with db_connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL", (COIN_CANDLES_TABLE,))
+            if not cur.fetchone()[0]:
+                # Nothing to prune yet; don't leave the shared connection idle in a transaction
+                conn.rollback()
+                return 0
+            for table in (COIN_CANDLES_TABLE, CATEGORY_CANDLES_TABLE):
+                for interval, cutoff in cutoffs.items():
+                    cur.execute(sql.SQL("DELETE FROM {table} WHERE width = %s AND bucket_start < %s").format(
+                        table=sql.Identifier(table)
+                    ), (interval, cutoff))
+                    deleted += cur.rowcount
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error pruning rollup candles: {str(e)}")
+            raise
+        finally:
+            cur.close()
+
+    logger.info(f"Pruned {deleted} expired rollup candles")
+    return deleted
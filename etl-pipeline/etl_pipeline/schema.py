@@ -0,0 +1,242 @@
+from psycopg2 import sql
+from dotenv import load_dotenv
+from itertools import count
+from typing import Dict, List
+import json
+import logging
+import threading
+import weakref
+from etl_pipeline.resources import db_connection
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CRYPTO_DATA_TABLE = 'crypto_data'
+STAGING_TABLE = 'crypto_data_staging'
+
+# Columns as first shipped; a fresh database is created with these
+BASE_COLUMNS = [
+    ('id', 'TEXT PRIMARY KEY'),
+    ('symbol', 'TEXT'),
+    ('name', 'TEXT'),
+    ('current_price', 'REAL'),
+    ('market_cap', 'REAL'),
+    ('total_volume', 'REAL'),
+    ('high_24h', 'REAL'),
+    ('low_24h', 'REAL'),
+    ('price_change_24h', 'REAL'),
+    ('price_change_percentage_24h', 'REAL'),
+    ('market_cap_change_24h', 'REAL'),
+    ('market_cap_change_percentage_24h', 'REAL'),
+    ('circulating_supply', 'REAL'),
+    ('total_supply', 'REAL'),
+    ('max_supply', 'REAL'),
+    ('ath', 'REAL'),
+    ('ath_change_percentage', 'REAL'),
+    ('atl', 'REAL'),
+    ('atl_change_percentage', 'REAL'),
+    ('last_updated', 'TIMESTAMP'),
+    ('ath_date', 'TIMESTAMP'),
+    ('atl_date', 'TIMESTAMP'),
+]
+
+# Migrations, applied in order with ADD COLUMN to tables created before them. Append new
+# columns here rather than editing BASE_COLUMNS so existing databases pick them up.
+MIGRATIONS = [
+    # Metrics added by transform_data_task, previously dropped by the load
+    ('market_cap_rank', 'INTEGER'),
+    ('volume_to_market_cap_ratio', 'REAL'),
+    ('price_to_ath_ratio', 'REAL'),
+    ('market_dominance', 'REAL'),
+    ('has_max_supply', 'BOOLEAN'),
+    ('circulating_supply_percentage', 'REAL'),
+    ('days_since_ath', 'INTEGER'),
+    ('market_cap_category', 'TEXT'),
+    ('volatility', 'REAL'),
+    ('significant_price_change', 'BOOLEAN'),
+]
+
+# LISTEN/NOTIFY channel the web app's push feed subscribes to; payloads are JSON
+# {"ids": [...]} naming the coins just upserted, or {"ids": null} when too many to fit
+CHANGES_CHANNEL = 'crypto_data_changes'
+# NOTIFY payloads must stay under 8000 bytes
+MAX_NOTIFY_BYTES = 7900
+
+# Serves the web API's keyset pagination on (market_cap, id)
+MARKET_CAP_INDEX = 'crypto_data_market_cap_id_idx'
+
+# Column name -> pg_type OID of crypto_data, in table order, read once per process; the
+# version changes whenever the cache is rebuilt so sessions redo their staging table
+_schema = {'columns': None, 'version': 0}
+_lock = threading.Lock()
+
+# Per connection: the schema version its staging table was made for and the upsert statements
+# prepared in that session, by column set
+_sessions = weakref.WeakKeyDictionary()
+_statement_ids = count(1)
+
+
+def _column_defs(columns) -> sql.Composable:
+    return sql.SQL(', ').join(
+        sql.SQL("{} {}").format(sql.Identifier(name), sql.SQL(definition)) for name, definition in columns
+    )
+
+
+def _read_columns(cur) -> Dict[str, int]:
+    cur.execute("""
+        SELECT attname, atttypid FROM pg_attribute
+        WHERE attrelid = to_regclass(%s) AND attnum > 0 AND NOT attisdropped
+        ORDER BY attnum
+    """, (CRYPTO_DATA_TABLE,))
+    return dict(cur.fetchall())
+
+
+def ensure_schema(conn) -> Dict[str, int]:
+    """Create crypto_data and apply pending migrations, once per process.
+
+    Returns the table's column name -> pg_type OID mapping, which later calls serve from memory.
+    DDL is only issued when the table, a column or the keyset index is actually missing.
+    """
+    with _lock:
+        if _schema['columns'] is not None:
+            return _schema['columns']
+
+        cur = conn.cursor()
+        try:
+            columns = _read_columns(cur)
+            if not columns:
+                cur.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {table} ({columns})").format(
+                    table=sql.Identifier(CRYPTO_DATA_TABLE),
+                    columns=_column_defs(BASE_COLUMNS)
+                ))
+                logger.info(f"Created new {CRYPTO_DATA_TABLE} table")
+            missing = [(name, definition) for name, definition in MIGRATIONS if name not in columns]
+            for name, definition in missing:
+                cur.execute(sql.SQL("ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {definition}").format(
+                    table=sql.Identifier(CRYPTO_DATA_TABLE),
+                    column=sql.Identifier(name),
+                    definition=sql.SQL(definition)
+                ))
+            if missing:
+                logger.info(f"Added columns to {CRYPTO_DATA_TABLE}: {', '.join(name for name, _ in missing)}")
+                columns = _read_columns(cur)
+            cur.execute("SELECT to_regclass(%s)", (MARKET_CAP_INDEX,))
+            if cur.fetchone()[0] is None:
+                cur.execute(sql.SQL(
+                    "CREATE INDEX IF NOT EXISTS {index} ON {table} (market_cap DESC NULLS LAST, id DESC)"
+                ).format(
+                    index=sql.Identifier(MARKET_CAP_INDEX),
+                    table=sql.Identifier(CRYPTO_DATA_TABLE)
+                ))
+                logger.info(f"Created index {MARKET_CAP_INDEX}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+
+        _schema['columns'] = columns
+        _schema['version'] += 1
+        return columns
+
+
+def reset_schema():
+    """Forget the cached schema, e.g. after the table was dropped or a load failed on it."""
+    with _lock:
+        _schema['columns'] = None
+
+
+def reset_session(conn):
+    """Forget what was set up on `conn`, after a rollback may have undone the staging table."""
+    _sessions.pop(conn, None)
+
+
+def ensure_staging(conn, cur):
+    """Session-local staging table for COPY, made once per connection and emptied at every commit.
+
+    Returns the statements already prepared in this session.
+    """
+    session = _sessions.get(conn)
+    if session is not None and session['version'] == _schema['version']:
+        return session['statements']
+
+    staging = sql.Identifier(STAGING_TABLE)
+    if session is not None:
+        # The table changed shape since this session's staging table and statements were made
+        for name in session['statements'].values():
+            cur.execute(sql.SQL("DEALLOCATE {name}").format(name=sql.Identifier(name)))
+    else:
+        # Unknown session, e.g. forgotten by reset_session after a failed load: a staging table
+        # committed earlier on this connection and prepared upserts survive a rollback, and
+        # may have been made for the table's previous shape
+        cur.execute("DEALLOCATE ALL")
+    cur.execute(sql.SQL("DROP TABLE IF EXISTS {staging}").format(staging=staging))
+    cur.execute(sql.SQL(
+        "CREATE TEMP TABLE {staging} (LIKE {table}) ON COMMIT DELETE ROWS"
+    ).format(staging=staging, table=sql.Identifier(CRYPTO_DATA_TABLE)))
+    session = _sessions[conn] = {'version': _schema['version'], 'statements': {}}
+    return session['statements']
+
+
+def upsert_statement(columns: List[str], newer_only: bool) -> sql.Composable:
+    """INSERT ... ON CONFLICT from the staging table into crypto_data for `columns`.
+
+    With `newer_only`, stored rows are only overwritten by a newer last_updated.
+    """
+    identifiers = sql.SQL(', ').join(map(sql.Identifier, columns))
+    where = sql.SQL(
+        "WHERE {table}.last_updated IS NULL OR {table}.last_updated < excluded.last_updated"
+        if newer_only else ""
+    ).format(table=sql.Identifier(CRYPTO_DATA_TABLE))
+    return sql.SQL("""
+        INSERT INTO {table} ({columns})
+        SELECT {columns} FROM {staging}
+        ON CONFLICT (id) DO UPDATE SET
+        {updates}
+        {where}
+    """).format(
+        table=sql.Identifier(CRYPTO_DATA_TABLE),
+        columns=identifiers,
+        staging=sql.Identifier(STAGING_TABLE),
+        updates=sql.SQL(', ').join(
+            sql.SQL("{column} = excluded.{column}").format(column=sql.Identifier(column))
+            for column in columns if column != 'id'
+        ),
+        where=where
+    )
+
+
+def execute_upsert(cur, statements: dict, columns: List[str], newer_only: bool):
+    """Run the staging -> crypto_data upsert through a statement prepared once per session and column set.
+
+    `statements` is the session's prepared statements, as returned by ensure_staging.
+    """
+    key = (tuple(columns), newer_only)
+    name = statements.get(key)
+    if name is None:
+        # PREPARE survives a rollback, so every preparation gets a fresh name
+        name = f"crypto_data_upsert_{next(_statement_ids)}"
+        cur.execute(sql.SQL("PREPARE {name} AS {statement}").format(
+            name=sql.Identifier(name),
+            statement=upsert_statement(columns, newer_only)
+        ))
+        statements[key] = name
+    cur.execute(sql.SQL("EXECUTE {name}").format(name=sql.Identifier(name)))
+
+
+def notify_changes(cur, ids: List[str]):
+    """Queue a CHANGES_CHANNEL notification naming `ids`; PostgreSQL delivers it only if the transaction commits."""
+    payload = json.dumps({'ids': list(ids)}, separators=(',', ':'))
+    if len(payload.encode()) > MAX_NOTIFY_BYTES:
+        # Listeners re-read the whole table instead
+        payload = json.dumps({'ids': None})
+    cur.execute("SELECT pg_notify(%s, %s)", (CHANGES_CHANNEL, payload))
+
+
+def migrate():
+    """Apply the crypto_data schema at startup so the first load issues no DDL."""
+    with db_connection() as conn:
+        return ensure_schema(conn)
@@ -0,0 +1,243 @@
+import pandas as pd
+import boto3
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO, TextIOWrapper
+from pathlib import Path
+from typing import BinaryIO, List, Optional, Union
+import json
+import logging
+import os
+import shutil
+import threading
+from etl_pipeline.dtypes import to_wire_dtypes
+from etl_pipeline.profiling import recorder
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+Records = Union[pd.DataFrame, list]
+
+
+class Serializer(ABC):
+    """Writes a DataFrame (or raw list of records) into a binary buffer in one format."""
+    extension = None
+    content_type = 'application/octet-stream'
+
+    @abstractmethod
+    def write(self, data: Records, buffer: BinaryIO):
+        ...
+
+
+class JSONSerializer(Serializer):
+    extension = 'json'
+    content_type = 'application/json'
+
+    def write(self, data, buffer):
+        text = TextIOWrapper(buffer, encoding='utf-8')
+        if isinstance(data, pd.DataFrame):
+            to_wire_dtypes(data).to_json(text, orient='records', date_format='iso')
+        else:
+            json.dump(data, text)
+        text.flush()
+        text.detach()
+
+
+class CSVSerializer(Serializer):
+    extension = 'csv'
+    content_type = 'text/csv'
+
+    def __init__(self, index: bool = True):
+        self.index = index
+
+    def write(self, data, buffer):
+        text = TextIOWrapper(buffer, encoding='utf-8', newline='')
+        to_wire_dtypes(pd.DataFrame(data)).to_csv(text, index=self.index)
+        text.flush()
+        text.detach()
+
+
+class ParquetSerializer(Serializer):
+    extension = 'parquet'
+    content_type = 'application/vnd.apache.parquet'
+
+    def __init__(self, compression: str = 'snappy'):
+        self.compression = compression
+
+    def write(self, data, buffer):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise ImportError("Parquet output requires pyarrow; install the 'parquet' extra") from e
+        to_wire_dtypes(pd.DataFrame(data)).to_parquet(buffer, engine='pyarrow', compression=self.compression, index=False)
+
+
+def get_serializer(name: str) -> Serializer:
+    """Serializer for a format name: json, csv or parquet (compression from PARQUET_COMPRESSION)."""
+    name = name.lower()
+    if name == 'json':
+        return JSONSerializer()
+    if name == 'csv':
+        return CSVSerializer()
+    if name == 'parquet':
+        return ParquetSerializer(os.getenv('PARQUET_COMPRESSION', 'snappy'))
+    raise ValueError(f"Unknown serialization format: {name}")
+
+
+class ObjectStore(ABC):
+    """Minimal object-store interface so archival can target S3 or a local directory."""
+
+    @abstractmethod
+    def put(self, key: str, body: BinaryIO, content_type: Optional[str] = None):
+        ...
+
+    @abstractmethod
+    def get(self, key: str) -> bytes:
+        ...
+
+    @abstractmethod
+    def list(self, prefix: str = '') -> List[str]:
+        ...
+
+
+class S3ObjectStore(ObjectStore):
+    def __init__(self, bucket: str, client=None):
+        self.bucket = bucket
+        self.client = client or boto3.client('s3', region_name='ap-southeast-2')
+
+    def put(self, key, body, content_type=None):
+        extra = {'ContentType': content_type} if content_type else {}
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=body, **extra)
+
+    def get(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+
+    def list(self, prefix=''):
+        paginator = self.client.get_paginator('list_objects_v2')
+        return [
+            obj['Key']
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix)
+            for obj in page.get('Contents', [])
+        ]
+
+    def __str__(self):
+        return f"s3://{self.bucket}"
+
+
+class LocalObjectStore(ObjectStore):
+    def __init__(self, root: Union[str, Path]):
+        self.root = Path(root)
+
+    def put(self, key, body, content_type=None):
+        path = self.root / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as f:
+            shutil.copyfileobj(body, f)
+
+    def get(self, key):
+        return (self.root / key).read_bytes()
+
+    def list(self, prefix=''):
+        if not self.root.exists():
+            return []
+        keys = (path.relative_to(self.root).as_posix() for path in self.root.rglob('*') if path.is_file())
+        return sorted(key for key in keys if key.startswith(prefix))
+
+    def __str__(self):
+        return str(self.root)
+
+
+def get_object_store(bucket: str, client=None) -> ObjectStore:
+    """S3 bucket store, or a local directory per bucket under OBJECT_STORE_ROOT when that is set."""
+    root = os.getenv('OBJECT_STORE_ROOT')
+    if root:
+        return LocalObjectStore(Path(root) / (bucket or 'default'))
+    return S3ObjectStore(bucket, client)
+
+
+def object_key(prefix: str, extension: str, timestamp: Optional[datetime] = None, partitioned: Optional[bool] = None) -> str:
+    """Object key for a snapshot, flat (`prefix_YYYYmmddHHMMSS.ext`) or Hive-style partitioned.
+
+    Partitioned keys look like `prefix/dt=YYYY-MM-DD/hour=HH/prefix_YYYYmmddHHMMSS.ext`; the
+    layout defaults to S3_PARTITIONING=hive|flat (flat unless set).
+    """
+    timestamp = timestamp or pd.Timestamp.now()
+    if partitioned is None:
+        partitioned = os.getenv('S3_PARTITIONING', 'flat') == 'hive'
+    file_name = f'{prefix}_{timestamp.strftime("%Y%m%d%H%M%S")}.{extension}'
+    if partitioned:
+        return f'{prefix}/dt={timestamp:%Y-%m-%d}/hour={timestamp:%H}/{file_name}'
+    return file_name
+
+
+def archive(store: ObjectStore, data: Records, prefix: str, serializer: Serializer, timestamp: Optional[datetime] = None) -> str:
+    """Serialize `data` straight into an upload buffer and put it in `store`; returns the key.
+
+    The buffer is handed to the store as a file object, so the serialized bytes are not copied
+    into an intermediate string.
+    """
+    with recorder.stage(f'archive.{prefix}', rows=len(data)) as stage:
+        buffer = BytesIO()
+        serializer.write(data, buffer)
+        stage.bytes = buffer.tell()
+        buffer.seek(0)
+        key = object_key(prefix, serializer.extension, timestamp)
+        store.put(key, buffer, serializer.content_type)
+    return key
+
+
+class BackgroundUploader:
+    """Runs `archive` calls on worker threads so uploads stay off the extract/transform/load path.
+
+    At most `max_in_flight` uploads (ARCHIVE_MAX_IN_FLIGHT) are queued or running; `submit`
+    blocks beyond that, which bounds the serialized snapshots held in memory. Failed uploads
+    are logged and counted, never raised into the pipeline.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_in_flight: Optional[int] = None):
+        max_workers = max_workers or int(os.getenv('ARCHIVE_UPLOAD_WORKERS', 2))
+        max_in_flight = max_in_flight or int(os.getenv('ARCHIVE_MAX_IN_FLIGHT', 4))
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='archive')
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.lock = threading.Condition()
+        self.pending = set()
+        # Recent keys only, so a resident process does not grow this without bound
+        self.keys = deque(maxlen=1000)
+        self.failed = 0
+
+    def _done(self, future: Future):
+        with self.lock:
+            self.pending.discard(future)
+            if future.exception() is None:
+                self.keys.append(future.result())
+            else:
+                self.failed += 1
+                logger.error(f"Background archive upload failed: {str(future.exception())}")
+            self.lock.notify_all()
+        self.slots.release()
+
+    def submit(self, store: ObjectStore, data: Records, prefix: str, serializer: Serializer,
+               timestamp: Optional[datetime] = None) -> Future:
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(archive, store, data, prefix, serializer, timestamp)
+        except Exception:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def wait(self) -> List[str]:
+        """Block until every submitted upload has finished; returns the keys stored so far."""
+        with self.lock:
+            self.lock.wait_for(lambda: not self.pending)
+            return list(self.keys)
+
+    def close(self) -> List[str]:
+        keys = self.wait()
+        self.executor.shutdown()
+        return keys
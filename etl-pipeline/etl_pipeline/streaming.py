@@ -0,0 +1,228 @@
+import pandas as pd
+from dotenv import load_dotenv
+from collections import namedtuple
+from typing import Optional
+import logging
+import os
+import queue
+import signal
+import threading
+import time
+from etl_pipeline.coingecko import CoinGeckoClient
+from etl_pipeline.dtypes import apply_market_dtypes
+from etl_pipeline.extract_load import record_change_detection, record_json_parse, upsert_crypto_data
+from etl_pipeline.history import load_history_task
+from etl_pipeline.profiling import recorder, write_metrics
+from etl_pipeline.raw_cache import cache_raw_response
+from etl_pipeline.rollups import update_rollups
+from etl_pipeline.resources import close_db_connection, db_connection, get_s3_client
+from etl_pipeline.storage import BackgroundUploader, get_object_store, get_serializer
+from etl_pipeline.transform import transform_market_data
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# One CoinGecko poll on its way through the stages, with the change-tracker entries it staged
+Batch = namedtuple('Batch', ['seq', 'fetched_at', 'data', 'changes'], defaults=(None,))
+
+# Queue sentinel telling the next stage to finish once everything before it is processed
+_STOP = object()
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ('1', 'true', 'yes')
+
+
+class StreamingWorker:
+    """Resident extract -> transform -> load pipeline polling CoinGecko on a fixed interval.
+
+    Each stage runs in its own thread and hands micro-batches on through bounded queues: when
+    transform or load fall behind, the extractor blocks instead of piling up snapshots, and the
+    next poll then fetches fresh data. The CoinGecko session, S3 client and database connection
+    are opened once and reused for every batch, and S3 snapshots are uploaded in the background.
+    Polls that return the same data as the previous one stop at the extractor.
+    """
+
+    def __init__(
+        self,
+        interval: Optional[float] = None,
+        pages: Optional[int] = None,
+        per_page: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        incremental: bool = True,
+        history: bool = True,
+        rollups: bool = True,
+        archive_batches: Optional[bool] = None,
+        client: Optional[CoinGeckoClient] = None,
+    ):
+        self.interval = interval if interval is not None else float(os.getenv('STREAM_INTERVAL_SECONDS', 30))
+        self.pages = pages or int(os.getenv('STREAM_PAGES', 1))
+        self.per_page = per_page or int(os.getenv('STREAM_PER_PAGE', 10))
+        queue_size = queue_size or int(os.getenv('STREAM_QUEUE_SIZE', 2))
+        self.incremental = incremental
+        self.history = history
+        self.rollups = rollups
+        self.archive_batches = archive_batches if archive_batches is not None else _env_flag('STREAM_ARCHIVE', 'true')
+        self.client = client or CoinGeckoClient()
+        self.uploader = BackgroundUploader() if self.archive_batches else None
+
+        self.stop_event = threading.Event()
+        self.raw_batches = queue.Queue(maxsize=queue_size)
+        self.transformed_batches = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.stats = {
+            'extracted': 0, 'unchanged': 0, 'transformed': 0, 'loaded': 0, 'failed': 0,
+            'rows_written': 0, 'rows_skipped': 0, 'last_lag_seconds': None,
+        }
+        self.threads = []
+
+    def _count(self, **increments):
+        with self.lock:
+            for key, value in increments.items():
+                self.stats[key] += value
+
+    def _archive(self, data, prefix: str, bucket_env: str, format_env: str, default_format: str):
+        if not self.archive_batches:
+            return
+        try:
+            store = get_object_store(os.getenv(bucket_env), get_s3_client())
+            self.uploader.submit(store, data, prefix, get_serializer(os.getenv(format_env, default_format)))
+        except Exception as e:
+            logger.error(f"Failed to queue {prefix} for archival: {str(e)}")
+
+    def extract_loop(self):
+        seq = 0
+        next_poll = time.monotonic()
+        while not self.stop_event.is_set():
+            try:
+                with recorder.stage('stream.extract') as stage:
+                    records, changed = self.client.fetch_markets_if_changed(self.pages, per_page=self.per_page)
+                    transfer = self.client.drain_transfer()
+                    stage.rows = len(records)
+                    stage.bytes = transfer['bytes']
+                record_json_parse(transfer, len(records))
+                if records:
+                    record_change_detection(changed, tracker=self.client.changes)
+                if records and not changed:
+                    self._count(unchanged=1)
+                    write_metrics(records=recorder.drain())
+                elif records:
+                    seq += 1
+                    fetched_at = pd.Timestamp.now(tz='UTC')
+                    self._archive(records, 'raw_crypto_data', 'AWS_S3_BUCKET_RAW', 'RAW_FORMAT', 'json')
+                    cache_raw_response(records, fetched_at)
+                    # Blocks while both downstream queues are full: that is the backpressure
+                    self.raw_batches.put(Batch(
+                        seq, fetched_at, apply_market_dtypes(pd.DataFrame(records)), self.client.changes.pending()
+                    ))
+                    self._count(extracted=1)
+            except Exception as e:
+                self._count(failed=1)
+                logger.error(f"Streaming extract failed: {str(e)}")
+
+            next_poll += self.interval
+            # A slow cycle polls again right away rather than trying to catch up missed ticks
+            next_poll = max(next_poll, time.monotonic())
+            self.stop_event.wait(next_poll - time.monotonic())
+        self.raw_batches.put(_STOP)
+
+    def transform_loop(self):
+        while True:
+            batch = self.raw_batches.get()
+            if batch is _STOP:
+                self.transformed_batches.put(_STOP)
+                return
+            try:
+                data = transform_market_data(batch.data)
+                self._archive(data, 'transformed_crypto_data', 'AWS_S3_BUCKET_PROCESSED', 'PROCESSED_FORMAT', 'csv')
+                self.transformed_batches.put(batch._replace(data=data))
+                self._count(transformed=1)
+            except Exception as e:
+                self._count(failed=1)
+                self.client.changes.rollback(batch.changes)
+                logger.error(f"Streaming transform of batch {batch.seq} failed: {str(e)}")
+
+    def load_loop(self):
+        while True:
+            batch = self.transformed_batches.get()
+            if batch is _STOP:
+                return
+            try:
+                with db_connection() as conn:
+                    stats, _ = upsert_crypto_data(conn, batch.data, self.incremental)
+                    if self.rollups:
+                        update_rollups(conn, batch.data)
+                if self.history:
+                    load_history_task.fn(batch.data)
+                self.client.changes.commit(batch.changes)
+                lag = (pd.Timestamp.now(tz='UTC') - batch.fetched_at).total_seconds()
+                with self.lock:
+                    self.stats['loaded'] += 1
+                    self.stats['rows_written'] += stats['rows_written']
+                    self.stats['rows_skipped'] += stats['rows_skipped']
+                    self.stats['last_lag_seconds'] = round(lag, 3)
+                logger.info(
+                    f"Batch {batch.seq}: {stats['rows_written']} rows written, "
+                    f"{stats['rows_skipped']} unchanged, {lag:.2f}s from fetch to load, "
+                    f"worst freshness {stats.get('freshness_max_seconds')}s"
+                )
+            except Exception as e:
+                self._count(failed=1)
+                # The next poll reloads this snapshot instead of skipping it as unchanged
+                self.client.changes.rollback(batch.changes)
+                logger.error(f"Streaming load of batch {batch.seq} failed: {str(e)}")
+            # Flush per batch so a resident process does not accumulate stage records
+            write_metrics(records=recorder.drain())
+
+    def start(self):
+        for name, target in (('extract', self.extract_loop), ('transform', self.transform_loop), ('load', self.load_loop)):
+            thread = threading.Thread(target=target, name=f"stream-{name}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        """Stop polling; batches already fetched are still transformed and loaded."""
+        self.stop_event.set()
+
+    def join(self, timeout: Optional[float] = None):
+        for thread in self.threads:
+            thread.join(timeout)
+        if self.uploader is not None:
+            self.uploader.close()
+        self.client.close()
+
+    def run(self, max_batches: Optional[int] = None, duration: Optional[float] = None):
+        """Run until stopped (SIGINT/SIGTERM), `max_batches` polls are done with or `duration` seconds pass."""
+        if threading.current_thread() is threading.main_thread():
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(sig, lambda *_: self.stop())
+
+        logger.info(
+            f"Streaming {self.pages} page(s) of {self.per_page} coins every {self.interval}s "
+            f"(queue size {self.raw_batches.maxsize})"
+        )
+        started = time.monotonic()
+        self.start()
+        try:
+            while not self.stop_event.wait(0.1):
+                if max_batches is not None and self.stats['loaded'] + self.stats['failed'] + self.stats['unchanged'] >= max_batches:
+                    break
+                if duration is not None and time.monotonic() - started >= duration:
+                    break
+        finally:
+            self.stop()
+            self.join()
+            close_db_connection()
+        logger.info(f"Streaming stopped: {self.stats}")
+        return self.stats
+
+
+def run_streaming(**kwargs):
+    """Run the resident streaming pipeline in the foreground; see StreamingWorker for options."""
+    return StreamingWorker(**kwargs).run()
+
+
+if __name__ == "__main__":
+    run_streaming()
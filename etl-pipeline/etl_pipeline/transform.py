@@ -1,15 +1,15 @@
 import pandas as pd
 import numpy as np
 from prefect import task
-from prefect.artifacts import create_table_artifact
-from prefect_aws import AwsCredentials
-import boto3
 import logging
 from datetime import datetime
-from typing import Dict, Any
-import json
+from typing import Any, Dict, List
 import os
-from io import StringIO
+from etl_pipeline.artifacts import create_dataframe_artifact, dataframe_to_json_serializable  # noqa: F401
+from etl_pipeline.dtypes import compact_market_frame, frame_bytes
+from etl_pipeline.profiling import recorder
+from etl_pipeline.resources import get_s3_client
+from etl_pipeline.storage import archive, get_object_store, get_serializer
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,15 +21,121 @@ def safe_convert(value: Any, convert_func: callable, default: Any = np.nan) -> A
     except (ValueError, TypeError):
         return default
 
-def json_serial(obj):
-    """JSON serializer for objects not serializable by default json code"""
-    if isinstance(obj, (pd.Timestamp, pd.Timedelta)):
-        return obj.isoformat()
-    raise TypeError(f"Type {type(obj)} not serializable")
+NUMERIC_COLUMNS = [
+    'current_price', 'market_cap', 'fully_diluted_valuation', 'total_volume', 'high_24h', 'low_24h',
+    'price_change_24h', 'price_change_percentage_24h', 'market_cap_change_24h',
+    'market_cap_change_percentage_24h', 'circulating_supply', 'total_supply',
+    'max_supply', 'ath', 'ath_change_percentage', 'atl', 'atl_change_percentage'
+]
+
+ROI_COLUMNS = ['roi_times', 'roi_currency', 'roi_percentage']
+ROI_DEFAULT = (0.0, 'usd', 0.0)
+
+def coerce_numeric(series: pd.Series) -> pd.Series:
+    """Vectorized float conversion; values that cannot be parsed become NaN, as with `safe_convert`."""
+    return pd.to_numeric(series, errors='coerce').astype('float64')
+
+def flatten_roi(roi: pd.Series) -> pd.DataFrame:
+    """Flatten a column of ROI dicts into roi_times, roi_currency and roi_percentage in one pass."""
+    rows = [
+        (r.get('times', 0), r.get('currency', 'usd'), r.get('percentage', 0)) if isinstance(r, dict) else ROI_DEFAULT
+        for r in roi.values
+    ]
+    flat = pd.DataFrame(rows, columns=ROI_COLUMNS, index=roi.index)
+    flat['roi_times'] = coerce_numeric(flat['roi_times'])
+    flat['roi_percentage'] = coerce_numeric(flat['roi_percentage'])
+    return flat
+
+def transform_market_data(data: pd.DataFrame, cross_row: bool = True) -> pd.DataFrame:
+    """Clean a raw /coins/markets frame and add the derived market metrics.
+
+    With `cross_row=False` the metrics that depend on the whole market (dominance, rank fill)
+    are left for `finalize_batches`, so pages can be transformed one at a time.
+    """
+    steps = recorder.steps('transform', rows=len(data))
+
+    # Convert timestamps
+    for col in ['last_updated', 'ath_date', 'atl_date']:
+        if col in data.columns:
+            data[col] = pd.to_datetime(data[col], utc=True)
+    steps.lap('parse_timestamps')
+
+    for col in NUMERIC_COLUMNS:
+        if col in data.columns:
+            data[col] = coerce_numeric(data[col])
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(f"Processed {col}: min={data[col].min()}, max={data[col].max()}, mean={data[col].mean()}")
+    steps.lap('coerce_numeric')
+
+    # Calculate additional metrics
+    data['volume_to_market_cap_ratio'] = data['total_volume'] / data['market_cap']
+    data['price_to_ath_ratio'] = data['current_price'] / data['ath']
+    data['market_dominance'] = data['market_cap'] / data['market_cap'].sum() if cross_row else np.nan
+    data['has_max_supply'] = data['max_supply'].notnull()
+    data['circulating_supply_percentage'] = data['circulating_supply'] / data['total_supply'] * 100
+    data['days_since_ath'] = (pd.Timestamp.now(tz='UTC') - data['ath_date']).dt.days
+
+    # Categorize coins based on market cap
+    data['market_cap_category'] = pd.cut(
+        data['market_cap'],
+        bins=[0, 1e9, 10e9, 100e9, np.inf],
+        labels=['Small Cap', 'Mid Cap', 'Large Cap', 'Mega Cap']
+    )
+
+    # Volatility indicator (simplified)
+    data['volatility'] = (data['high_24h'] - data['low_24h']) / data['low_24h']
+
+    # Flag for significant price changes
+    data['significant_price_change'] = np.abs(data['price_change_percentage_24h']) > 5
+
+    # Extract year and month from last_updated for potential time-based analysis
+    data['year'] = data['last_updated'].dt.year
+    data['month'] = data['last_updated'].dt.month
+
+    # Handle missing values
+    data = data.fillna({
+        'circulating_supply': 0,
+        'total_supply': 0,
+        'max_supply': 0
+    })
+    steps.lap('derived_metrics')
+
+    # Parse ROI column
+    if 'roi' in data.columns:
+        data = pd.concat([data.drop('roi', axis=1), flatten_roi(data['roi'])], axis=1)
+
+    # Ensure all coins have a rank (fill missing with max+1)
+    if cross_row:
+        data['market_cap_rank'] = data['market_cap_rank'].fillna(data['market_cap_rank'].max() + 1)
+    steps.lap('flatten_roi')
+
+    # Log data quality metrics (nunique is costly on large frames, so skip it when INFO is off)
+    for col in data.columns if logger.isEnabledFor(logging.INFO) else []:
+        if data[col].dtype == 'object':
+            # For object columns, just count non-null values
+            non_null_count = data[col].count()
+            logger.info(f"{col}: {len(data) - non_null_count} null values")
+        else:
+            null_count = data[col].isnull().sum()
+            unique_count = data[col].nunique()
+            logger.info(f"{col}: {null_count} null values, {unique_count} unique values")
+    steps.lap('quality_log')
+
+    # Categoricals, nullable integers and lossless float32 in place of object/float64 columns
+    data = compact_market_frame(data)
+    steps.lap('compact_dtypes').update(frame_bytes=frame_bytes(data))
+
+    return data
 
-def dataframe_to_json_serializable(df):
-    """Convert a DataFrame to a JSON-serializable format"""
-    return json.loads(json.dumps(df.to_dict(orient="records"), default=json_serial))
+def finalize_batches(batches: List[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenate frames transformed with `cross_row=False` and add the whole-market metrics."""
+    data = pd.concat(batches, ignore_index=True)
+    # Summed in float64 as in a single-frame transform, whatever the pages were downcast to
+    market_cap = data['market_cap'].astype('float64')
+    data['market_dominance'] = market_cap / market_cap.sum()
+    data['market_cap_rank'] = data['market_cap_rank'].fillna(data['market_cap_rank'].max() + 1)
+    # Pages with different category sets concatenate to object
+    return compact_market_frame(data)
 
 @task(name="Transform Data", retries=3, retry_delay_seconds=30)
 def transform_data_task(data: pd.DataFrame) -> pd.DataFrame:
@@ -41,110 +147,28 @@ def transform_data_task(data: pd.DataFrame) -> pd.DataFrame:
     logger.info(f"Initial data shape: {data.shape}")
 
     try:
-        # Convert timestamps
-        for col in ['last_updated', 'ath_date', 'atl_date']:
-            if col in data.columns:
-                data[col] = pd.to_datetime(data[col], utc=True)
-
-        # Numeric columns to process
-        numeric_columns = [
-            'current_price', 'market_cap', 'fully_diluted_valuation', 'total_volume', 'high_24h', 'low_24h',
-            'price_change_24h', 'price_change_percentage_24h', 'market_cap_change_24h',
-            'market_cap_change_percentage_24h', 'circulating_supply', 'total_supply',
-            'max_supply', 'ath', 'ath_change_percentage', 'atl', 'atl_change_percentage'
-        ]
-
-        for col in numeric_columns:
-            if col in data.columns:
-                data[col] = data[col].apply(lambda x: safe_convert(x, float))
-                logger.info(f"Processed {col}: min={data[col].min()}, max={data[col].max()}, mean={data[col].mean()}")
-
-        # Calculate additional metrics
-        data['volume_to_market_cap_ratio'] = data['total_volume'] / data['market_cap']
-        data['price_to_ath_ratio'] = data['current_price'] / data['ath']
-        data['market_dominance'] = data['market_cap'] / data['market_cap'].sum()
-        data['has_max_supply'] = data['max_supply'].notnull()
-        data['circulating_supply_percentage'] = data['circulating_supply'] / data['total_supply'] * 100
-        data['days_since_ath'] = (pd.Timestamp.now(tz='UTC') - data['ath_date']).dt.days
-        
-        # Categorize coins based on market cap
-        data['market_cap_category'] = pd.cut(
-            data['market_cap'],
-            bins=[0, 1e9, 10e9, 100e9, np.inf],
-            labels=['Small Cap', 'Mid Cap', 'Large Cap', 'Mega Cap']
-        )
-
-        # Volatility indicator (simplified)
-        data['volatility'] = (data['high_24h'] - data['low_24h']) / data['low_24h']
-
-        # Flag for significant price changes
-        data['significant_price_change'] = np.abs(data['price_change_percentage_24h']) > 5
-
-        # Extract year and month from last_updated for potential time-based analysis
-        data['year'] = data['last_updated'].dt.year
-        data['month'] = data['last_updated'].dt.month
-
-        # Handle missing values
-        data = data.fillna({
-            'circulating_supply': 0,
-            'total_supply': 0,
-            'max_supply': 0
-        })
-
-        # Parse ROI column
-        if 'roi' in data.columns:
-            data['roi'] = data['roi'].apply(parse_roi)
-            data['roi_times'] = data['roi'].apply(lambda x: x['times'])
-            data['roi_currency'] = data['roi'].apply(lambda x: x['currency'])
-            data['roi_percentage'] = data['roi'].apply(lambda x: x['percentage'])
-            data = data.drop('roi', axis=1)
-
-        # Ensure all coins have a rank (fill missing with max+1)
-        data['market_cap_rank'] = data['market_cap_rank'].fillna(data['market_cap_rank'].max() + 1)
-
-        # Log data quality metrics
-        for col in data.columns:
-            if data[col].dtype == 'object':
-                # For object columns, just count non-null values
-                non_null_count = data[col].count()
-                logger.info(f"{col}: {len(data) - non_null_count} null values")
-            else:
-                null_count = data[col].isnull().sum()
-                unique_count = data[col].nunique()
-                logger.info(f"{col}: {null_count} null values, {unique_count} unique values")
+        data = transform_market_data(data)
 
         logger.info(f"Final data shape: {data.shape}")
         logger.info(f"Columns after transformation: {data.columns.tolist()}")
 
         # Save transformed data to S3
-        aws_credentials = AwsCredentials.load("my-aws-creds")
-        
-        logger.info("AWS credentials loaded successfully")
-        logger.info(f"AWS Access Key ID: {aws_credentials.aws_access_key_id[:5]}...")
-        logger.info(f"AWS Secret Access Key length: {len(aws_credentials.aws_secret_access_key)}")
-        
-        s3 = boto3.client('s3', region_name='ap-southeast-2')
-        
-        bucket_name = os.getenv('AWS_S3_BUCKET_PROCESSED')
-        file_name = f'transformed_crypto_data_{pd.Timestamp.now().strftime("%Y%m%d%H%M%S")}.csv'
-        
-        csv_buffer = StringIO()
-        data.to_csv(csv_buffer)
-        
-        logger.info(f"Attempting to save transformed data to S3 bucket: {bucket_name}")
+        s3 = get_s3_client()
+        store = get_object_store(os.getenv('AWS_S3_BUCKET_PROCESSED'), s3)
+        serializer = get_serializer(os.getenv('PROCESSED_FORMAT', 'csv'))
+
+        logger.info(f"Attempting to save transformed data to {store}")
         try:
-            s3.put_object(Bucket=bucket_name, Key=file_name, Body=csv_buffer.getvalue())
-            logger.info(f"Transformed data saved to S3: {bucket_name}/{file_name}")
+            key = archive(store, data, 'transformed_crypto_data', serializer)
+            logger.info(f"Transformed data saved to {store}/{key}")
         except Exception as e:
             logger.error(f"Failed to save transformed data to S3: {str(e)}")
             logger.error(f"Error type: {type(e)}")
             if hasattr(e, 'response'):
                 logger.error(f"Error response: {e.response}")
 
-        create_table_artifact(
-            key="transformed-data",
-            table=dataframe_to_json_serializable(data.head(10)),
-            description="Transformed cryptocurrency market data (first 10 rows)"
+        create_dataframe_artifact(
+            "transformed-data", data, "Transformed cryptocurrency market data", max_rows=10, memory=True
         )
 
     except Exception as e:
@@ -4,9 +4,13 @@ import time
 import os
 
 def run_etl():
-    subprocess.run(["poetry", "run", "python", "etl_pipeline/main.py"])
+    subprocess.run(["poetry", "run", "python", "-m", "etl_pipeline.main"])
 
 def run_web_app():
+    # WEB_MODE=production serves through gunicorn with several threaded workers
+    if os.getenv('WEB_MODE', 'development') == 'production':
+        subprocess.run(["poetry", "run", "gunicorn", "-c", "web_app/gunicorn.conf.py", "web_app.app:app"])
+        return
     os.environ['FLASK_APP'] = 'web_app.app'
     os.environ['FLASK_ENV'] = 'development'
     subprocess.run(["poetry", "run", "flask", "run", "--host=0.0.0.0"])
@@ -0,0 +1,9 @@
+import pytest
+
+from etl_pipeline import coingecko
+
+
+@pytest.fixture(autouse=True)
+def fresh_change_tracker(monkeypatch):
+    # Responses remembered by one test would otherwise read as "unchanged" in the next
+    monkeypatch.setattr(coingecko, '_change_tracker', {'value': None})
@@ -0,0 +1,82 @@
+import json
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from etl_pipeline import artifacts
+from etl_pipeline.artifacts import bounded_records, dataframe_to_json_serializable, sample_rows, summary_records
+
+
+def sample_frame(n=3):
+    return pd.DataFrame({
+        'id': [f'coin-{i}' for i in range(n)],
+        'current_price': [1.5] + [np.nan] * (n - 1),
+        'market_cap_rank': pd.array(range(n), dtype='Int64'),
+        'last_updated': pd.to_datetime(['2024-06-28T04:19:50Z'] * n),
+        'roi': [{'times': 1.0}] + [None] * (n - 1),
+    })
+
+
+def test_dataframe_to_json_serializable_converts_nan_and_timestamps():
+    records = dataframe_to_json_serializable(sample_frame(2))
+
+    assert records[0]['current_price'] == 1.5
+    assert records[1]['current_price'] is None
+    assert records[0]['last_updated'].startswith('2024-06-28T04:19:50')
+    assert records[0]['roi'] == {'times': 1.0}
+    assert records[1]['market_cap_rank'] == 1
+    json.dumps(records)
+
+
+def test_sample_rows_head_and_spread():
+    df = pd.DataFrame({'x': range(100)})
+
+    assert sample_rows(df, 4)['x'].tolist() == [0, 1, 2, 3]
+    assert sample_rows(df, 4, sample='spread')['x'].tolist() == [0, 25, 50, 75]
+    assert len(sample_rows(df, 500)) == 100
+
+
+def test_bounded_records_respects_byte_budget():
+    df = sample_frame(200)
+    records = bounded_records(df, max_rows=100, max_bytes=2000)
+
+    assert 0 < len(records) < 100
+    assert len(json.dumps(records)) <= 2000 * 1.1
+
+
+def test_summary_records_cover_every_column():
+    summary = {row['column']: row for row in summary_records(sample_frame(4))}
+
+    assert set(summary) == {'id', 'current_price', 'market_cap_rank', 'last_updated', 'roi'}
+    assert summary['current_price']['nulls'] == 3
+    assert summary['current_price']['max'] == 1.5
+    assert summary['last_updated']['min'].startswith('2024-06-28')
+
+
+def test_create_dataframe_artifact_adds_summary_when_truncated():
+    with mock.patch('etl_pipeline.artifacts.create_table_artifact') as create:
+        shown = artifacts.create_dataframe_artifact('extracted-data', sample_frame(30), "Extracted", max_rows=5)
+
+    assert shown == 5
+    keys = [call.kwargs['key'] for call in create.call_args_list]
+    assert keys == ['extracted-data-summary', 'extracted-data']
+    assert create.call_args.kwargs['description'] == "Extracted (5 of 30 rows)"
+
+
+def test_create_dataframe_artifact_small_frame_has_no_summary():
+    with mock.patch('etl_pipeline.artifacts.create_table_artifact') as create:
+        artifacts.create_dataframe_artifact('loaded-data', sample_frame(3), "Loaded", max_rows=10)
+
+    assert create.call_count == 1
+    assert len(create.call_args.kwargs['table']) == 3
+
+
+def test_create_dataframe_artifact_reports_memory_per_column():
+    frame = sample_frame(3)
+    with mock.patch('etl_pipeline.artifacts.create_table_artifact') as create:
+        artifacts.create_dataframe_artifact('transformed-data', frame, "Transformed", max_rows=10, memory=True)
+
+    memory = next(call.kwargs for call in create.call_args_list if call.kwargs['key'] == 'transformed-data-memory')
+    assert {row['column'] for row in memory['table']} == set(frame.columns)
+    assert memory['table'][0]['bytes'] == max(row['bytes'] for row in memory['table'])
@@ -0,0 +1,229 @@
+import time
+from unittest import mock
+
+import pytest
+
+from benchmarks.http_stub import StubServer
+from etl_pipeline.coingecko import ChangeTracker, CoinGeckoClient, TokenBucket
+from etl_pipeline.extract_load import extract_data_task
+from etl_pipeline.profiling import recorder
+
+
+def market_page(page, per_page):
+    start = (page - 1) * per_page
+    return [
+        {'id': f'coin-{i}', 'symbol': f'c{i}', 'name': f'Coin {i}', 'current_price': float(i),
+         'market_cap': 1e9 - i, 'last_updated': '2024-06-28T04:19:50.625Z'}
+        for i in range(start, start + per_page)
+    ]
+
+
+def markets_handler(path, params, headers):
+    return 200, market_page(int(params['page']), int(params['per_page'])), {}
+
+
+@pytest.fixture
+def client():
+    return lambda url, **kwargs: CoinGeckoClient(
+        base_url=url, api_key='test-key', rate_limit_per_minute=6000, backoff_factor=0.01, **kwargs
+    )
+
+
+def test_fetch_markets_merges_pages_in_order(client):
+    with StubServer(markets_handler) as stub:
+        records = client(stub.url, max_concurrency=3).fetch_markets(pages=4, per_page=5)
+
+    assert [r['id'] for r in records] == [f'coin-{i}' for i in range(20)]
+    assert sorted(int(params['page']) for _, params, _ in stub.requests) == [1, 2, 3, 4]
+    assert all(headers['x-cg-api-key'] == 'test-key' for _, _, headers in stub.requests)
+
+
+def test_fetch_markets_deduplicates_coins_across_pages(client):
+    def handler(path, params, headers):
+        # Coins shifted by one rank between the two requests
+        page = int(params['page'])
+        return 200, market_page(page, 3) if page == 1 else market_page(1, 3)[2:] + market_page(2, 3)[:2], {}
+
+    with StubServer(handler) as stub:
+        records = client(stub.url).fetch_markets(pages=2, per_page=3)
+
+    assert [r['id'] for r in records] == ['coin-0', 'coin-1', 'coin-2', 'coin-3', 'coin-4']
+
+
+def test_get_retries_rate_limited_and_server_errors(client):
+    responses = iter([(429, {'error': 'rate limited'}, {'Retry-After': '0'}), (503, {}, {})])
+
+    def handler(path, params, headers):
+        return next(responses, (200, market_page(1, 2), {}))
+
+    with StubServer(handler) as stub:
+        records = client(stub.url).fetch_markets_page(1, per_page=2)
+
+    assert len(records) == 2
+    assert len(stub.requests) == 3
+
+
+def test_fetch_markets_skips_pages_that_keep_failing(client):
+    def handler(path, params, headers):
+        if params['page'] == '2':
+            return 500, {}, {}
+        return markets_handler(path, params, headers)
+
+    with StubServer(handler) as stub:
+        records = client(stub.url, max_retries=1).fetch_markets(pages=3, per_page=2)
+
+    assert [r['id'] for r in records] == ['coin-0', 'coin-1', 'coin-4', 'coin-5']
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=20, per=1.0, capacity=1)
+    start = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    # First token is available immediately, the remaining four refill at 20/s
+    assert time.monotonic() - start >= 0.19
+
+
+def test_clients_in_one_process_share_the_rate_budget(monkeypatch):
+    monkeypatch.setenv('CG_RATE_LIMIT_PER_MIN', '42')
+    # As built by extract_data_task and fanout_extract_task
+    markets, fanout = CoinGeckoClient(max_concurrency=2), CoinGeckoClient(max_concurrency=8)
+    own = TokenBucket(rate=42, per=60.0)
+
+    assert markets.rate_limiter is fanout.rate_limiter
+    assert CoinGeckoClient(rate_limiter=own).rate_limiter is own
+
+
+def test_extract_data_task_paginated_mode(monkeypatch):
+    with StubServer(markets_handler) as stub, \
+            mock.patch('etl_pipeline.extract_load.get_s3_client') as mock_s3, \
+            mock.patch('etl_pipeline.extract_load.create_dataframe_artifact'):
+        monkeypatch.setenv('CG_API_URL', stub.url)
+        monkeypatch.setenv('CG_RATE_LIMIT_PER_MIN', '6000')
+        data = extract_data_task.fn(pages=3, per_page=4, max_concurrency=2)
+
+    assert len(data) == 12
+    assert data['id'].is_unique
+    assert mock_s3.return_value.put_object.called
+
+
+def test_extract_data_task_single_page_uses_client(monkeypatch):
+    responses = iter([(503, {}, {'Retry-After': '0'})])
+
+    def handler(path, params, headers):
+        return next(responses, markets_handler(path, params, headers))
+
+    with StubServer(handler) as stub, \
+            mock.patch('etl_pipeline.extract_load.get_s3_client'), \
+            mock.patch('etl_pipeline.extract_load.create_dataframe_artifact'):
+        monkeypatch.setenv('CG_API_URL', stub.url)
+        monkeypatch.setenv('CG_RATE_LIMIT_PER_MIN', '6000')
+        monkeypatch.setattr(recorder, 'records', [])
+        data = extract_data_task.fn(per_page=5)
+
+    # CG_API_URL is honoured and the 503 retried
+    assert data['id'].tolist() == [f'coin-{i}' for i in range(5)]
+    assert [params['page'] for _, params, _ in stub.requests] == ['1', '1']
+    stages = {record['stage']: record for record in recorder.records}
+    assert stages['extract.http_fetch']['bytes'] == stages['extract.json_parse']['bytes'] > 0
+    assert stages['extract.json_parse']['rows'] == 5
+
+
+def test_conditional_requests_use_etag_and_last_modified(client):
+    def handler(path, params, headers):
+        if headers.get('If-None-Match') == '"v1"':
+            return 304, b'', {}
+        return 200, market_page(1, 2), {'ETag': '"v1"', 'Last-Modified': 'Fri, 28 Jun 2024 04:19:50 GMT'}
+
+    with StubServer(handler) as stub:
+        api = client(stub.url)
+        first, first_changed = api.fetch_markets_page_if_changed(1, per_page=2)
+        second, second_changed = api.fetch_markets_page_if_changed(1, per_page=2)
+
+    assert first_changed and not second_changed
+    assert second == first
+    headers = stub.requests[1][2]
+    assert headers['If-None-Match'] == '"v1"'
+    assert headers['If-Modified-Since'] == 'Fri, 28 Jun 2024 04:19:50 GMT'
+
+
+def test_identical_bodies_without_validators_count_as_unchanged(client, tmp_path):
+    prices = iter([1.0, 1.0, 2.0])
+
+    def handler(path, params, headers):
+        return 200, [dict(record, current_price=next(prices)) for record in market_page(1, 1)], {}
+
+    state = tmp_path / 'changes.json'
+
+    def poll(url):
+        tracker = ChangeTracker(str(state))
+        changed = client(url, change_tracker=tracker).fetch_markets_if_changed(1, 1)[1]
+        # The run loaded what it fetched
+        tracker.commit()
+        return changed
+
+    with StubServer(handler) as stub:
+        changed = [poll(stub.url) for _ in range(3)]
+
+    # Each poll uses a fresh tracker, so the body hashes carried over through the state file
+    assert changed == [True, False, True]
+    assert ChangeTracker(str(state)).skip_rate == round(1 / 3, 4)
+
+
+def test_rolled_back_response_counts_as_changed_on_the_next_poll(client, tmp_path):
+    def handler(path, params, headers):
+        if headers.get('If-None-Match') == '"v1"':
+            return 304, b'', {}
+        return 200, market_page(1, 2), {'ETag': '"v1"'}
+
+    state = tmp_path / 'changes.json'
+    tracker = ChangeTracker(str(state))
+    with StubServer(handler) as stub:
+        api = client(stub.url, change_tracker=tracker)
+        assert api.fetch_markets_if_changed(1, 2)[1]
+        # Not yet loaded: nothing about this response is persisted
+        assert ChangeTracker(str(state)).entries == {}
+        assert not api.fetch_markets_if_changed(1, 2)[1]
+
+        # The load failed: the same data must be loaded again
+        tracker.rollback()
+        assert api.fetch_markets_if_changed(1, 2)[1]
+        tracker.commit()
+        assert not api.fetch_markets_if_changed(1, 2)[1]
+
+    assert 'If-None-Match' not in stub.requests[2][2]
+    assert stub.requests[3][2]['If-None-Match'] == '"v1"'
+    assert list(ChangeTracker(str(state)).entries.values())[0]['etag'] == '"v1"'
+
+
+def test_commit_keeps_a_newer_staged_response():
+    tracker = ChangeTracker()
+    key = tracker.request_key('https://api.test/coins/markets', {'page': 1})
+    response = mock.Mock(status_code=200, content=b'[1]', headers={})
+    response.json.return_value = [1]
+    tracker.record(key, response)
+    first = tracker.pending()
+
+    response.content = b'[2]'
+    tracker.record(key, response)
+    tracker.commit(first)
+
+    # The second poll is still in flight; its rollback must not touch the committed first one
+    assert tracker.entries[key] is first[key]
+    assert tracker.pending()[key]['digest'] != first[key]['digest']
+    tracker.rollback()
+    assert tracker.pending() == {} and tracker.entries[key] is first[key]
+
+
+def test_extract_data_task_skips_archival_when_unchanged(monkeypatch):
+    with StubServer(markets_handler) as stub, \
+            mock.patch('etl_pipeline.extract_load.get_s3_client') as mock_s3, \
+            mock.patch('etl_pipeline.extract_load.create_dataframe_artifact'):
+        monkeypatch.setenv('CG_API_URL', stub.url)
+        monkeypatch.setenv('CG_RATE_LIMIT_PER_MIN', '6000')
+        first = extract_data_task.fn(pages=2, per_page=4)
+        second = extract_data_task.fn(pages=2, per_page=4)
+
+    assert not first.attrs.get('upstream_unchanged')
+    assert second.attrs['upstream_unchanged'] and len(second) == 8
+    assert mock_s3.return_value.put_object.call_count == 1
@@ -0,0 +1,128 @@
+import csv
+import io
+import struct
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from etl_pipeline import copy_writer
+from etl_pipeline.copy_writer import (
+    BOOL, FLOAT4, FLOAT8, INT4, INT8, TEXT, TIMESTAMP, BINARY_HEADER, IteratorReader, binary_copy_chunks,
+    copy_dataframe, csv_copy_chunks
+)
+
+
+def decode_binary(payload: bytes):
+    """Split a binary COPY stream back into rows of raw field bytes (None for NULL)."""
+    assert payload.startswith(BINARY_HEADER)
+    offset, rows = len(BINARY_HEADER), []
+    while True:
+        (count,) = struct.unpack_from('>h', payload, offset)
+        offset += 2
+        if count == -1:
+            assert offset == len(payload)
+            return rows
+        row = []
+        for _ in range(count):
+            (length,) = struct.unpack_from('>i', payload, offset)
+            offset += 4
+            row.append(None if length == -1 else payload[offset:offset + length])
+            offset += max(length, 0)
+        rows.append(row)
+
+
+def sample_frame():
+    return pd.DataFrame({
+        'id': ['bitcoin', 'ether-classic', None],
+        'name': ['Bitcoin', 'Ether, "Classic"', 'Ünïcode'],
+        'current_price': [64000.5, np.nan, 0.25],
+        'market_cap_rank': pd.array([1, None, 3], dtype='Int64'),
+        'last_updated': pd.to_datetime(['2000-01-01T00:00:01Z', None, '2024-06-28T04:19:50.625Z'], utc=True),
+        'is_stale': [False, True, None],
+    })
+
+
+TYPES = [TEXT, TEXT, FLOAT4, INT4, TIMESTAMP, BOOL]
+
+
+def test_binary_chunks_encode_postgres_types():
+    rows = decode_binary(b''.join(binary_copy_chunks(sample_frame(), TYPES, chunk_rows=2)))
+
+    assert len(rows) == 3
+    assert rows[0][0] == b'bitcoin' and rows[2][0] is None
+    assert rows[1][1] == 'Ether, "Classic"'.encode() and rows[2][1] == 'Ünïcode'.encode()
+    assert struct.unpack('>f', rows[0][2])[0] == np.float32(64000.5) and rows[1][2] is None
+    assert struct.unpack('>i', rows[2][3])[0] == 3 and rows[1][3] is None
+    # Microseconds since 2000-01-01 UTC
+    assert struct.unpack('>q', rows[0][4])[0] == 1_000_000 and rows[1][4] is None
+    assert pd.Timestamp('2000-01-01') + pd.Timedelta(microseconds=struct.unpack('>q', rows[2][4])[0]) == \
+        pd.Timestamp('2024-06-28 04:19:50.625')
+    assert rows[1][5] == b'\x01' and rows[0][5] == b'\x00' and rows[2][5] is None
+
+
+def test_binary_float8_keeps_double_precision():
+    frame = pd.DataFrame({'value': [1 / 3]})
+    rows = decode_binary(b''.join(binary_copy_chunks(frame, [FLOAT8])))
+    assert struct.unpack('>d', rows[0][0])[0] == 1 / 3
+
+
+def test_binary_int8_packs_integers_exactly():
+    big = 2 ** 53 + 1
+    frame = pd.DataFrame({
+        'plain': np.array([big, -big], dtype='int64'),
+        'nullable': pd.array([big, None], dtype='Int64'),
+        'objects': pd.Series([big, None], dtype=object),
+        'rounded': [2.6, np.nan],
+    })
+    rows = decode_binary(b''.join(binary_copy_chunks(frame, [INT8] * 4)))
+
+    assert [struct.unpack('>q', field)[0] for field in rows[0]] == [big, big, big, 3]
+    assert struct.unpack('>q', rows[1][0])[0] == -big and rows[1][1:] == [None, None, None]
+
+
+def test_csv_chunks_quote_delimiters_and_mark_nulls():
+    text = b''.join(csv_copy_chunks(sample_frame(), chunk_rows=1)).decode()
+    rows = list(csv.reader(io.StringIO(text)))
+
+    assert len(rows) == 3
+    assert rows[1][1] == 'Ether, "Classic"'
+    assert rows[1][2] == '' and rows[1][4] == ''
+    assert rows[2][4] == '2024-06-28 04:19:50.625000'
+
+
+def test_iterator_reader_serves_small_reads_across_chunks():
+    reader = IteratorReader(iter([b'abc', b'', b'defgh']))
+    assert reader.read(2) == b'ab'
+    assert reader.read(4) == b'c'
+    assert reader.read() == b'defgh'
+    assert reader.read(8) == b''
+    assert reader.bytes_read == 8
+
+
+def test_iterator_reader_small_reads_of_a_large_chunk():
+    chunk = bytes(range(256)) * 64
+    reader = IteratorReader(iter([chunk]))
+    buffer = bytearray(7)
+    received = bytearray()
+    while size := reader.readinto(buffer):
+        received += buffer[:size]
+    assert bytes(received) == chunk and reader.bytes_read == len(chunk)
+
+
+def test_copy_dataframe_streams_binary_and_falls_back_to_csv():
+    cur = mock.MagicMock()
+    sent = []
+    cur.copy_expert.side_effect = lambda statement, reader: sent.append((statement, reader.read()))
+    frame = sample_frame()[['id', 'current_price']]
+
+    with mock.patch.object(copy_writer.sql.Composed, 'as_string', lambda self, ctx: repr(self)):
+        size = copy_dataframe(cur, frame, 'staging', types={'id': TEXT, 'current_price': FLOAT4})
+        assert 'FORMAT binary' in sent[0][0]
+        assert decode_binary(sent[0][1])[0][0] == b'bitcoin'
+        assert size == len(sent[0][1])
+
+        # NUMERIC (1700) has no binary encoder here
+        copy_dataframe(cur, frame, 'staging', types={'id': TEXT, 'current_price': 1700})
+        assert 'FORMAT csv' in sent[1][0]
+        assert sent[1][1].startswith(b'bitcoin,64000.5\n')
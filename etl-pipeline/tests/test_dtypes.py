@@ -0,0 +1,144 @@
+import io
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import generate_market_frame
+from etl_pipeline import transform
+from etl_pipeline.copy_writer import BOOL, FLOAT4, INT4, TEXT, TIMESTAMP, binary_copy_chunks, csv_copy_chunks
+from etl_pipeline.dtypes import (
+    apply_market_dtypes, compact_market_frame, downcast_floats, frame_bytes, memory_report, to_wire_dtypes
+)
+from etl_pipeline.storage import CSVSerializer, JSONSerializer, ParquetSerializer
+
+# crypto_data column types, as load_data_task reads them from the table
+PG_TYPES = {
+    'id': TEXT, 'symbol': TEXT, 'name': TEXT, 'market_cap_rank': INT4, 'days_since_ath': INT4,
+    'market_cap_category': TEXT, 'has_max_supply': BOOL, 'significant_price_change': BOOL,
+    'last_updated': TIMESTAMP, 'ath_date': TIMESTAMP, 'atl_date': TIMESTAMP,
+}
+
+
+def transformed(compact: bool, monkeypatch) -> pd.DataFrame:
+    if not compact:
+        monkeypatch.setattr(transform, 'compact_market_frame', lambda data: data)
+    raw = generate_market_frame(500, seed=3)
+    if compact:
+        raw = apply_market_dtypes(raw)
+    data = transform.transform_market_data(raw)
+    monkeypatch.undo()
+    return data
+
+
+@pytest.fixture
+def frames(monkeypatch):
+    return transformed(False, monkeypatch), transformed(True, monkeypatch)
+
+
+def test_apply_market_dtypes():
+    data = apply_market_dtypes(pd.DataFrame({
+        'symbol': ['btc', 'eth', 'btc'],
+        'market_cap_rank': [1.0, None, 3.0],
+        'last_updated': ['2024-06-28T04:19:50.625Z', None, '2024-06-28T04:18:00Z'],
+    }))
+    assert isinstance(data['symbol'].dtype, pd.CategoricalDtype)
+    assert str(data['market_cap_rank'].dtype) == 'Int32'
+    assert data['market_cap_rank'].isna().tolist() == [False, True, False]
+    assert str(data['last_updated'].dtype) == 'datetime64[ns, UTC]'
+
+
+def test_fractional_or_out_of_range_values_keep_their_dtype():
+    data = apply_market_dtypes(pd.DataFrame({'market_cap_rank': [1.5, 2.0], 'year': [2024.0, 70000.0]}))
+    assert data['market_cap_rank'].dtype == 'float64'
+    assert data['year'].dtype == 'float64'
+
+
+def test_downcast_floats_only_when_exact():
+    data = pd.DataFrame({'exact': [0.5, 40000.0, np.nan], 'inexact': [0.1, 1.0, 2.0], 'huge': [1e300, 0.0, 1.0]})
+    assert downcast_floats(data) == ['exact']
+    assert data['exact'].dtype == np.float32
+    assert data['inexact'].dtype == np.float64 and data['huge'].dtype == np.float64
+
+
+def test_to_wire_dtypes_restores_output_dtypes():
+    data = compact_market_frame(pd.DataFrame({
+        'symbol': ['btc', 'eth'],
+        'market_cap_category': pd.Categorical(['Mega Cap', 'Small Cap']),
+        'market_cap_rank': [1.0, None],
+        'year': [2024.0, 2024.0],
+        'current_price': [0.5, 2.0],
+    }))
+    wire = to_wire_dtypes(data)
+    assert wire['symbol'].dtype == object
+    assert isinstance(wire['market_cap_category'].dtype, pd.CategoricalDtype)
+    assert wire['market_cap_rank'].dtype == 'float64'
+    assert wire['year'].dtype == 'int64'
+    assert wire['current_price'].dtype == 'float64'
+    plain = pd.DataFrame({'id': ['bitcoin'], 'current_price': [1.0]})
+    assert to_wire_dtypes(plain) is plain
+
+
+def test_compact_frame_uses_less_memory(frames):
+    legacy, compact = frames
+    assert frame_bytes(compact) < frame_bytes(legacy)
+    report = memory_report(compact)
+    assert {row['column'] for row in report} == set(compact.columns)
+    assert [row['bytes'] for row in report] == sorted((row['bytes'] for row in report), reverse=True)
+
+
+def test_compact_frame_holds_the_same_values(frames):
+    legacy, compact = frames
+    pd.testing.assert_frame_equal(to_wire_dtypes(compact), legacy, check_dtype=False, check_categorical=False)
+
+
+def read_output(serializer, payload: bytes) -> pd.DataFrame:
+    if isinstance(serializer, JSONSerializer):
+        return pd.DataFrame(json.loads(payload))
+    if isinstance(serializer, CSVSerializer):
+        return pd.read_csv(io.BytesIO(payload))
+    return pd.read_parquet(io.BytesIO(payload))
+
+
+@pytest.mark.parametrize('serializer', [JSONSerializer(), CSVSerializer(), ParquetSerializer()])
+def test_s3_outputs_hold_the_same_values(frames, serializer):
+    if isinstance(serializer, ParquetSerializer):
+        pytest.importorskip('pyarrow')
+    outputs = []
+    for data in frames:
+        buffer = io.BytesIO()
+        serializer.write(data, buffer)
+        outputs.append(read_output(serializer, buffer.getvalue()))
+    # Only market_cap_rank may differ in dtype: float64 in the legacy frame, int64 now
+    pd.testing.assert_frame_equal(*outputs, check_dtype=False)
+
+
+def test_json_is_byte_identical_apart_from_rank(frames):
+    outputs = []
+    for data in frames:
+        buffer = io.BytesIO()
+        JSONSerializer().write(data.drop(columns='market_cap_rank'), buffer)
+        outputs.append(buffer.getvalue())
+    assert outputs[0] == outputs[1]
+
+
+def test_copy_streams_match(frames):
+    legacy, compact = frames
+    columns = [column for column in legacy.columns if column in PG_TYPES or legacy[column].dtype == 'float64']
+    types = [PG_TYPES.get(column, FLOAT4) for column in columns]
+    assert b''.join(binary_copy_chunks(compact[columns], types)) == b''.join(binary_copy_chunks(legacy[columns], types))
+    text = [
+        pd.read_csv(io.BytesIO(b''.join(csv_copy_chunks(data[columns]))), header=None)
+        for data in (legacy, compact)
+    ]
+    pd.testing.assert_frame_equal(*text, check_dtype=False)
+
+
+def test_finalize_batches_recompacts_mixed_categories():
+    raw = apply_market_dtypes(generate_market_frame(200, seed=5))
+    pages = [transform.transform_market_data(raw.iloc[i:i + 50].copy(), cross_row=False) for i in range(0, 200, 50)]
+    data = transform.finalize_batches(pages)
+    assert isinstance(data['symbol'].dtype, pd.CategoricalDtype)
+    assert isinstance(data['market_cap_category'].dtype, pd.CategoricalDtype)
+    assert str(data['market_cap_rank'].dtype) == 'Int32'
@@ -1,5 +1,5 @@
 import pandas as pd
-from etl_pipeline.extract_load import extract_data_task, load_data_task
+from etl_pipeline.extract_load import extract_data_task, filter_unchanged, load_data_task
 from unittest import mock
 import sqlite3
 import pytest
@@ -36,3 +36,20 @@ def test_load_data_task(crypto_data):
         load_data_task.run(crypto_data)
         assert mock_cur.execute.called
         assert mock_conn.commit.called
+
+def test_filter_unchanged_skips_rows_not_newer_than_fingerprint():
+    data = pd.DataFrame({
+        'id': ['bitcoin', 'ethereum', 'solana', 'tether'],
+        'last_updated': pd.to_datetime([
+            '2024-06-28T04:20:00Z', '2024-06-28T04:19:00Z', '2024-06-28T04:19:00Z', None
+        ], utc=True),
+    })
+    fingerprints = {
+        'bitcoin': pd.Timestamp('2024-06-28T04:19:00Z'),
+        'ethereum': pd.Timestamp('2024-06-28T04:19:00Z'),
+        'tether': pd.Timestamp('2024-06-28T04:19:00Z'),
+    }
+    changed, skipped = filter_unchanged(data, fingerprints)
+    # bitcoin moved, solana is new and tether has no timestamp to compare
+    assert changed['id'].tolist() == ['bitcoin', 'solana', 'tether']
+    assert skipped == 1
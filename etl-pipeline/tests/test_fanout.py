@@ -0,0 +1,123 @@
+from datetime import datetime, timezone
+from unittest import mock
+
+import pytest
+
+from benchmarks.http_stub import StubServer
+from etl_pipeline import fanout
+from etl_pipeline.coingecko import CoinGeckoClient
+from etl_pipeline.fanout import GLOBAL_ID, QUOTE_COLUMNS, EndpointStats, fan_out, normalize, plan_requests
+from etl_pipeline.profiling import recorder
+
+RATES = {'usd': 1.0, 'eur': 0.9, 'btc': 1 / 60000}
+
+
+def fanout_handler(path, params, headers):
+    if path == '/coins/markets':
+        rate, page, per_page = RATES[params['vs_currency']], int(params['page']), int(params['per_page'])
+        return 200, [
+            {'id': f'coin-{i}', 'current_price': 100.0 * rate, 'market_cap': 1e9 * rate, 'total_volume': 1e7 * rate,
+             'price_change_percentage_24h': 1.5, 'market_cap_rank': i + 1, 'last_updated': '2024-06-28T04:19:50.625Z'}
+            for i in range((page - 1) * per_page, page * per_page)
+        ], {}
+    if path == '/global':
+        return 200, {'data': {
+            'total_market_cap': {c: 2e12 * r for c, r in RATES.items()},
+            'total_volume': {c: 8e10 * r for c, r in RATES.items()},
+            'updated_at': 1719548390,
+        }}, {}
+    if path == '/search/trending':
+        return 200, {'coins': [{'item': {'id': 'coin-3', 'score': 0}}, {'item': {'id': 'coin-1', 'score': 1}}]}, {}
+    return 404, {'error': 'not found'}, {}
+
+
+@pytest.fixture
+def client():
+    return lambda url, **kwargs: CoinGeckoClient(
+        base_url=url, rate_limit_per_minute=6000, backoff_factor=0.01, **kwargs
+    )
+
+
+def test_plan_requests_covers_every_currency_page_and_endpoint():
+    planned = plan_requests(['usd', 'eur'], ['markets', 'global'], pages=2, per_page=500)
+    assert [(label, params.get('page')) for label, _, _, params in planned] == [
+        ('markets.usd', 1), ('markets.usd', 2), ('markets.eur', 1), ('markets.eur', 2), ('global', None)
+    ]
+    assert all(params['per_page'] == 250 for label, _, _, params in planned if label.startswith('markets'))
+    with pytest.raises(ValueError):
+        plan_requests(['usd'], ['markets', 'sentiment'], pages=1, per_page=10)
+
+
+def test_fan_out_normalizes_currencies_and_endpoints(client):
+    currencies = ['usd', 'eur', 'btc']
+    planned = plan_requests(currencies, ['markets', 'global', 'trending'], pages=2, per_page=3)
+    stats = EndpointStats()
+    with StubServer(fanout_handler) as stub:
+        results = fan_out(client(stub.url, max_concurrency=4), planned, stats)
+    data = normalize(results, currencies, datetime(2024, 6, 28, 4, 20, tzinfo=timezone.utc))
+
+    assert len(stub.requests) == len(planned) == 8
+    assert data.columns.tolist() == QUOTE_COLUMNS
+    assert not data.duplicated(['id', 'vs_currency', 'ts']).any()
+    assert len(data) == 3 * 6 + 3
+    assert data['ts'].dt.tz is None and data['ts'].nunique() == 1
+
+    eur = data[(data['id'] == 'coin-0') & (data['vs_currency'] == 'eur')].iloc[0]
+    assert eur['current_price'] == pytest.approx(90.0)
+    totals = data[data['id'] == GLOBAL_ID].set_index('vs_currency')
+    assert totals.loc['btc', 'market_cap'] == pytest.approx(2e12 / 60000)
+    trending = data.drop_duplicates('id').set_index('id')['trending_rank']
+    assert trending['coin-3'] == 1 and trending['coin-1'] == 2 and trending.isna().sum() == 5
+
+
+def test_fan_out_shares_one_rate_budget(client):
+    planned = plan_requests(['usd', 'eur'], ['markets', 'global'], pages=2, per_page=2)
+    with StubServer(fanout_handler) as stub:
+        api = client(stub.url)
+        with mock.patch.object(api.rate_limiter, 'acquire', wraps=api.rate_limiter.acquire) as acquire:
+            fan_out(api, planned, EndpointStats())
+    assert acquire.call_count == len(planned)
+
+
+def test_failed_endpoints_are_counted_and_skipped(client):
+    def handler(path, params, headers):
+        if path == '/search/trending':
+            return 500, {'error': 'unavailable'}, {}
+        return fanout_handler(path, params, headers)
+
+    planned = plan_requests(['usd'], ['markets', 'trending'], pages=1, per_page=2)
+    stats = EndpointStats()
+    with StubServer(handler) as stub:
+        results = fan_out(client(stub.url, max_retries=1), planned, stats)
+    data = normalize(results, ['usd'], datetime(2024, 6, 28, tzinfo=timezone.utc))
+
+    assert data['id'].tolist() == ['coin-0', 'coin-1']
+    assert data['trending_rank'].isna().all()
+    report = {row['endpoint']: row for row in stats.report()}
+    assert report['trending']['errors'] == 1 and report['trending']['requests'] == 1
+    assert report['markets.usd']['errors'] == 0 and report['markets.usd']['rows'] == 2
+
+
+def test_endpoint_stats_publish_stage_records():
+    stats = EndpointStats()
+    stats.record('global', 0.2, rows=1)
+    stats.record('markets.eur', 0.1, rows=250)
+    stats.record('markets.eur', 0.3, error=True)
+    recorder.reset()
+    stats.publish()
+
+    records = {r['stage']: r for r in recorder.records}
+    eur = records['extract.fanout.markets.eur']
+    assert eur['requests'] == 2 and eur['errors'] == 1 and eur['rows'] == 250
+    assert eur['latency_p50_seconds'] == pytest.approx(0.2) and eur['latency_max_seconds'] == pytest.approx(0.3)
+    assert 'etl_stage_errors{stage="extract.fanout.markets.eur"} 1' in recorder.to_prometheus()
+    recorder.reset()
+
+
+def test_fanout_extract_task_reads_currencies_from_env(monkeypatch):
+    monkeypatch.setenv('FANOUT_CURRENCIES', 'usd, EUR')
+    monkeypatch.setenv('FANOUT_ENDPOINTS', 'markets')
+    with StubServer(fanout_handler) as stub, mock.patch.object(fanout, 'create_table_artifact') as artifact:
+        data = fanout.fanout_extract_task.fn(per_page=2, base_url=stub.url)
+    assert sorted(data['vs_currency'].unique()) == ['eur', 'usd']
+    assert {row['endpoint'] for row in artifact.call_args.kwargs['table']} == {'markets.usd', 'markets.eur'}
@@ -0,0 +1,45 @@
+from datetime import date
+from unittest import mock
+
+import pandas as pd
+
+from etl_pipeline import history
+from etl_pipeline.history import expired_partitions, partition_day, partition_name, to_history_frame
+
+
+def test_partition_name_round_trips():
+    assert partition_name(date(2024, 6, 28)) == 'crypto_prices_history_p20240628'
+    assert partition_day('crypto_prices_history_p20240628') == date(2024, 6, 28)
+    assert partition_day('crypto_prices_history_default') is None
+
+
+def test_expired_partitions_keeps_retention_window():
+    names = [partition_name(date(2024, 6, day)) for day in (1, 27, 28, 29)] + ['crypto_prices_history_default']
+    assert expired_partitions(names, today=date(2024, 6, 29), retention_days=2) == ['crypto_prices_history_p20240601']
+    assert expired_partitions(names, today=date(2024, 6, 29), retention_days=1) == [
+        'crypto_prices_history_p20240601', 'crypto_prices_history_p20240627'
+    ]
+
+
+def test_to_history_frame_normalizes_timestamps_and_drops_undated_rows():
+    data = pd.DataFrame({
+        'id': ['bitcoin', 'ethereum'],
+        'symbol': ['btc', 'eth'],
+        'name': ['Bitcoin', 'Ethereum'],
+        'current_price': [40000.0, 3000.0],
+        'market_cap_rank': [1.0, None],
+        'last_updated': pd.to_datetime(['2024-06-28T04:19:50Z', None], utc=True),
+    })
+    frame = to_history_frame(data)
+    assert frame.columns.tolist() == ['id', 'symbol', 'current_price', 'market_cap_rank', 'last_updated']
+    assert frame['id'].tolist() == ['bitcoin']
+    assert frame['last_updated'].dt.tz is None
+
+
+def test_ensure_partitions_creates_each_day_once():
+    cur = mock.Mock()
+    with mock.patch.object(history, '_known_partitions', set()):
+        history.ensure_partitions(cur, [date(2024, 6, 28), date(2024, 6, 29)])
+        history.ensure_partitions(cur, [date(2024, 6, 29)])
+    # CREATE TABLE for the parent plus one per partition; the repeat call issues no DDL
+    assert cur.execute.call_count == 3
@@ -0,0 +1,120 @@
+from contextlib import contextmanager
+from unittest import mock
+
+import pandas as pd
+import pytest
+
+from benchmarks.http_stub import StubServer
+from benchmarks.synthetic import generate_market_payload
+from etl_pipeline import pipeline
+from etl_pipeline.coingecko import CoinGeckoClient
+from etl_pipeline.transform import transform_market_data
+
+PAYLOAD = generate_market_payload(12)
+
+
+def markets_handler(path, params, headers):
+    page, per_page = int(params['page']), int(params['per_page'])
+    if page == 3:
+        return 404, {'error': 'not found'}, {}
+    return 200, PAYLOAD[(page - 1) * per_page:page * per_page], {}
+
+
+@contextmanager
+def fake_connection():
+    yield mock.MagicMock()
+
+
+@pytest.fixture
+def stub():
+    with StubServer(markets_handler) as server, \
+            mock.patch.object(pipeline, 'db_connection', fake_connection), \
+            mock.patch.object(pipeline, 'update_rollups'), \
+            mock.patch.object(pipeline, 'update_market_metrics'), \
+            mock.patch.object(pipeline, 'get_s3_client'):
+        yield server
+
+
+def make_run(stub, **kwargs):
+    client = CoinGeckoClient(base_url=stub.url, api_key='test-key', rate_limit_per_minute=60000, max_retries=0)
+    uploader = mock.Mock()
+    uploader.close.return_value = []
+    return pipeline.PipelinedRun(pages=4, per_page=3, client=client, uploader=uploader, **kwargs)
+
+
+def upsert(conn, data, incremental):
+    return {'rows_received': len(data), 'rows_skipped': 0, 'rows_written': len(data),
+            'freshness_p50_seconds': 1.0, 'freshness_max_seconds': 2.0}, data
+
+
+def test_pages_are_loaded_batch_by_batch_in_page_order(stub):
+    run = make_run(stub)
+    with mock.patch.object(pipeline, 'upsert_crypto_data', side_effect=upsert) as load:
+        data = run.run()
+
+    # Page 3 failed and was skipped, as in the sequential extract
+    assert [stats['batch'] for stats in run.batch_stats] == [1, 2, 4]
+    assert [len(call.args[1]) for call in load.call_args_list] == [3, 3, 3]
+    assert data['id'].tolist() == [r['id'] for r in PAYLOAD[:6] + PAYLOAD[9:]]
+    assert run.totals()['rows_written'] == 9
+    assert all(stats['fetch_to_visible_seconds'] >= 0 for stats in run.batch_stats)
+
+    # Raw then processed snapshots go to the background uploader
+    prefixes = [call.args[2] for call in run.uploader.submit.call_args_list]
+    assert prefixes == ['raw_crypto_data', 'transformed_crypto_data']
+    assert len(run.uploader.submit.call_args_list[0].args[1]) == 9
+
+    # Rollups are merged once, from the whole market rather than page by page
+    assert pipeline.update_rollups.call_count == 1
+    assert len(pipeline.update_rollups.call_args.args[1]) == 9
+
+
+def test_final_frame_has_whole_market_metrics(stub):
+    run = make_run(stub)
+    with mock.patch.object(pipeline, 'upsert_crypto_data', side_effect=upsert) as load:
+        data = run.run()
+
+    expected = transform_market_data(pd.DataFrame(PAYLOAD[:6] + PAYLOAD[9:]))
+    pd.testing.assert_series_equal(data['market_dominance'], expected['market_dominance'])
+    # Pages are loaded without dominance, which is written once from the whole market
+    assert all('market_dominance' not in call.args[1].columns for call in load.call_args_list)
+    pipeline.update_market_metrics.assert_called_once()
+    assert pipeline.update_market_metrics.call_args.args[1] is data
+
+
+def test_load_error_is_raised_after_stages_drain(stub):
+    run = make_run(stub)
+    with mock.patch.object(pipeline, 'upsert_crypto_data', side_effect=RuntimeError("database unavailable")):
+        with pytest.raises(RuntimeError, match="database unavailable"):
+            run.run()
+
+    run.uploader.close.assert_called_once()
+
+
+def test_unchanged_pages_are_not_reloaded(stub):
+    with mock.patch.object(pipeline, 'upsert_crypto_data', side_effect=upsert):
+        make_run(stub).run()
+
+    # Only page 2 moves before the second run
+    def handler(path, params, headers):
+        status, body, extra = markets_handler(path, params, headers)
+        if params['page'] == '2':
+            body = [dict(coin, current_price=coin['current_price'] * 2) for coin in body]
+        return status, body, extra
+
+    stub.handler = handler
+    run = make_run(stub)
+    with mock.patch.object(pipeline, 'upsert_crypto_data', side_effect=upsert) as load:
+        data = run.run()
+    assert [stats['batch'] for stats in run.batch_stats] == [2]
+    assert load.call_count == 1 and len(data) == 9
+    assert pipeline.update_rollups.call_count == 2
+
+    run = make_run(stub)
+    with mock.patch.object(pipeline, 'upsert_crypto_data', side_effect=upsert) as load:
+        data = run.run()
+    assert data.attrs['upstream_unchanged'] and len(data) == 9
+    load.assert_not_called()
+    run.uploader.submit.assert_not_called()
+    assert pipeline.update_rollups.call_count == 2
+    assert run.client.changes.skip_rate == round(1 / 3, 4)
@@ -0,0 +1,105 @@
+import json
+import threading
+import time
+
+from etl_pipeline.profiling import StageRecorder, recorder, write_metrics
+
+
+def test_stage_records_timings_rows_and_bytes():
+    stages = StageRecorder()
+    with stages.stage('load.copy', rows=1000) as stage:
+        stage.bytes = 2048
+        sum(range(10000))
+
+    record, = stages.records
+    assert record['stage'] == 'load.copy'
+    assert record['rows'] == 1000 and record['bytes'] == 2048
+    assert record['wall_seconds'] > 0 and record['cpu_seconds'] >= 0
+    # Without tracemalloc only the process-lifetime RSS peak is known, under its own name
+    assert record['process_peak_rss_bytes'] > 0 and 'peak_memory_bytes' not in record
+    assert record['rows_per_second'] == round(1000 / record['wall_seconds'], 2)
+
+
+def test_cpu_seconds_exclude_other_threads():
+    stages = StageRecorder()
+    done = threading.Event()
+
+    def spin():
+        while not done.is_set():
+            pass
+
+    thread = threading.Thread(target=spin)
+    thread.start()
+    try:
+        with stages.stage('load.wait'):
+            time.sleep(0.3)
+    finally:
+        done.set()
+        thread.join()
+
+    record, = stages.records
+    assert record['cpu_seconds'] < 0.1 < record['wall_seconds']
+
+
+def test_step_timer_records_each_lap():
+    stages = StageRecorder()
+    steps = stages.steps('transform', rows=10)
+    steps.lap('parse_timestamps')
+    steps.lap('coerce_numeric')
+    assert [r['stage'] for r in stages.records] == ['transform.parse_timestamps', 'transform.coerce_numeric']
+
+
+def test_prometheus_and_jsonl_exports():
+    stages = StageRecorder()
+    stages.add('extract.http_fetch', wall_seconds=0.5, cpu_seconds=0.1, bytes=100)
+
+    prometheus = stages.to_prometheus()
+    assert '# TYPE etl_stage_wall_seconds gauge' in prometheus
+    assert 'etl_stage_wall_seconds{stage="extract.http_fetch"} 0.5' in prometheus
+    assert 'etl_stage_rows{' not in prometheus
+
+    line = json.loads(stages.to_jsonl(run_at='2024-06-28T04:19:50+00:00'))
+    assert line['run_at'] == '2024-06-28T04:19:50+00:00' and line['bytes'] == 100
+
+
+def test_prometheus_aggregates_repeated_stages_into_one_series():
+    stages = StageRecorder()
+    stages.add('load.copy', wall_seconds=0.5, cpu_seconds=0.1, rows=100, bytes=1000)
+    stages.add('load.copy', wall_seconds=1.5, cpu_seconds=0.3, rows=300, bytes=3000)
+    stages.add('archive.put', wall_seconds=0.2, cpu_seconds=0.0)
+
+    prometheus = stages.to_prometheus()
+    samples = [line.split(' ')[0] for line in prometheus.splitlines() if not line.startswith('#')]
+    assert len(samples) == len(set(samples))
+    assert 'etl_stage_runs{stage="load.copy"} 2' in prometheus
+    assert 'etl_stage_wall_seconds{stage="load.copy"} 2.0' in prometheus
+    assert 'etl_stage_rows{stage="load.copy"} 400' in prometheus
+    assert 'etl_stage_rows_per_second{stage="load.copy"} 200.0' in prometheus
+
+
+def test_write_metrics_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(recorder, 'records', [])
+    recorder.add('transform.flatten_roi', wall_seconds=0.25, cpu_seconds=0.2, rows=10)
+    write_metrics(jsonl_path=tmp_path / 'metrics.jsonl', prometheus_path=str(tmp_path / 'etl.prom'))
+    write_metrics(jsonl_path=tmp_path / 'metrics.jsonl')
+    assert len((tmp_path / 'metrics.jsonl').read_text().splitlines()) == 2
+    assert 'stage="transform.flatten_roi"' in (tmp_path / 'etl.prom').read_text()
+
+
+def test_profiling_captures_stages_on_worker_threads(tmp_path):
+    stages = StageRecorder()
+    stages.enable_profiling()
+
+    def work():
+        with stages.stage('outer'):
+            with stages.stage('inner'):
+                sorted(range(1000), key=lambda x: -x)
+
+    thread = threading.Thread(target=work)
+    thread.start()
+    thread.join()
+    output = stages.dump_profiles(str(tmp_path))
+
+    assert len(stages.profiles) == 1  # nested stages share the outer profiler
+    assert list(output.glob('profile_*.prof')) and list(output.glob('tracemalloc_*.txt'))
+    assert '<lambda>' in next(output.glob('profile_*.txt')).read_text()
@@ -0,0 +1,75 @@
+import pandas as pd
+
+from etl_pipeline import raw_cache
+from etl_pipeline.raw_cache import RawCache, cache_raw_response
+
+FETCHED_AT = pd.Timestamp('2024-06-28 04:19:50')
+# Keeps the fixed 2024 timestamps clear of age eviction on write
+NO_AGE_LIMIT = 10 ** 5
+
+
+def payload(price):
+    return [{'id': 'bitcoin', 'current_price': price}, {'id': 'ethereum', 'current_price': 3000.0}]
+
+
+def test_identical_responses_share_one_object(tmp_path):
+    cache = RawCache(tmp_path, max_age_days=NO_AGE_LIMIT)
+    first = cache.put(payload(1.0), FETCHED_AT)
+    second = cache.put(payload(1.0), FETCHED_AT + pd.Timedelta(minutes=1))
+    third = cache.put(payload(2.0), FETCHED_AT + pd.Timedelta(minutes=2))
+
+    assert first.digest == second.digest != third.digest
+    assert len(list((tmp_path / 'objects').glob('*/*.json.gz'))) == 2
+    assert cache.get(third.digest) == payload(2.0)
+    assert [s.fetched_at for s in cache.snapshots()] == [FETCHED_AT + pd.Timedelta(minutes=i) for i in range(3)]
+
+
+def test_snapshots_filter_by_time_range_across_days(tmp_path):
+    cache = RawCache(tmp_path, max_age_days=NO_AGE_LIMIT)
+    times = [FETCHED_AT + pd.Timedelta(hours=12 * i) for i in range(5)]
+    for i, fetched_at in enumerate(times):
+        cache.put(payload(float(i)), fetched_at)
+
+    found = cache.snapshots(times[1], times[4])
+    assert [s.fetched_at for s in found] == times[1:4]
+    # Timezone-aware bounds are compared in UTC
+    assert cache.snapshots(start=times[3].tz_localize('UTC').tz_convert('Asia/Tokyo')) == cache.snapshots(times[3])
+
+
+def test_evict_by_age_then_size_keeps_newest(tmp_path):
+    cache = RawCache(tmp_path, max_bytes=10 ** 9, max_age_days=NO_AGE_LIMIT)
+    for i in range(4):
+        cache.put(payload(float(i)), FETCHED_AT + pd.Timedelta(days=i))
+    cache.max_age_days = 1
+
+    stats = cache.evict(now=FETCHED_AT + pd.Timedelta(days=2, hours=1))
+    assert stats['snapshots_evicted'] == 2 and stats['objects_evicted'] == 2
+    assert [s.fetched_at.day for s in cache.snapshots()] == [30, 1]
+    assert not (tmp_path / 'index' / '2024-06-28').exists()
+
+    object_size = cache.object_path(cache.snapshots()[-1].digest).stat().st_size
+    cache.max_bytes = object_size
+    cache.evict(now=FETCHED_AT + pd.Timedelta(days=2, hours=1))
+    assert [s.fetched_at.day for s in cache.snapshots()] == [1]
+    assert len(list((tmp_path / 'objects').glob('*/*.json.gz'))) == 1
+
+
+def test_explicit_zero_limits_are_not_replaced_by_defaults(tmp_path, monkeypatch):
+    monkeypatch.setenv('RAW_CACHE_MAX_BYTES', str(10 ** 9))
+    cache = RawCache(tmp_path, max_bytes=0, max_age_days=NO_AGE_LIMIT)
+    cache.put(payload(1.0), FETCHED_AT)
+
+    assert cache.max_bytes == 0
+    assert cache.evict(now=FETCHED_AT)['bytes_kept'] == 0
+    assert RawCache(tmp_path, max_age_days=0).max_age_days == 0
+
+
+def test_cache_raw_response_is_off_without_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.delenv('RAW_CACHE_DIR', raising=False)
+    assert cache_raw_response(payload(1.0)) is None
+
+    monkeypatch.setenv('RAW_CACHE_DIR', str(tmp_path))
+    monkeypatch.setenv('RAW_CACHE_MAX_AGE_DAYS', str(NO_AGE_LIMIT))
+    monkeypatch.setattr(raw_cache, '_cache', {'value': None})
+    snapshot = cache_raw_response(payload(1.0), FETCHED_AT)
+    assert raw_cache.get_raw_cache().get(snapshot.digest) == payload(1.0)
@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from unittest import mock
+
+import pandas as pd
+import pytest
+from psycopg2 import errors
+
+from benchmarks.synthetic import generate_market_payload
+from etl_pipeline import replay
+from etl_pipeline.raw_cache import RawCache
+from etl_pipeline.storage import archive, get_object_store, get_serializer
+
+START = pd.Timestamp('2024-06-28 04:00:00')
+
+
+@contextmanager
+def fake_connection():
+    yield mock.MagicMock()
+
+
+def upsert(conn, data, incremental):
+    return {'rows_received': len(data), 'rows_skipped': 0, 'rows_written': len(data)}, data
+
+
+@pytest.fixture
+def database():
+    with mock.patch.object(replay, 'db_connection', fake_connection), \
+            mock.patch.object(replay, 'upsert_crypto_data', side_effect=upsert) as load, \
+            mock.patch.object(replay, 'update_rollups') as rollups, \
+            mock.patch.object(replay, 'load_history_task') as history:
+        yield load, rollups, history
+
+
+def test_archived_files_parse_flat_and_partitioned_keys(tmp_path, monkeypatch):
+    monkeypatch.setenv('OBJECT_STORE_ROOT', str(tmp_path))
+    store = get_object_store('raw')
+    for minutes, partitioned in ((0, False), (1, True), (2, False)):
+        monkeypatch.setenv('S3_PARTITIONING', 'hive' if partitioned else 'flat')
+        archive(store, generate_market_payload(3), 'raw_crypto_data', get_serializer('json'),
+                START + pd.Timedelta(minutes=minutes))
+    archive(store, generate_market_payload(3), 'transformed_crypto_data', get_serializer('csv'), START)
+
+    files = replay.archived_files(START + pd.Timedelta(minutes=1), START + pd.Timedelta(minutes=5), bucket='raw')
+
+    assert [f.fetched_at for f in files] == [START + pd.Timedelta(minutes=1), START + pd.Timedelta(minutes=2)]
+    assert files[0].key.startswith('raw_crypto_data/dt=2024-06-28/')
+    assert len(replay.read_raw(files[0])) == 3
+
+
+def test_replay_file_transforms_and_loads_newer_rows_only(tmp_path, database):
+    load, rollups, history = database
+    cache = RawCache(tmp_path, max_age_days=10 ** 5)
+    snapshot = cache.put(generate_market_payload(20), START)
+
+    result = replay.replay_file(replay.ReplayFile(START, 'cache', str(tmp_path), snapshot.digest))
+
+    assert result['error'] is None and result['rows'] == 20 and result['rows_written'] == 20
+    data = load.call_args.args[1]
+    assert load.call_args.kwargs['incremental'] is True
+    assert data['id'].is_monotonic_increasing
+    assert 'market_cap_category' in data.columns
+    rollups.assert_called_once()
+    history.fn.assert_called_once()
+
+
+def test_replay_file_retries_deadlocks_and_reports_failures(tmp_path, database):
+    load, _, _ = database
+    cache = RawCache(tmp_path, max_age_days=10 ** 5)
+    file = replay.ReplayFile(START, 'cache', str(tmp_path), cache.put(generate_market_payload(5), START).digest)
+
+    load.side_effect = [errors.DeadlockDetected(), upsert(None, pd.DataFrame(range(5)), True)]
+    assert replay.replay_file(file, history=False)['error'] is None
+    assert load.call_count == 2
+
+    missing = file._replace(key='0' * 64)
+    assert 'No such file' in replay.replay_file(missing)['error']
+
+
+def test_replay_runs_every_cached_file_in_range(tmp_path, monkeypatch, database):
+    monkeypatch.setenv('RAW_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(replay, 'get_raw_cache', lambda: RawCache(tmp_path, max_age_days=10 ** 5))
+    cache = RawCache(tmp_path, max_age_days=10 ** 5)
+    for minutes in range(6):
+        cache.put(generate_market_payload(4, seed=minutes), START + pd.Timedelta(minutes=minutes))
+
+    # Threads stand in for worker processes so the database mocks apply
+    def executor(max_workers, mp_context, initializer, initargs):
+        return ThreadPoolExecutor(max_workers=max_workers)
+
+    with mock.patch.object(replay, 'ProcessPoolExecutor', executor), \
+            mock.patch.object(replay, 'prepare_replay', return_value=set()) as prepare:
+        summary = replay.replay(START + pd.Timedelta(minutes=1), START + pd.Timedelta(minutes=5), workers=2)
+
+    assert len(prepare.call_args.args[0]) == 4
+    assert summary['files'] == summary['replayed'] == 4
+    assert summary['failed'] == 0 and summary['rows'] == 16
@@ -0,0 +1,61 @@
+from unittest import mock
+
+import pytest
+
+from etl_pipeline import resources
+
+
+@pytest.fixture(autouse=True)
+def fresh_resources(monkeypatch):
+    monkeypatch.setattr(resources, '_credentials', {'value': None, 'expires_at': 0.0})
+    monkeypatch.setattr(resources, '_s3', {'client': None, 'credentials': None})
+    monkeypatch.setattr(resources, 'metrics', resources.ResourceMetrics())
+
+
+def test_credentials_and_s3_client_are_built_once():
+    with mock.patch.object(resources, 'AwsCredentials') as credentials, \
+            mock.patch.object(resources, 'boto3') as boto3:
+        clients = [resources.get_s3_client() for _ in range(3)]
+
+    assert credentials.load.call_count == 1
+    assert boto3.client.call_count == 1
+    assert clients[0] is clients[1] is clients[2]
+    report = {row['resource']: row for row in resources.metrics.report()}
+    assert report['s3_client']['created'] == 1 and report['s3_client']['reused'] == 2
+    assert report['aws_credentials']['reused'] == 2
+
+
+def test_expired_credentials_are_reloaded_and_client_rebuilt(monkeypatch):
+    monkeypatch.setenv('AWS_CREDENTIALS_TTL', '0')
+    with mock.patch.object(resources, 'AwsCredentials') as credentials, \
+            mock.patch.object(resources, 'boto3') as boto3:
+        credentials.load.side_effect = [mock.MagicMock(), mock.MagicMock()]
+        resources.get_s3_client()
+        resources.get_s3_client()
+
+    assert credentials.load.call_count == 2
+    assert boto3.client.call_count == 2
+
+
+def test_db_connection_is_reused_while_healthy(monkeypatch):
+    monkeypatch.setattr(resources, '_db', {'conn': None, 'checked_at': 0.0})
+    with mock.patch.object(resources.psycopg2, 'connect') as connect:
+        connect.return_value.closed = 0
+        connect.return_value.info.transaction_status = resources.extensions.TRANSACTION_STATUS_IDLE
+        with resources.db_connection() as first:
+            pass
+        with resources.db_connection() as second:
+            pass
+
+    assert connect.call_count == 1
+    assert first is second
+
+
+def test_metrics_estimate_saved_setup_time():
+    metrics = resources.ResourceMetrics()
+    metrics.created('s3_client', 0.2)
+    metrics.reused('s3_client')
+    metrics.reused('s3_client')
+    assert metrics.report() == [
+        {'resource': 's3_client', 'created': 1, 'reused': 2, 'setup_seconds': 0.2, 'saved_seconds': 0.4}
+    ]
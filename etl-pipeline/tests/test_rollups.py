@@ -0,0 +1,75 @@
+from datetime import datetime
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import generate_market_frame
+from etl_pipeline import rollups
+from etl_pipeline.rollups import STAGING_COLUMNS, retention_cutoffs, to_rollup_frame, volatility_histogram_sql
+from etl_pipeline.transform import transform_market_data
+
+
+def test_to_rollup_frame_selects_staging_columns_as_naive_utc():
+    data = transform_market_data(generate_market_frame(20))
+    rollup = to_rollup_frame(data)
+
+    assert rollup.columns.tolist() == STAGING_COLUMNS
+    assert rollup['last_updated'].dt.tz is None
+    assert rollup['last_updated'].iloc[0] == data['last_updated'].iloc[0].tz_localize(None)
+    assert set(rollup['market_cap_category'].dropna()) <= {'Small Cap', 'Mid Cap', 'Large Cap', 'Mega Cap'}
+
+
+def test_to_rollup_frame_fills_missing_columns():
+    data = pd.DataFrame({'id': ['bitcoin'], 'current_price': [1.0], 'last_updated': ['2024-06-28T04:19:50Z']})
+    rollup = to_rollup_frame(data)
+
+    assert rollup.columns.tolist() == STAGING_COLUMNS
+    assert np.isnan(rollup.loc[0, 'market_dominance'])
+
+
+def test_volatility_histogram_covers_every_bin():
+    histogram = volatility_histogram_sql()
+
+    assert histogram.count('jsonb_build_object') == len(rollups.VOLATILITY_BINS) + 1
+    assert "volatility >= 0.0 AND volatility < 0.01" in histogram
+    assert "'upper', NULL" in histogram
+
+
+def test_retention_cutoffs_use_env_overrides(monkeypatch):
+    now = datetime(2024, 6, 28)
+    monkeypatch.setenv('ROLLUP_RETENTION_DAYS_1M', '2')
+
+    cutoffs = retention_cutoffs(now)
+    assert cutoffs == {'1m': datetime(2024, 6, 26), '1h': datetime(2023, 12, 31)}
+    assert retention_cutoffs(now, {'1m': None, '1h': None, '1d': 30}) == {'1d': datetime(2024, 5, 29)}
+
+
+def test_update_rollups_skips_ddl_once_tables_exist(monkeypatch):
+    monkeypatch.setattr(rollups, '_tables_ready', False)
+    conn = mock.MagicMock()
+    cur = conn.cursor.return_value
+    data = transform_market_data(generate_market_frame(5))
+
+    with mock.patch.object(rollups.sql, 'SQL') as sql:
+        sql.return_value.format.return_value.as_string.return_value = 'COPY rollup_staging FROM STDIN'
+        rollups.update_rollups(conn, data)
+        rollups.update_rollups(conn, data)
+
+    statements = [call.args[0] for call in cur.execute.call_args_list]
+    assert statements.count(rollups.CREATE_ROLLUP_TABLES) == 1
+    assert statements.count(rollups.UPSERT_COIN_CANDLES) == 2
+    assert statements.count(rollups.UPSERT_CATEGORY_CANDLES) == 2
+    assert conn.commit.call_count == 2
+
+
+def test_rollup_retention_ends_transaction_when_tables_are_missing():
+    conn = mock.MagicMock()
+    conn.cursor.return_value.fetchone.return_value = (False,)
+
+    with mock.patch.object(rollups, 'db_connection') as db_connection:
+        db_connection.return_value.__enter__.return_value = conn
+        assert rollups.rollup_retention_task.fn() == 0
+
+    assert conn.rollback.called
+    assert conn.cursor.return_value.close.called
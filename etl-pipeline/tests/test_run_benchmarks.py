@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from benchmarks import run_benchmarks
+from benchmarks.run_benchmarks import compare, main
+
+
+def result(benchmark, rows_per_second, peak_memory_bytes, rows=1000):
+    return {'benchmark': benchmark, 'rows': rows, 'seconds': rows / rows_per_second,
+            'rows_per_second': rows_per_second, 'peak_memory_bytes': peak_memory_bytes}
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    path = tmp_path / 'baseline.json'
+    path.write_text(json.dumps({'environment': {}, 'results': [
+        result('transform', 1000.0, 1000),
+        result('copy_buffer', 1000.0, 1000),
+        result('artifact_json', 1000.0, None),
+    ]}))
+    return str(path)
+
+
+def test_compare_flags_slowdowns_and_memory_growth_beyond_threshold(baseline, capsys):
+    results = [
+        result('transform', 850.0, 1100),     # within 20% both ways
+        result('copy_buffer', 700.0, 1000),   # 30% slower
+        result('artifact_json', 1000.0, 5000),  # no baseline memory to compare
+        result('artifact_preview', 10.0, 1),  # not in the baseline
+    ]
+
+    regressions = compare(results, baseline, threshold=0.2)
+
+    assert [r['benchmark'] for r in regressions] == ['copy_buffer']
+    assert compare([result('transform', 1000.0, 1300)], baseline, threshold=0.2)
+    assert compare([result('copy_buffer', 700.0, 1000)], baseline, threshold=0.5) == []
+    assert 'REGRESSION' in capsys.readouterr().out
+
+
+def test_compare_matches_results_by_row_count(baseline):
+    assert compare([result('copy_buffer', 10.0, 1000, rows=10)], baseline, threshold=0.2) == []
+
+
+def test_main_exits_non_zero_on_regression(baseline, monkeypatch, tmp_path):
+    monkeypatch.setattr(run_benchmarks, 'run_suite', lambda *args, **kwargs: [result('copy_buffer', 500.0, 1000)])
+    # main() silences INFO logging for the whole process
+    monkeypatch.setattr(run_benchmarks.logging, 'disable', lambda level: None)
+    output = tmp_path / 'results.json'
+
+    assert main(['--compare', baseline, '--output', str(output)]) == 1
+    assert main(['--compare', baseline, '--threshold', '0.6']) == 0
+    assert json.loads(output.read_text())['results'][0]['benchmark'] == 'copy_buffer'
@@ -0,0 +1,126 @@
+from unittest import mock
+
+import pytest
+
+from etl_pipeline import schema
+
+
+@pytest.fixture(autouse=True)
+def fresh_schema(monkeypatch):
+    monkeypatch.setattr(schema, '_schema', {'columns': None, 'version': 0})
+    monkeypatch.setattr(schema, '_sessions', schema.weakref.WeakKeyDictionary())
+
+
+def connection(*column_reads):
+    """A mock connection whose pg_attribute reads return `column_reads` in turn."""
+    conn = mock.MagicMock()
+    cur = conn.cursor.return_value
+    cur.fetchall.side_effect = [list(columns.items()) for columns in column_reads]
+    return conn, cur
+
+
+def statements(cur):
+    return [call.args[0] for call in cur.execute.call_args_list]
+
+
+def composed(statement):
+    return repr(statement)
+
+
+def test_ensure_schema_creates_table_and_migrates_once():
+    all_columns = {name: 25 for name, _ in schema.BASE_COLUMNS + schema.MIGRATIONS}
+    conn, cur = connection({}, all_columns)
+
+    assert schema.ensure_schema(conn) == all_columns
+    assert schema.ensure_schema(conn) == all_columns
+
+    ddl = [composed(s) for s in statements(cur) if not isinstance(s, str)]
+    assert len(ddl) == 1 + len(schema.MIGRATIONS)
+    assert 'CREATE TABLE IF NOT EXISTS' in ddl[0]
+    assert all('ADD COLUMN IF NOT EXISTS' in statement for statement in ddl[1:])
+    # Two catalog reads on the first call, none on the second
+    assert cur.fetchall.call_count == 2
+    conn.commit.assert_called_once()
+
+
+def test_ensure_schema_issues_no_ddl_when_up_to_date():
+    all_columns = {name: 25 for name, _ in schema.BASE_COLUMNS + schema.MIGRATIONS}
+    conn, cur = connection(all_columns)
+
+    schema.ensure_schema(conn)
+
+    assert all(isinstance(statement, str) for statement in statements(cur))
+
+
+def test_ensure_schema_creates_missing_keyset_index():
+    all_columns = {name: 25 for name, _ in schema.BASE_COLUMNS + schema.MIGRATIONS}
+    conn, cur = connection(all_columns)
+    cur.fetchone.return_value = (None,)
+
+    schema.ensure_schema(conn)
+
+    ddl = [composed(s) for s in statements(cur) if not isinstance(s, str)]
+    assert len(ddl) == 1 and 'CREATE INDEX IF NOT EXISTS' in ddl[0]
+    assert schema.MARKET_CAP_INDEX in ddl[0]
+
+
+def test_staging_table_and_prepared_upsert_are_reused_per_session():
+    conn, cur = connection()
+
+    for _ in range(3):
+        prepared = schema.ensure_staging(conn, cur)
+        schema.execute_upsert(cur, prepared, ['id', 'current_price'], newer_only=False)
+    schema.execute_upsert(cur, prepared, ['id', 'current_price'], newer_only=True)
+
+    executed = [composed(s) for s in statements(cur)]
+    assert sum('CREATE TEMP TABLE' in s for s in executed) == 1
+    assert sum('PREPARE' in s for s in executed) == 2
+    assert sum('EXECUTE' in s for s in executed) == 4
+
+
+def test_schema_change_rebuilds_session_staging():
+    all_columns = {name: 25 for name, _ in schema.BASE_COLUMNS + schema.MIGRATIONS}
+    conn, cur = connection(all_columns, all_columns)
+    schema.ensure_schema(conn)
+    prepared = schema.ensure_staging(conn, cur)
+    schema.execute_upsert(cur, prepared, ['id'], newer_only=False)
+
+    schema.reset_schema()
+    schema.ensure_schema(conn)
+    schema.ensure_staging(conn, cur)
+
+    executed = [composed(s) for s in statements(cur)]
+    assert any('DEALLOCATE' in s for s in executed)
+    assert any('DROP TABLE IF EXISTS' in s for s in executed)
+    assert sum('CREATE TEMP TABLE' in s for s in executed) == 2
+
+
+def test_forgotten_session_drops_staging_left_by_a_failed_load():
+    conn, cur = connection()
+    prepared = schema.ensure_staging(conn, cur)
+    schema.execute_upsert(cur, prepared, ['id'], newer_only=False)
+
+    # The load failed and rolled back; the old staging table and PREPARE outlive the rollback
+    schema.reset_session(conn)
+    cur.execute.reset_mock()
+    schema.ensure_staging(conn, cur)
+
+    executed = [composed(s) if not isinstance(s, str) else s for s in statements(cur)]
+    assert executed[0] == 'DEALLOCATE ALL'
+    assert 'DROP TABLE IF EXISTS' in executed[1]
+    assert 'CREATE TEMP TABLE' in executed[2] and 'IF NOT EXISTS' not in executed[2]
+
+
+def test_upsert_statement_only_overwrites_newer_rows_when_asked():
+    assert 'last_updated' not in composed(schema.upsert_statement(['id', 'name'], newer_only=False))
+    incremental = composed(schema.upsert_statement(['id', 'name', 'last_updated'], newer_only=True))
+    assert 'last_updated < excluded.last_updated' in incremental
+
+
+def test_notify_changes_names_coins_or_asks_for_a_full_reread():
+    cur = mock.Mock()
+    schema.notify_changes(cur, ['bitcoin', 'ethereum'])
+    assert cur.execute.call_args.args[1] == (schema.CHANGES_CHANNEL, '{"ids":["bitcoin","ethereum"]}')
+
+    schema.notify_changes(cur, [f'coin-{i}' for i in range(2000)])
+    assert cur.execute.call_args.args[1] == (schema.CHANGES_CHANNEL, '{"ids": null}')
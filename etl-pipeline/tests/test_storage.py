@@ -0,0 +1,118 @@
+import json
+from datetime import datetime
+import threading
+from io import StringIO
+from unittest import mock
+
+import pandas as pd
+import pytest
+
+from etl_pipeline.storage import (
+    BackgroundUploader, CSVSerializer, JSONSerializer, LocalObjectStore, ObjectStore, ParquetSerializer, S3ObjectStore,
+    archive, get_object_store, get_serializer, object_key
+)
+
+SNAPSHOT_TIME = datetime(2024, 6, 28, 4, 19, 50)
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({
+        'id': ['bitcoin', 'ethereum'],
+        'name': ['Bitcoin', 'Ether, Classic'],
+        'current_price': [40000.5, None],
+        'last_updated': pd.to_datetime(['2024-06-28T04:19:50Z', '2024-06-28T04:18:00Z'], utc=True),
+    })
+
+
+def test_object_key_layouts():
+    assert object_key('raw_crypto_data', 'json', SNAPSHOT_TIME, partitioned=False) == \
+        'raw_crypto_data_20240628041950.json'
+    assert object_key('raw_crypto_data', 'parquet', SNAPSHOT_TIME, partitioned=True) == \
+        'raw_crypto_data/dt=2024-06-28/hour=04/raw_crypto_data_20240628041950.parquet'
+
+
+def test_incomplete_backend_fails_at_construction():
+    class WriteOnlyStore(ObjectStore):
+        def put(self, key, body, content_type=None):
+            pass
+
+    with pytest.raises(TypeError, match='get'):
+        WriteOnlyStore()
+
+
+def test_json_and_csv_match_previous_output(tmp_path, frame):
+    store = LocalObjectStore(tmp_path)
+    records = [{'id': 'bitcoin', 'roi': None}, {'id': 'ethereum', 'roi': {'times': 1.5}}]
+
+    json_key = archive(store, records, 'raw_crypto_data', JSONSerializer(), SNAPSHOT_TIME)
+    csv_key = archive(store, frame, 'transformed_crypto_data', CSVSerializer(), SNAPSHOT_TIME)
+
+    assert store.get(json_key) == json.dumps(records).encode()
+    expected_csv = StringIO()
+    frame.to_csv(expected_csv)
+    assert store.get(csv_key) == expected_csv.getvalue().encode()
+    assert store.list() == [json_key, csv_key]
+
+
+def test_parquet_round_trip(tmp_path, frame):
+    pytest.importorskip('pyarrow')
+    store = LocalObjectStore(tmp_path)
+    key = archive(store, frame, 'transformed_crypto_data', ParquetSerializer('zstd'), SNAPSHOT_TIME)
+    pd.testing.assert_frame_equal(pd.read_parquet(tmp_path / key), frame)
+
+
+def test_s3_store_streams_buffer_to_put_object(frame):
+    client = mock.Mock()
+    key = archive(S3ObjectStore('processed', client), frame, 'transformed', CSVSerializer(), SNAPSHOT_TIME)
+    kwargs = client.put_object.call_args.kwargs
+    assert kwargs['Bucket'] == 'processed' and kwargs['Key'] == key
+    assert hasattr(kwargs['Body'], 'read')
+
+
+def test_get_object_store_uses_local_root_when_configured(tmp_path, monkeypatch):
+    monkeypatch.setenv('OBJECT_STORE_ROOT', str(tmp_path))
+    store = get_object_store('raw-bucket')
+    assert isinstance(store, LocalObjectStore) and store.root == tmp_path / 'raw-bucket'
+
+
+def test_get_serializer_rejects_unknown_format():
+    with pytest.raises(ValueError):
+        get_serializer('xml')
+
+
+def test_background_uploader_bounds_in_flight_uploads(tmp_path, frame):
+    release = threading.Event()
+    running = []
+
+    class SlowStore(LocalObjectStore):
+        def put(self, key, body, content_type=None):
+            running.append(key)
+            release.wait(5)
+            super().put(key, body, content_type)
+
+    uploader = BackgroundUploader(max_workers=1, max_in_flight=2)
+    store = SlowStore(tmp_path)
+    uploader.submit(store, frame, 'a', JSONSerializer(), SNAPSHOT_TIME)
+    uploader.submit(store, frame, 'b', JSONSerializer(), SNAPSHOT_TIME)
+
+    third = threading.Thread(target=uploader.submit, args=(store, frame, 'c', JSONSerializer(), SNAPSHOT_TIME))
+    third.start()
+    third.join(0.2)
+    assert third.is_alive()
+
+    release.set()
+    third.join(5)
+    keys = uploader.close()
+    assert sorted(keys) == ['a_20240628041950.json', 'b_20240628041950.json', 'c_20240628041950.json']
+    assert uploader.failed == 0
+
+
+def test_background_uploader_logs_failures(frame):
+    store = mock.Mock()
+    store.put.side_effect = RuntimeError("access denied")
+    uploader = BackgroundUploader(max_workers=1, max_in_flight=1)
+    uploader.submit(store, frame, 'raw', JSONSerializer(), SNAPSHOT_TIME)
+
+    assert uploader.close() == []
+    assert uploader.failed == 1
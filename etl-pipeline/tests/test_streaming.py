@@ -0,0 +1,140 @@
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from unittest import mock
+
+import pytest
+
+from benchmarks.http_stub import StubServer
+from benchmarks.synthetic import generate_market_payload
+from etl_pipeline import streaming
+from etl_pipeline.coingecko import CoinGeckoClient
+
+PAYLOAD = generate_market_payload(6)
+polls = itertools.count()
+
+
+def markets_handler(path, params, headers):
+    # Prices move on every request, so no poll is skipped as unchanged
+    page, per_page = int(params['page']), int(params['per_page'])
+    price = float(next(polls))
+    return 200, [dict(coin, current_price=price) for coin in PAYLOAD[(page - 1) * per_page:page * per_page]], {}
+
+
+def static_handler(path, params, headers):
+    page, per_page = int(params['page']), int(params['per_page'])
+    return 200, PAYLOAD[(page - 1) * per_page:page * per_page], {}
+
+
+@contextmanager
+def fake_connection():
+    yield mock.MagicMock()
+
+
+@pytest.fixture
+def worker_factory():
+    stubs = []
+
+    def make(handler=markets_handler, **kwargs):
+        stub = StubServer(handler).__enter__()
+        stubs.append(stub)
+        client = CoinGeckoClient(base_url=stub.url, api_key='test-key', rate_limit_per_minute=60000)
+        return streaming.StreamingWorker(
+            interval=0.01, pages=2, per_page=3, history=False, archive_batches=False, client=client, **kwargs
+        )
+
+    with mock.patch.object(streaming, 'db_connection', fake_connection), \
+            mock.patch.object(streaming, 'update_rollups'), \
+            mock.patch.object(streaming, 'close_db_connection'):
+        yield make
+    for stub in stubs:
+        stub.__exit__()
+
+
+def test_batches_flow_through_transform_and_load(worker_factory):
+    loaded = []
+
+    def upsert(conn, data, incremental):
+        loaded.append(data)
+        return {'rows_received': len(data), 'rows_skipped': 0, 'rows_written': len(data)}, data
+
+    worker = worker_factory()
+    with mock.patch.object(streaming, 'upsert_crypto_data', side_effect=upsert):
+        stats = worker.run(max_batches=3)
+
+    assert stats['loaded'] >= 3
+    assert stats['failed'] == 0
+    assert stats['rows_written'] == 6 * stats['loaded']
+    # Loaded frames went through transform_market_data
+    assert 'market_cap_category' in loaded[0].columns
+    assert stats['last_lag_seconds'] is not None
+
+
+def test_slow_loader_applies_backpressure(worker_factory):
+    release = threading.Event()
+
+    def upsert(conn, data, incremental):
+        release.wait(5)
+        return {'rows_received': len(data), 'rows_skipped': 0, 'rows_written': len(data)}, data
+
+    worker = worker_factory(queue_size=1)
+    with mock.patch.object(streaming, 'upsert_crypto_data', side_effect=upsert):
+        worker.start()
+        time.sleep(0.5)
+        # One batch in the loader, one per queue and one blocked in the extractor's put
+        assert worker.stats['extracted'] <= 4
+        worker.stop()
+        release.set()
+        worker.join(5)
+
+    assert not any(thread.is_alive() for thread in worker.threads)
+    assert worker.stats['loaded'] == worker.stats['extracted']
+
+
+def test_failed_load_does_not_stop_the_stream(worker_factory):
+    calls = []
+
+    def upsert(conn, data, incremental):
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("database unavailable")
+        return {'rows_received': len(data), 'rows_skipped': 0, 'rows_written': len(data)}, data
+
+    worker = worker_factory()
+    with mock.patch.object(streaming, 'upsert_crypto_data', side_effect=upsert):
+        stats = worker.run(max_batches=3)
+
+    assert stats['failed'] >= 1
+    assert stats['loaded'] >= 1
+
+
+def test_snapshot_of_a_failed_load_is_loaded_again(worker_factory):
+    calls = []
+
+    def upsert(conn, data, incremental):
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("database unavailable")
+        return {'rows_received': len(data), 'rows_skipped': 0, 'rows_written': len(data)}, data
+
+    # Every poll returns the same data: only the rollback makes it count as changed again
+    worker = worker_factory(handler=static_handler)
+    with mock.patch.object(streaming, 'upsert_crypto_data', side_effect=upsert):
+        stats = worker.run(duration=1.0)
+
+    assert stats['failed'] == 1 and stats['loaded'] == 1
+    assert len(calls) == 2
+    assert worker.client.changes.pending() == {}
+
+
+def test_unchanged_polls_stop_at_the_extractor(worker_factory):
+    worker = worker_factory(handler=static_handler)
+    with mock.patch.object(streaming, 'upsert_crypto_data', side_effect=lambda conn, data, incremental: (
+            {'rows_received': len(data), 'rows_skipped': 0, 'rows_written': len(data)}, data)) as upsert:
+        stats = worker.run(max_batches=4)
+
+    assert stats['extracted'] == stats['loaded'] == 1
+    assert stats['unchanged'] >= 3
+    assert upsert.call_count == 1
+    assert worker.client.changes.skip_rate >= 0.75
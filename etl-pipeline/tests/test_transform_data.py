@@ -1,5 +1,11 @@
+import numpy as np
 import pandas as pd
-from etl_pipeline.transform import transform_data_task
+from benchmarks.bench_transform import legacy_coerce_numeric, legacy_flatten_roi
+from benchmarks.synthetic import generate_market_frame
+from etl_pipeline import transform
+from etl_pipeline.transform import (
+    coerce_numeric, finalize_batches, flatten_roi, transform_data_task, transform_market_data
+)
 
 def test_transform_data_task():
     data = pd.DataFrame({
@@ -21,3 +27,43 @@ def test_transform_data_task():
     assert transformed_data['market_cap'].dtype == 'float64'
     assert transformed_data['total_volume'].dtype == 'float64'
     assert transformed_data.isnull().sum().sum() == 0
+
+
+def test_coerce_numeric_matches_safe_convert():
+    series = pd.Series([1, 2.5, '3.25', None, np.nan, 'n/a', '', '1e3', True], dtype=object)
+    pd.testing.assert_series_equal(coerce_numeric(series), legacy_coerce_numeric(series))
+
+
+def test_flatten_roi_matches_parse_roi():
+    roi = pd.Series([
+        {'times': 1.5, 'currency': 'btc', 'percentage': 150.0},
+        None,
+        np.nan,
+        {'times': '2', 'percentage': 'bad'},
+        {'times': None, 'currency': 'eth', 'percentage': None},
+        {},
+    ], index=[10, 11, 12, 13, 14, 15])
+    pd.testing.assert_frame_equal(flatten_roi(roi), legacy_flatten_roi(roi))
+
+
+def test_transform_market_data_matches_per_element_implementation(monkeypatch):
+    raw = generate_market_frame(500, seed=7)
+    raw.loc[::50, 'current_price'] = 'not-a-number'
+
+    vectorized = transform_market_data(raw.copy())
+    monkeypatch.setattr(transform, 'coerce_numeric', legacy_coerce_numeric)
+    monkeypatch.setattr(transform, 'flatten_roi', legacy_flatten_roi)
+    legacy = transform_market_data(raw.copy())
+
+    pd.testing.assert_frame_equal(vectorized, legacy)
+
+
+def test_batched_transform_matches_whole_frame():
+    raw = generate_market_frame(300, seed=3)
+    raw.loc[::40, 'market_cap_rank'] = None
+
+    whole = transform_market_data(raw.copy())
+    batches = [transform_market_data(raw.iloc[i:i + 100].copy(), cross_row=False) for i in range(0, 300, 100)]
+    batched = finalize_batches(batches)
+
+    pd.testing.assert_frame_equal(batched.drop(columns='days_since_ath'), whole.drop(columns='days_since_ath'))
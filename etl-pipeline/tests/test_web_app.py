@@ -0,0 +1,437 @@
+from collections import namedtuple
+from contextlib import contextmanager
+from pathlib import Path
+from unittest import mock
+import os
+import runpy
+import socket
+
+import pytest
+
+from web_app import app as web_app
+from web_app import push
+from web_app.cache import ResponseCache
+from web_app.push import RESYNC, ChangeFeed, Subscriber, pending_ids
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """Route the web app's pooled connections to a mock cursor returning canned rows."""
+    cursor = mock.MagicMock()
+    cursor.__enter__.return_value = cursor
+    cursor.fetchall.return_value = [{'id': 'bitcoin', 'name': 'Bitcoin', 'market_cap': 7e11}]
+    conn = mock.MagicMock()
+    conn.cursor.return_value = cursor
+
+    @contextmanager
+    def get_connection():
+        yield conn
+
+    version = {'value': ('2024-06-28T04:19:50', 1)}
+    monkeypatch.setattr(web_app, 'get_connection', get_connection)
+    monkeypatch.setattr(web_app, 'data_version', lambda: version['value'])
+    monkeypatch.setattr(web_app, 'response_cache', ResponseCache(ttl=60))
+    return cursor, version
+
+
+@pytest.fixture
+def client():
+    return web_app.app.test_client()
+
+
+def test_crypto_data_is_served_from_cache_until_version_changes(fake_db, client):
+    cursor, version = fake_db
+
+    first = client.get('/api/crypto_data')
+    second = client.get('/api/crypto_data')
+    assert first.json == second.json == [{'id': 'bitcoin', 'name': 'Bitcoin', 'market_cap': 7e11}]
+    assert cursor.execute.call_count == 1
+
+    version['value'] = ('2024-06-28T04:20:50', 1)
+    client.get('/api/crypto_data')
+    assert cursor.execute.call_count == 2
+
+
+def test_crypto_data_cache_is_keyed_on_query_parameters(fake_db, client):
+    cursor, _ = fake_db
+    client.get('/api/crypto_data?limit=5')
+    client.get('/api/crypto_data?limit=20')
+    client.get('/api/crypto_data?limit=5')
+    assert [c.args[1] for c in cursor.execute.call_args_list] == [(5,), (20,)]
+
+
+def test_crypto_data_answers_matching_etag_with_not_modified(fake_db, client):
+    etag = client.get('/api/crypto_data').headers['ETag']
+    response = client.get('/api/crypto_data', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+    response = client.get('/api/crypto_data', headers={'If-None-Match': '"stale"'})
+    assert response.status_code == 200
+
+
+def test_data_version_changes_when_only_the_candles_were_committed(monkeypatch):
+    cursor = mock.MagicMock()
+    cursor.__enter__.return_value = cursor
+    conn = mock.MagicMock()
+    conn.cursor.return_value = cursor
+
+    @contextmanager
+    def get_connection():
+        yield conn
+
+    monkeypatch.setattr(web_app, 'get_connection', get_connection)
+    monkeypatch.setattr(web_app, 'VERSION_CHECK_INTERVAL', 0)
+    monkeypatch.setattr(web_app, '_version', {'value': None, 'checked_at': 0.0})
+    upserted = ('2024-06-28T04:19:50', 5, True)
+    cursor.fetchone.side_effect = [upserted, ('2024-06-28T04:18:50',), upserted, ('2024-06-28T04:19:50',)]
+
+    # Between the crypto_data commit and the rollup commit, then after both
+    assert web_app.data_version() != web_app.data_version()
+
+    cursor.fetchone.side_effect = [('2024-06-28T04:19:50', 5, False)]
+    assert web_app.data_version() == ('2024-06-28T04:19:50', 5, None)
+
+
+def test_response_cache_expires_after_ttl():
+    cache = ResponseCache(ttl=0)
+    cache.set('key', 1, b'[]')
+    assert cache.get('key', 1) is None
+
+
+def test_coin_candles_filter_and_paginate(fake_db, client):
+    cursor, _ = fake_db
+    cursor.fetchall.return_value = [{'id': 'bitcoin', 'bucket_start': i} for i in range(3)]
+
+    response = client.get('/api/rollups/coins/bitcoin?interval=1d&start=2024-06-01T00:00:00Z&limit=2&offset=4')
+    assert response.status_code == 200
+    assert response.json['data'] == [{'id': 'bitcoin', 'bucket_start': 0}, {'id': 'bitcoin', 'bucket_start': 1}]
+    assert response.json['next_offset'] == 6
+
+    params = cursor.execute.call_args.args[1]
+    assert params[:3] == ('bitcoin', '1d', web_app.datetime(2024, 6, 1))
+    # One extra row is read to tell whether another page exists
+    assert params[-2:] == (3, 4)
+
+
+def test_rollup_endpoints_reject_bad_filters(fake_db, client):
+    assert client.get('/api/rollups/categories?interval=5m').status_code == 400
+    assert client.get('/api/rollups/coins/bitcoin?start=yesterday').status_code == 400
+
+
+def test_category_summary_reads_latest_candles(fake_db, client):
+    cursor, _ = fake_db
+    cursor.fetchall.return_value = [{'market_cap_category': 'Mega Cap', 'dominance_close': 0.5}]
+
+    response = client.get('/api/rollups/categories?interval=1h')
+    assert response.json == [{'market_cap_category': 'Mega Cap', 'dominance_close': 0.5}]
+    assert 'DISTINCT ON (market_cap_category)' in cursor.execute.call_args.args[0]
+
+
+MARKET_ROWS = [
+    {'id': f'coin-{i}', 'name': f'Coin {i}', 'market_cap': 1e9 - i, 'current_price': float(i),
+     'last_updated': web_app.datetime(2024, 6, 28, 4, 19, 50)}
+    for i in range(5)
+]
+
+
+class FakeCursor:
+    """Answers the catalog query with the market columns and any other query with `rows`."""
+
+    def __init__(self, rows, name=None):
+        self.rows, self.name, self.executed, self.fetched = rows, name, [], 0
+        self.itersize = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+    def fetchall(self):
+        if 'information_schema' in str(self.executed[-1][0]):
+            return [(column,) for column in MARKET_ROWS[0]]
+        return self.rows
+
+    def fetchmany(self, size):
+        batch = self.rows[self.fetched:self.fetched + size]
+        self.fetched += len(batch)
+        return batch
+
+
+@pytest.fixture
+def fake_markets(monkeypatch):
+    """Pooled connections whose cursors serve MARKET_ROWS; returns every cursor opened."""
+    cursors = []
+    conn = mock.MagicMock()
+
+    def cursor(name=None, cursor_factory=None):
+        cursors.append(FakeCursor(MARKET_ROWS, name))
+        return cursors[-1]
+
+    conn.cursor.side_effect = cursor
+
+    @contextmanager
+    def get_connection():
+        yield conn
+
+    monkeypatch.setattr(web_app, 'get_connection', get_connection)
+    monkeypatch.setattr(web_app, 'data_version', lambda: ('2024-06-28T04:19:50', 5))
+    monkeypatch.setattr(web_app, 'response_cache', ResponseCache(ttl=60))
+    monkeypatch.setattr(web_app, '_columns', {})
+    return cursors, conn
+
+
+def executed_sql(cursor):
+    query, params = cursor.executed[-1]
+    return repr(query), params
+
+
+def test_markets_page_projects_fields_and_returns_next_cursor(fake_markets, client):
+    cursors, _ = fake_markets
+    response = client.get('/api/markets?fields=name,current_price&limit=4')
+
+    assert response.status_code == 200
+    assert response.json['data'] == [{'name': f'Coin {i}', 'current_price': float(i)} for i in range(4)]
+    assert web_app.decode_cursor(response.json['next_cursor']) == (1e9 - 3, 'coin-3')
+
+    query, params = executed_sql(cursors[-1])
+    # Key columns are read for the cursor even when projected out
+    assert "Identifier('market_cap'), SQL(', '), Identifier('id')" in query
+    assert 'ORDER BY market_cap DESC NULLS LAST, id DESC' in query
+    assert params == [5]
+
+
+def test_markets_after_cursor_continues_from_the_key(fake_markets, client):
+    cursors, _ = fake_markets
+    after = web_app.encode_cursor(999999997.0, 'coin-3')
+    client.get(f'/api/markets?fields=id&limit=2&after={after}')
+    query, params = executed_sql(cursors[-1])
+    assert 'market_cap < %s::real OR (market_cap = %s::real AND id < %s)' in query
+    assert params == [999999997.0, 999999997.0, 'coin-3', 3]
+
+    client.get(f"/api/markets?after={web_app.encode_cursor(None, 'coin-9')}")
+    query, params = executed_sql(cursors[-1])
+    assert 'market_cap IS NULL AND id < %s' in query and params[0] == 'coin-9'
+
+
+def test_markets_reject_unknown_fields_and_bad_cursors(fake_markets, client):
+    cursors, _ = fake_markets
+    assert client.get('/api/markets?fields=id,password').status_code == 400
+    # The catalog is re-read once before an unknown field is refused
+    assert sum('information_schema' in str(c.executed[0][0]) for c in cursors) == 2
+    assert client.get('/api/markets?after=not-a-cursor').status_code == 400
+    assert client.get('/api/markets?format=xml').status_code == 400
+
+
+def test_markets_stream_ndjson_from_a_named_cursor(fake_markets, client, monkeypatch):
+    cursors, conn = fake_markets
+    monkeypatch.setattr(web_app, 'STREAM_BATCH_ROWS', 2)
+    response = client.get('/api/markets?format=ndjson&fields=id,last_updated')
+
+    lines = [web_app.json.loads(line) for line in response.data.splitlines()]
+    assert response.mimetype == 'application/x-ndjson'
+    assert lines[0] == {'id': 'coin-0', 'last_updated': '2024-06-28T04:19:50+00:00'}
+    assert len(lines) == 5
+    streamed = cursors[-1]
+    assert streamed.name is not None and streamed.itersize == 2
+    # No LIMIT unless asked for, and the transaction the named cursor needed is ended
+    assert 'LIMIT' not in executed_sql(streamed)[0]
+    conn.rollback.assert_called_once()
+    assert conn.autocommit is True
+
+
+def test_markets_stream_csv_compressed(fake_markets, client):
+    import gzip
+
+    response = client.get('/api/markets?format=csv&fields=id,market_cap&limit=3', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    text = gzip.decompress(response.data).decode()
+    assert text.splitlines()[:2] == ['id,market_cap', 'coin-0,1000000000.0']
+
+
+def test_large_json_pages_are_compressed_with_a_distinct_etag(fake_markets, client, monkeypatch):
+    import gzip
+
+    monkeypatch.setattr(web_app, 'COMPRESS_MIN_BYTES', 10)
+    plain = client.get('/api/markets')
+    compressed = client.get('/api/markets', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in plain.headers
+    assert web_app.json.loads(gzip.decompress(compressed.data)) == plain.json
+    assert compressed.headers['ETag'] != plain.headers['ETag']
+    revalidated = client.get('/api/markets', headers={'Accept-Encoding': 'gzip', 'If-None-Match': compressed.headers['ETag']})
+    assert revalidated.status_code == 304
+
+
+def test_cached_bodies_are_compressed_once_per_encoding(fake_markets, client, monkeypatch):
+    compress = mock.Mock(side_effect=web_app.encoding.compress)
+    monkeypatch.setattr(web_app.encoding, 'compress', compress)
+    monkeypatch.setattr(web_app, 'COMPRESS_MIN_BYTES', 10)
+    for _ in range(3):
+        assert client.get('/api/markets', headers={'Accept-Encoding': 'gzip'}).status_code == 200
+    assert compress.call_count == 1
+
+
+def test_history_before_the_table_exists_is_unavailable(fake_markets, client, monkeypatch):
+    monkeypatch.setattr(web_app, 'table_columns', lambda table, refresh=False: [])
+    assert client.get('/api/history/bitcoin').status_code == 503
+
+
+def test_fallback_encoder_writes_non_finite_floats_as_null(monkeypatch):
+    row = {'price': float('nan'), 'cap': [float('inf'), 1.5], 'supply': web_app.encoding.Decimal('NaN')}
+    expected = b'{"price":null,"cap":[null,1.5],"supply":null}'
+    if web_app.encoding.orjson is not None:
+        assert web_app.encoding.dumps(row) == expected
+    monkeypatch.setattr(web_app.encoding, 'orjson', None)
+    assert web_app.encoding.dumps(row) == expected
+
+
+def test_history_streams_one_coin_between_bounds(fake_markets, client):
+    cursors, _ = fake_markets
+    response = client.get('/api/history/bitcoin?fields=id,current_price&format=csv&start=2024-06-01T00:00:00Z')
+    assert response.data.decode().splitlines()[0] == 'id,current_price'
+    query, params = executed_sql(cursors[-1])
+    assert 'crypto_prices_history' in query
+    assert params[:3] == ['bitcoin', web_app.datetime(2024, 6, 1), web_app.datetime(2024, 6, 1)]
+
+
+def test_history_ignores_rollup_only_parameters(fake_markets, client):
+    assert client.get('/api/history/bitcoin?interval=5m&limit=abc').status_code == 200
+    assert client.get('/api/history/bitcoin?start=yesterday').status_code == 400
+
+
+def test_streams_prefer_brotli_when_installed(fake_markets, client):
+    brotli = pytest.importorskip('brotli')
+    response = client.get('/api/markets?format=ndjson&fields=id', headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert brotli.decompress(response.data).splitlines()[0] == b'{"id":"coin-0"}'
+
+
+def coin(coin_id, market_cap):
+    return {'id': coin_id, 'name': coin_id.title(), 'market_cap': market_cap}
+
+
+def test_change_feed_diffs_and_fans_out_only_changed_coins():
+    feed = ChangeFeed(max_clients=2)
+    feed.rows = {'bitcoin': coin('bitcoin', 7e11), 'ethereum': coin('ethereum', 4e11)}
+    first, second = Subscriber(), Subscriber()
+    feed.subscribers.update({first, second})
+
+    diff = feed.apply([coin('bitcoin', 7e11), coin('ethereum', 4.1e11)], {'bitcoin', 'ethereum'})
+    assert diff['changed'] == [coin('ethereum', 4.1e11)] and diff['removed'] == []
+    assert first.next(0) is diff and second.next(0) is diff
+
+    # Nothing changed: nothing is sent
+    assert feed.apply([coin('bitcoin', 7e11)], {'bitcoin'}) is None
+    assert first.next(0) is None
+
+    # A full re-read also reports coins that disappeared
+    diff = feed.apply([coin('bitcoin', 7e11)])
+    assert diff['removed'] == ['ethereum'] and diff['sequence'] == 2
+    assert feed.snapshot() == {'sequence': 2, 'rows': [coin('bitcoin', 7e11)]}
+
+
+def test_slow_subscriber_gets_a_resync_instead_of_a_backlog():
+    subscriber = Subscriber(maxsize=2)
+    for sequence in range(4):
+        subscriber.offer({'sequence': sequence})
+    # 0 and 1 filled the queue; 2 overflowed it, so the client resyncs and then gets 3
+    assert subscriber.next(0) is RESYNC
+    assert subscriber.next(0) == {'sequence': 3}
+    assert subscriber.next(0) is None
+    assert subscriber.resyncs == 1
+
+
+def test_pending_ids_coalesce_a_burst_of_notifications():
+    Notify = namedtuple('Notify', 'payload')
+    assert pending_ids([Notify('{"ids":["a","b"]}'), Notify('{"ids":["b","c"]}')]) == {'a', 'b', 'c'}
+    assert pending_ids([Notify('{"ids":["a"]}'), Notify('{"ids":null}')]) is None
+    assert pending_ids([Notify('not json')]) is None
+
+
+@pytest.fixture
+def live_feed(monkeypatch):
+    """The app's change feed with a known snapshot and no listener thread."""
+    feed = ChangeFeed(max_clients=1)
+    feed.rows = {'bitcoin': coin('bitcoin', 7e11)}
+    feed.thread = mock.Mock(is_alive=lambda: True)
+    monkeypatch.setattr(web_app, 'change_feed', feed)
+    return feed
+
+
+def test_stream_sends_snapshot_then_diffs_and_limits_clients(live_feed, client):
+    response = client.get('/api/stream', buffered=False)
+    events = iter(response.response)
+    assert response.mimetype == 'text/event-stream'
+    assert next(events) == b'id: 0\nevent: snapshot\ndata: [{"id":"bitcoin","name":"Bitcoin","market_cap":700000000000.0}]\n\n'
+
+    # Only one client allowed
+    refused = client.get('/api/stream')
+    assert refused.status_code == 503 and 'Retry-After' in refused.headers
+
+    live_feed.apply([coin('solana', 8e10)], {'solana'})
+    assert next(events) == b'id: 1\nevent: update\ndata: {"changed":[{"id":"solana","name":"Solana","market_cap":80000000000.0}],"removed":[]}\n\n'
+
+    response.close()
+    assert not live_feed.subscribers
+
+
+def test_listener_rereads_the_coins_each_notification_names(monkeypatch):
+    Notify = namedtuple('Notify', 'payload')
+    reads = []
+
+    def fetch_rows(conn, ids=None):
+        reads.append(ids)
+        return [coin('bitcoin', 7e11)] if ids is None else [coin('bitcoin', 7.1e11)]
+
+    feed = ChangeFeed()
+    ours, theirs = socket.socketpair()
+
+    class ListenConnection(mock.MagicMock):
+        def fileno(self):
+            return ours.fileno()
+
+        def poll(self):
+            ours.recv(1)
+            self.notifies.append(Notify('{"ids":["bitcoin"]}'))
+            feed.stop()
+
+    conn = ListenConnection(closed=False, notifies=[])
+    feed.connect = lambda: conn
+    monkeypatch.setattr(push, 'fetch_rows', fetch_rows)
+    subscriber = Subscriber()
+    feed.subscribers.add(subscriber)
+    theirs.send(b'x')
+    feed.run()
+
+    assert reads == [None, {'bitcoin'}]
+    assert subscriber.next(0)['changed'] == [coin('bitcoin', 7e11)]
+    assert subscriber.next(0)['changed'] == [coin('bitcoin', 7.1e11)]
+    conn.close.assert_called_once()
+
+
+def test_gunicorn_config_keeps_stream_clients_below_threads(monkeypatch):
+    monkeypatch.delenv('PUSH_MAX_CLIENTS', raising=False)
+    monkeypatch.setenv('WEB_THREADS', '16')
+    settings = runpy.run_path(str(Path(web_app.__file__).with_name('gunicorn.conf.py')))
+
+    assert settings['push_max_clients'] == 8 < settings['threads']
+    assert os.environ['PUSH_MAX_CLIENTS'] == '8'
+
+
+def test_gunicorn_config_sizes_workers_to_the_connection_budget(monkeypatch):
+    monkeypatch.delenv('WEB_WORKERS', raising=False)
+    monkeypatch.setenv('WEB_DB_CONNECTIONS', '40')
+    monkeypatch.setenv('DB_POOL_MAX', '10')
+    monkeypatch.setattr('multiprocessing.cpu_count', lambda: 16)
+    path = str(Path(web_app.__file__).with_name('gunicorn.conf.py'))
+
+    settings = runpy.run_path(path)
+    assert settings['workers'] == 3
+    assert settings['workers'] * (settings['pool_max'] + 1) <= 40
+    monkeypatch.setenv('DB_POOL_MAX', '50')
+    assert runpy.run_path(path)['workers'] == 1
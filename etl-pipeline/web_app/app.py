@@ -1,20 +1,207 @@
-from flask import Flask, render_template, jsonify
-import psycopg2
+from flask import Flask, abort, render_template, request, stream_with_context
+from psycopg2 import sql
 from psycopg2.extras import RealDictCursor
+from datetime import datetime, timezone
+from itertools import count
+import base64
+import binascii
+import json
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
+from web_app import encoding
+from web_app.cache import ResponseCache
+from web_app.db import get_connection
+from web_app.push import HEARTBEAT_SECONDS, RESYNC, ChangeFeed, TooManyClients, sse_event
+
 load_dotenv()
 
 app = Flask(__name__)
 
-# Configure database connection
-db_config = {
-    'host': os.getenv('RDS_HOST'),
-    'database': os.getenv('RDS_DB_NAME'),
-    'user': os.getenv('RDS_USERNAME'),
-    'password': os.getenv('RDS_PASSWORD')
-}
+MAX_LIMIT = 250
+MAX_ROLLUP_LIMIT = 1000
+ROLLUP_INTERVALS = ('1m', '1h', '1d')
+VERSION_CHECK_INTERVAL = float(os.getenv('API_VERSION_CHECK_INTERVAL', 5))
+MAX_PAGE_SIZE = 1000
+# Rows fetched per round trip by streaming cursors, and per compressed chunk of the response
+STREAM_BATCH_ROWS = int(os.getenv('API_STREAM_BATCH_ROWS', 2000))
+# Smaller JSON bodies are sent uncompressed
+COMPRESS_MIN_BYTES = int(os.getenv('API_COMPRESS_MIN_BYTES', 1024))
+STREAM_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+response_cache = ResponseCache(ttl=float(os.getenv('API_CACHE_TTL', 60)))
+change_feed = ChangeFeed()
+
+_version = {'value': None, 'checked_at': 0.0}
+_version_lock = threading.Lock()
+
+# Column names per table, read from the catalog and re-read when a request names an unknown one
+_columns = {}
+_cursor_names = count(1)
+
+def data_version():
+    """Watermark of the last ETL batch, re-read from the database at most every VERSION_CHECK_INTERVAL.
+
+    The candles are merged and committed after crypto_data, so the newest candle's close is part
+    of the watermark too: candles cached between the two commits are not served past the second.
+    """
+    with _version_lock:
+        if time.monotonic() - _version['checked_at'] < VERSION_CHECK_INTERVAL:
+            return _version['value']
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT max(last_updated), count(*), to_regclass('coin_candles') IS NOT NULL FROM crypto_data")
+            latest, rows, has_candles = cur.fetchone()
+            candles = None
+            if has_candles:
+                # A run's fresh observations land in the newest 1m bucket, read through the (width, bucket_start) index;
+                # coin and category candles are committed together
+                cur.execute("""
+                    SELECT max(closed_at) FROM coin_candles
+                    WHERE width = '1m' AND bucket_start = (SELECT max(bucket_start) FROM coin_candles WHERE width = '1m')
+                """)
+                candles = cur.fetchone()[0]
+            _version['value'] = (latest, rows, candles)
+        _version['checked_at'] = time.monotonic()
+        return _version['value']
+
+def cached_json_response(key, query, dumps=None):
+    """Serve `query()` as JSON from the response cache, answering If-None-Match with a 304.
+
+    `dumps` renders the body as bytes, Flask's JSON provider by default. Bodies of at least
+    COMPRESS_MIN_BYTES are gzip/brotli-compressed when the client accepts it.
+    """
+    version = data_version()
+    entry = response_cache.get(key, version)
+    if entry is None:
+        body = dumps(query()) if dumps else app.json.dumps(query()).encode()
+        entry = response_cache.set(key, version, body)
+    body, etag = entry.body, entry.etag
+    content_encoding = encoding.negotiate_encoding(request.accept_encodings) if len(body) >= COMPRESS_MIN_BYTES else None
+    if content_encoding:
+        # Compressed once per cached body and encoding, not on every hit
+        if content_encoding not in entry.encoded:
+            entry.encoded[content_encoding] = encoding.compress(body, content_encoding)
+        body, etag = entry.encoded[content_encoding], f"{etag}-{content_encoding}"
+    response = app.response_class(body, mimetype='application/json')
+    if content_encoding:
+        response.headers['Content-Encoding'] = content_encoding
+    response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def table_columns(table, refresh=False):
+    """Column names of `table` in table order, cached per process."""
+    if refresh or table not in _columns:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT column_name FROM information_schema.columns WHERE table_name = %s ORDER BY ordinal_position",
+                (table,)
+            )
+            _columns[table] = [row[0] for row in cur.fetchall()]
+    return _columns[table]
+
+def projected_fields(table):
+    """Columns named by `?fields=` (comma-separated), in request order; every column when absent.
+
+    Answers 503 while `table` does not exist, before any streamed response has sent its status.
+    """
+    columns = table_columns(table)
+    if not columns:
+        # The ETL may have created the table since it was looked up
+        columns = table_columns(table, refresh=True)
+    if not columns:
+        abort(503, f"{table} has not been created yet")
+    value = request.args.get('fields')
+    if not value:
+        return columns
+    fields = list(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    if not set(fields) <= set(columns):
+        # The ETL may have added the column since it was cached
+        columns = table_columns(table, refresh=True)
+    unknown = set(fields) - set(columns)
+    if unknown:
+        abort(400, f"Unknown fields: {', '.join(sorted(unknown))}")
+    return fields
+
+def stream_format():
+    """Requested response format: `json` (a page) or one of the streamed STREAM_FORMATS."""
+    fmt = request.args.get('format', default='json')
+    if fmt != 'json' and fmt not in STREAM_FORMATS:
+        abort(400, f"format must be one of json, {', '.join(STREAM_FORMATS)}")
+    return fmt
+
+def encode_cursor(market_cap, coin_id):
+    return base64.urlsafe_b64encode(json.dumps([market_cap, coin_id]).encode()).decode().rstrip('=')
+
+def decode_cursor(token):
+    """The `(market_cap, id)` of the last row of the previous page, from an opaque `after` token."""
+    try:
+        market_cap, coin_id = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if not isinstance(coin_id, str) or not (market_cap is None or isinstance(market_cap, (int, float))):
+            raise ValueError(token)
+    except (binascii.Error, ValueError, TypeError):
+        abort(400, "after must be a cursor returned as next_cursor")
+    return market_cap, coin_id
+
+def market_query(fields, after, limit):
+    """SELECT of `fields` plus the key columns, ordered by `(market_cap, id)` descending after `after`."""
+    columns = fields + [column for column in ('market_cap', 'id') if column not in fields]
+    if after is None:
+        condition, params = sql.SQL("TRUE"), []
+    elif after[0] is None:
+        condition, params = sql.SQL("market_cap IS NULL AND id < %s"), [after[1]]
+    else:
+        # Compared as real, the column type, so the JSON round trip of the key cannot skip ties
+        condition = sql.SQL(
+            "(market_cap < %s::real OR (market_cap = %s::real AND id < %s) OR market_cap IS NULL)"
+        )
+        params = [after[0], after[0], after[1]]
+    query = sql.SQL(
+        "SELECT {columns} FROM crypto_data WHERE {condition} ORDER BY market_cap DESC NULLS LAST, id DESC"
+    ).format(columns=sql.SQL(', ').join(map(sql.Identifier, columns)), condition=condition)
+    if limit is not None:
+        query += sql.SQL(" LIMIT %s")
+        params.append(limit)
+    return query, params
+
+def stream_rows(query, params):
+    """Batches of rows from a server-side cursor, so memory stays flat whatever the result size."""
+    with get_connection() as conn:
+        # Named cursors need a transaction; the pool hands connections out in autocommit
+        conn.autocommit = False
+        try:
+            with conn.cursor(name=f"api_stream_{next(_cursor_names)}", cursor_factory=RealDictCursor) as cur:
+                cur.itersize = STREAM_BATCH_ROWS
+                cur.execute(query, params)
+                while True:
+                    rows = cur.fetchmany(STREAM_BATCH_ROWS)
+                    if not rows:
+                        break
+                    yield rows
+        finally:
+            conn.rollback()
+            conn.autocommit = True
+
+def streamed_response(query, params, fields, fmt):
+    """Stream the rows of `query` as NDJSON or CSV, compressed chunk by chunk when the client accepts it."""
+    chunks = encoding.ndjson_chunks if fmt == 'ndjson' else encoding.csv_chunks
+    content_encoding = encoding.negotiate_encoding(request.accept_encodings)
+
+    def generate():
+        compressor = encoding.StreamCompressor(content_encoding) if content_encoding else None
+        for chunk in chunks(stream_rows(query, params), fields):
+            yield compressor.compress(chunk) if compressor else chunk
+        if compressor:
+            yield compressor.finish()
+
+    response = app.response_class(stream_with_context(generate()), mimetype=STREAM_FORMATS[fmt])
+    if content_encoding:
+        response.headers['Content-Encoding'] = content_encoding
+    response.vary.add('Accept-Encoding')
+    return response
 
 @app.route('/')
 def index():
@@ -22,13 +209,175 @@ def index():
 
 @app.route('/api/crypto_data')
 def get_crypto_data():
-    conn = psycopg2.connect(**db_config)
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute("SELECT * FROM crypto_data ORDER BY market_cap DESC LIMIT 10")
-    data = cur.fetchall()
-    cur.close()
-    conn.close()
-    return jsonify(data)
+    limit = min(max(request.args.get('limit', default=10, type=int), 1), MAX_LIMIT)
+
+    def query():
+        with get_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("SELECT * FROM crypto_data ORDER BY market_cap DESC LIMIT %s", (limit,))
+            return cur.fetchall()
+
+    return cached_json_response((request.path, limit), query)
+
+@app.route('/api/markets')
+def get_markets():
+    """Coins by market cap with `?fields=` projection and keyset pagination on `(market_cap, id)`.
+
+    `format=json` returns one page of `limit` rows and a `next_cursor` to pass as `after`;
+    `format=ndjson` or `csv` streams every row after `after`, or the first `limit` if given.
+    """
+    fields = projected_fields('crypto_data')
+    fmt = stream_format()
+    after = decode_cursor(request.args['after']) if request.args.get('after') else None
+
+    if fmt != 'json':
+        limit = request.args.get('limit', type=int)
+        query, params = market_query(fields, after, max(limit, 1) if limit is not None else None)
+        return streamed_response(query, params, fields, fmt)
+
+    limit = min(max(request.args.get('limit', default=100, type=int), 1), MAX_PAGE_SIZE)
+
+    def query():
+        statement, params = market_query(fields, after, limit + 1)
+        with get_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(statement, params)
+            rows = cur.fetchall()
+        last = rows[limit - 1] if len(rows) > limit else None
+        return {
+            'data': [{field: row[field] for field in fields} for row in rows[:limit]],
+            'next_cursor': encode_cursor(last['market_cap'], last['id']) if last else None,
+        }
+
+    return cached_json_response((request.path, tuple(fields), limit, after), query, dumps=encoding.dumps)
+
+@app.route('/api/history/<coin_id>')
+def get_coin_history(coin_id):
+    """Stream one coin's price history, oldest first, as NDJSON (default) or CSV with `?fields=`."""
+    fields = projected_fields('crypto_prices_history')
+    fmt = request.args.get('format', default='ndjson')
+    if fmt not in STREAM_FORMATS:
+        abort(400, f"format must be one of {', '.join(STREAM_FORMATS)}")
+    start, end = time_bounds()
+    query = sql.SQL("""
+        SELECT {columns} FROM crypto_prices_history
+        WHERE id = %s
+          AND (%s::timestamp IS NULL OR last_updated >= %s)
+          AND (%s::timestamp IS NULL OR last_updated < %s)
+        ORDER BY last_updated
+    """).format(columns=sql.SQL(', ').join(map(sql.Identifier, fields)))
+    return streamed_response(query, [coin_id, start, start, end, end], fields, fmt)
+
+@app.route('/api/stream')
+def stream_changes():
+    """Server-sent events: a `snapshot` of every coin, then an `update` with only the changed coins per load.
+
+    Clients that fall too far behind get a fresh `snapshot` in place of the diffs they missed;
+    beyond PUSH_MAX_CLIENTS connections, new clients are turned away with a 503.
+    """
+    try:
+        subscriber, snapshot = change_feed.subscribe()
+    except TooManyClients:
+        response = app.response_class("Too many live connections, retry later", status=503, mimetype='text/plain')
+        response.headers['Retry-After'] = str(int(HEARTBEAT_SECONDS))
+        return response
+
+    def generate():
+        try:
+            yield sse_event('snapshot', encoding.dumps(snapshot['rows']), snapshot['sequence'])
+            while True:
+                event = subscriber.next(HEARTBEAT_SECONDS)
+                if event is None:
+                    # Comment line; keeps proxies from closing the stream and detects gone clients
+                    yield b': keepalive\n\n'
+                elif event is RESYNC:
+                    latest = change_feed.snapshot()
+                    yield sse_event('snapshot', encoding.dumps(latest['rows']), latest['sequence'])
+                else:
+                    body = encoding.dumps({'changed': event['changed'], 'removed': event['removed']})
+                    yield sse_event('update', body, event['sequence'])
+        finally:
+            change_feed.unsubscribe(subscriber)
+
+    response = app.response_class(generate(), mimetype='text/event-stream')
+    response.cache_control.no_cache = True
+    # Stop nginx-style proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def time_bounds():
+    """Validated start/end (ISO 8601) query parameters, as naive UTC like the stored timestamps."""
+    bounds = {}
+    for name in ('start', 'end'):
+        value = request.args.get(name)
+        try:
+            bounds[name] = datetime.fromisoformat(value.replace('Z', '+00:00')) if value else None
+        except ValueError:
+            abort(400, f"{name} must be an ISO 8601 timestamp")
+        if bounds[name] is not None and bounds[name].tzinfo is not None:
+            bounds[name] = bounds[name].astimezone(timezone.utc).replace(tzinfo=None)
+    return bounds['start'], bounds['end']
+
+def rollup_filters():
+    """Validated interval, start/end (ISO 8601) and limit/offset query parameters of a rollup endpoint."""
+    interval = request.args.get('interval', default='1h')
+    if interval not in ROLLUP_INTERVALS:
+        abort(400, f"interval must be one of {', '.join(ROLLUP_INTERVALS)}")
+    start, end = time_bounds()
+    limit = min(max(request.args.get('limit', default=100, type=int), 1), MAX_ROLLUP_LIMIT)
+    offset = max(request.args.get('offset', default=0, type=int), 0)
+    return interval, start, end, limit, offset
+
+def rollup_page(table, key_column, key, interval, start, end, limit, offset):
+    """One page of candles for `key`, oldest first, with the offset of the next page if there is one."""
+    with get_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(f"""
+            SELECT * FROM {table}
+            WHERE {key_column} = %s AND width = %s
+              AND (%s::timestamp IS NULL OR bucket_start >= %s)
+              AND (%s::timestamp IS NULL OR bucket_start < %s)
+            ORDER BY bucket_start
+            LIMIT %s OFFSET %s
+        """, (key, interval, start, start, end, end, limit + 1, offset))
+        rows = cur.fetchall()
+    return {
+        'interval': interval,
+        'data': rows[:limit],
+        'next_offset': offset + limit if len(rows) > limit else None,
+    }
+
+@app.route('/api/rollups/coins/<coin_id>')
+def get_coin_candles(coin_id):
+    """Price candles with market cap, dominance and volatility for one coin."""
+    filters = rollup_filters()
+    return cached_json_response(
+        (request.path,) + filters,
+        lambda: rollup_page('coin_candles', 'id', coin_id, *filters)
+    )
+
+@app.route('/api/rollups/categories/<category>')
+def get_category_candles(category):
+    """Market cap and dominance candles with volatility histograms for one market_cap_category."""
+    filters = rollup_filters()
+    return cached_json_response(
+        (request.path,) + filters,
+        lambda: rollup_page('category_candles', 'market_cap_category', category, *filters)
+    )
+
+@app.route('/api/rollups/categories')
+def get_category_summary():
+    """Latest candle of each market_cap_category for the interval, as of `end` if given."""
+    interval, _, end, _, _ = rollup_filters()
+
+    def query():
+        with get_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                SELECT DISTINCT ON (market_cap_category) *
+                FROM category_candles
+                WHERE width = %s AND (%s::timestamp IS NULL OR bucket_start < %s)
+                ORDER BY market_cap_category, bucket_start DESC
+            """, (interval, end, end))
+            return cur.fetchall()
+
+    return cached_json_response((request.path, interval, end), query)
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
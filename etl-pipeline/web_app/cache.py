@@ -0,0 +1,47 @@
+from collections import namedtuple
+import hashlib
+import threading
+import time
+
+# `encoded` holds the body compressed per content coding, filled in as clients ask for them
+CachedResponse = namedtuple('CachedResponse', ['body', 'etag', 'version', 'expires_at', 'encoded'])
+
+
+class ResponseCache:
+    """In-process cache of rendered API responses.
+
+    Entries are keyed by endpoint and query parameters and are valid until `ttl` seconds pass or
+    the data version they were rendered from changes, whichever comes first.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None or entry.version != version or entry.expires_at <= time.monotonic():
+            return None
+        return entry
+
+    def set(self, key, version, body: bytes) -> CachedResponse:
+        entry = CachedResponse(
+            body=body,
+            etag=hashlib.sha1(body).hexdigest(),
+            version=version,
+            expires_at=time.monotonic() + self.ttl,
+            encoded={},
+        )
+        with self.lock:
+            if len(self.entries) >= self.max_entries and key not in self.entries:
+                # Evict the entry closest to expiry
+                self.entries.pop(min(self.entries, key=lambda k: self.entries[k].expires_at))
+            self.entries[key] = entry
+        return entry
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,100 @@
+from contextlib import contextmanager
+import logging
+import os
+import threading
+import time
+
+import psycopg2
+from psycopg2 import pool
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configure database connection
+db_config = {
+    'host': os.getenv('RDS_HOST'),
+    'port': os.getenv('RDS_PORT', '5432'),
+    'database': os.getenv('RDS_DB_NAME'),
+    'user': os.getenv('RDS_USERNAME'),
+    'password': os.getenv('RDS_PASSWORD')
+}
+
+POOL_MIN_CONNECTIONS = int(os.getenv('DB_POOL_MIN', 1))
+POOL_MAX_CONNECTIONS = int(os.getenv('DB_POOL_MAX', 10))
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+HEALTH_CHECK_INTERVAL = float(os.getenv('DB_HEALTH_CHECK_INTERVAL', 30))
+
+_pool = None
+_pool_lock = threading.Lock()
+# ThreadedConnectionPool raises instead of waiting when exhausted; the semaphore makes callers queue
+_slots = threading.BoundedSemaphore(POOL_MAX_CONNECTIONS)
+# Last time each pooled connection was known to be healthy, keyed by id(conn)
+_last_checked = {}
+
+
+def get_pool():
+    """Process-wide connection pool, created on first use (after any worker fork)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pool.ThreadedConnectionPool(POOL_MIN_CONNECTIONS, POOL_MAX_CONNECTIONS, **db_config)
+                logger.info(f"Created database pool ({POOL_MIN_CONNECTIONS}-{POOL_MAX_CONNECTIONS} connections)")
+    return _pool
+
+
+def _is_healthy(conn):
+    """Ping connections that have been idle longer than HEALTH_CHECK_INTERVAL."""
+    if conn.closed:
+        return False
+    if time.monotonic() - _last_checked.get(id(conn), 0) < HEALTH_CHECK_INTERVAL:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _discard(conn):
+    _last_checked.pop(id(conn), None)
+    get_pool().putconn(conn, close=True)
+
+
+@contextmanager
+def get_connection():
+    """Borrow a healthy autocommit connection from the pool for the duration of the block."""
+    if not _slots.acquire(timeout=POOL_TIMEOUT):
+        raise pool.PoolError(f"No database connection available within {POOL_TIMEOUT}s")
+    conn = None
+    try:
+        for _ in range(POOL_MAX_CONNECTIONS + 1):
+            conn = get_pool().getconn()
+            if not conn.closed:
+                conn.autocommit = True
+            if _is_healthy(conn):
+                break
+            logger.warning("Discarding broken pooled database connection")
+            _discard(conn)
+            conn = None
+        if conn is None:
+            raise pool.PoolError("Could not obtain a healthy database connection")
+
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            _discard(conn)
+            conn = None
+            raise
+
+        _last_checked[id(conn)] = time.monotonic()
+    finally:
+        if conn is not None:
+            if conn.closed:
+                _discard(conn)
+            else:
+                get_pool().putconn(conn)
+        _slots.release()
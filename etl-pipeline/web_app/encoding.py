@@ -0,0 +1,117 @@
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from io import StringIO
+from typing import Iterable, List, Optional
+import csv
+import json
+import math
+import zlib
+
+try:
+    import orjson
+except ImportError:  # the 'api' extra; the stdlib fallback gives the same JSON, more slowly
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # the 'api' extra; without it only gzip is offered
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        # Timestamps are stored as naive UTC
+        return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value) if value.is_finite() else None
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _finite(value):
+    """`value` with NaN and infinities as None, which orjson writes as null; the stdlib would write NaN."""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    return value
+
+
+def dumps(value) -> bytes:
+    """Compact JSON with ISO 8601 UTC timestamps and non-finite floats as null, through orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(_finite(value), default=_default, separators=(',', ':'), allow_nan=False).encode()
+
+
+def ndjson_chunks(batches: Iterable[List[dict]], fields: List[str]) -> Iterable[bytes]:
+    """One JSON object per row and line, projected to `fields`, one chunk per batch of rows."""
+    for rows in batches:
+        yield b''.join(dumps({field: row[field] for field in fields}) + b'\n' for row in rows)
+
+
+def _csv_value(value):
+    if isinstance(value, (datetime, date)):
+        return _default(value)
+    return value
+
+
+def csv_chunks(batches: Iterable[List[dict]], fields: List[str]) -> Iterable[bytes]:
+    """A header line, then the rows projected to `fields` as CSV, one chunk per batch of rows."""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for rows in batches:
+        writer.writerows([_csv_value(row[field]) for field in fields] for row in rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Header of an empty result
+        yield buffer.getvalue().encode('utf-8')
+
+
+def available_encodings() -> List[str]:
+    return (['br'] if brotli is not None else []) + ['gzip']
+
+
+def negotiate_encoding(accept_encodings) -> Optional[str]:
+    """Best of the supported content codings in a request's Accept-Encoding, or None."""
+    return accept_encodings.best_match(available_encodings())
+
+
+class StreamCompressor:
+    """Incremental gzip or brotli; every chunk is flushed so clients can decode rows as they arrive."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == 'br':
+            self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        elif encoding == 'gzip':
+            self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        else:
+            raise ValueError(f"Unsupported content encoding {encoding!r}")
+
+    def compress(self, chunk: bytes) -> bytes:
+        if self.encoding == 'br':
+            return self.compressor.process(chunk) + self.compressor.flush()
+        return self.compressor.compress(chunk) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == 'br':
+            return self.compressor.finish()
+        return self.compressor.flush()
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """`body` compressed whole with `encoding`."""
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
@@ -0,0 +1,55 @@
+"""gunicorn settings for serving the dashboard in production:
+
+    gunicorn -c web_app/gunicorn.conf.py web_app.app:app
+
+Every worker process has its own database pool (DB_POOL_MAX connections) plus one LISTEN
+connection for the push feed once a dashboard subscribes, so RDS sees up to
+WEB_WORKERS * (DB_POOL_MAX + 1) connections from one host. Unless set, WEB_WORKERS is the
+CPU-based count capped so that total fits in WEB_DB_CONNECTIONS (default 40), leaving the
+rest of RDS max_connections to the ETL and other hosts.
+
+PUSH_MAX_CLIENTS is enforced per worker, so a host accepts up to WEB_WORKERS * PUSH_MAX_CLIENTS
+open /api/stream dashboards. Unless set, it defaults to half of WEB_THREADS.
+"""
+import logging
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('WEB_PORT', '8000')}"
+pool_max = int(os.getenv('DB_POOL_MAX', 10))
+db_connections = int(os.getenv('WEB_DB_CONNECTIONS', 40))
+workers = int(os.getenv(
+    'WEB_WORKERS', max(min(multiprocessing.cpu_count() * 2 + 1, db_connections // (pool_max + 1)), 1)
+))
+# Threaded workers: an open /api/stream dashboard holds a thread, not a whole process, so
+# PUSH_MAX_CLIENTS must stay below WEB_THREADS to leave threads for ordinary requests. Workers
+# import the app after this file runs and inherit the default set here.
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', 16))
+os.environ.setdefault('PUSH_MAX_CLIENTS', str(max(threads // 2, 1)))
+push_max_clients = int(os.environ['PUSH_MAX_CLIENTS'])
+keepalive = 5
+timeout = 30
+graceful_timeout = 30
+# The pool and the change feed are created lazily in each worker, never shared across a fork
+preload_app = False
+accesslog = os.getenv('WEB_ACCESS_LOG', '-')
+loglevel = os.getenv('WEB_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    log = logging.getLogger('gunicorn.error')
+    log.info(
+        f"{workers} workers x {threads} threads, {push_max_clients} stream clients per worker; "
+        f"up to {workers * (pool_max + 1)} database connections"
+    )
+    if workers * (pool_max + 1) > db_connections:
+        log.warning(
+            f"{workers} workers can open {workers * (pool_max + 1)} database connections, more than "
+            f"WEB_DB_CONNECTIONS={db_connections}; lower WEB_WORKERS or DB_POOL_MAX"
+        )
+    if push_max_clients >= threads:
+        log.warning(
+            f"PUSH_MAX_CLIENTS={push_max_clients} >= WEB_THREADS={threads}: open dashboards can take "
+            "every thread of a worker and stall ordinary requests"
+        )
@@ -0,0 +1,195 @@
+from typing import Callable, Iterable, List, Optional, Set
+import json
+import logging
+import os
+import queue
+import select
+import threading
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from web_app.db import db_config, get_connection
+
+logger = logging.getLogger(__name__)
+
+# Must match etl_pipeline.schema.CHANGES_CHANNEL, which load_data_task notifies after an upsert
+CHANGES_CHANNEL = 'crypto_data_changes'
+PUSH_COLUMNS = [
+    'id', 'symbol', 'name', 'current_price', 'market_cap', 'market_cap_rank',
+    'price_change_percentage_24h', 'last_updated'
+]
+
+# Per process; web_app/gunicorn.conf.py lowers the default below each worker's thread count
+MAX_CLIENTS = int(os.getenv('PUSH_MAX_CLIENTS', 200))
+# Diffs a client may fall behind by before its backlog is replaced with a fresh snapshot
+CLIENT_QUEUE_SIZE = int(os.getenv('PUSH_CLIENT_QUEUE', 16))
+HEARTBEAT_SECONDS = float(os.getenv('PUSH_HEARTBEAT_SECONDS', 15))
+RECONNECT_SECONDS = float(os.getenv('PUSH_RECONNECT_SECONDS', 5))
+
+# Queued in place of a slow client's dropped backlog: send it the whole snapshot again
+RESYNC = object()
+
+
+class TooManyClients(Exception):
+    pass
+
+
+class Subscriber:
+    """One connected client: a bounded queue of diffs, so a slow reader never blocks the others."""
+
+    def __init__(self, maxsize: int = CLIENT_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize)
+        self.resyncs = 0
+
+    def offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # Too slow to keep up: its pending diffs are stale anyway, replace them with a resync
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.queue.put_nowait(RESYNC)
+            self.resyncs += 1
+
+    def next(self, timeout: float):
+        """The next diff or RESYNC, or None if nothing arrived within `timeout` seconds."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+def pending_ids(notifies: Iterable) -> Optional[Set[str]]:
+    """Coin ids named by a burst of notifications, or None if any of them asks for a full re-read."""
+    ids = set()
+    for notify in notifies:
+        try:
+            named = json.loads(notify.payload).get('ids')
+        except (ValueError, AttributeError):
+            named = None
+        if named is None:
+            return None
+        ids.update(named)
+    return ids
+
+
+class ChangeFeed:
+    """Fans crypto_data changes out to connected dashboards from a single LISTEN connection.
+
+    The listener thread, started with the first subscriber, re-reads only the coins each
+    notification names, diffs them against the rows it last saw and queues the changed ones
+    for every subscriber. Load on RDS is one small query per ETL load, whatever the number of
+    open dashboards.
+    """
+
+    def __init__(self, connect: Callable = None, max_clients: int = MAX_CLIENTS, queue_size: int = CLIENT_QUEUE_SIZE):
+        self.connect = connect or (lambda: psycopg2.connect(**db_config))
+        self.max_clients = max_clients
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.rows = None
+        self.sequence = 0
+        self.thread = None
+        self.stopping = threading.Event()
+
+    def subscribe(self):
+        """Register a client; returns it with the snapshot its diffs apply to."""
+        if self.rows is None:
+            with get_connection() as conn:
+                rows = fetch_rows(conn)
+            with self.lock:
+                if self.rows is None:
+                    self.rows = {row['id']: row for row in rows}
+        with self.lock:
+            if len(self.subscribers) >= self.max_clients:
+                raise TooManyClients(f"{self.max_clients} clients already connected")
+            subscriber = Subscriber(self.queue_size)
+            self.subscribers.add(subscriber)
+            snapshot = self._snapshot()
+            if self.thread is None or not self.thread.is_alive():
+                self.stopping.clear()
+                self.thread = threading.Thread(target=self.run, name='change-feed', daemon=True)
+                self.thread.start()
+        return subscriber, snapshot
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return self._snapshot()
+
+    def _snapshot(self) -> dict:
+        return {'sequence': self.sequence, 'rows': list((self.rows or {}).values())}
+
+    def apply(self, rows: List[dict], ids: Optional[Set[str]] = None) -> Optional[dict]:
+        """Diff `rows` (the re-read of `ids`, or of the whole table when None) and queue the changes."""
+        with self.lock:
+            current = self.rows if self.rows is not None else {}
+            fresh = {row['id']: row for row in rows}
+            changed = [row for coin_id, row in fresh.items() if current.get(coin_id) != row]
+            scope = set(current) if ids is None else ids
+            removed = sorted(coin_id for coin_id in scope if coin_id in current and coin_id not in fresh)
+            if not changed and not removed:
+                return None
+            current.update(fresh)
+            for coin_id in removed:
+                current.pop(coin_id)
+            self.rows = current
+            self.sequence += 1
+            diff = {'sequence': self.sequence, 'changed': changed, 'removed': removed}
+            for subscriber in self.subscribers:
+                subscriber.offer(diff)
+        return diff
+
+    def run(self):
+        """Listen for notifications until stopped, reconnecting and re-reading everything after an error."""
+        while not self.stopping.is_set():
+            conn = None
+            try:
+                conn = self.connect()
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANGES_CHANNEL}")
+                # Notifications sent while not listening are lost
+                self.apply(fetch_rows(conn))
+                while not self.stopping.is_set():
+                    if select.select([conn], [], [], HEARTBEAT_SECONDS) == ([], [], []):
+                        continue
+                    conn.poll()
+                    if conn.notifies:
+                        ids = pending_ids(conn.notifies)
+                        conn.notifies.clear()
+                        self.apply(fetch_rows(conn, ids), ids)
+            except (psycopg2.Error, OSError) as e:
+                logger.error(f"Change feed listener failed, reconnecting in {RECONNECT_SECONDS}s: {str(e)}")
+                self.stopping.wait(RECONNECT_SECONDS)
+            finally:
+                if conn is not None and not conn.closed:
+                    conn.close()
+
+    def stop(self):
+        self.stopping.set()
+
+
+def fetch_rows(conn, ids: Optional[Set[str]] = None) -> List[dict]:
+    """The pushed columns of the coins `ids`, or of every coin when None."""
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        columns = ', '.join(PUSH_COLUMNS)
+        if ids is None:
+            cur.execute(f"SELECT {columns} FROM crypto_data ORDER BY market_cap DESC NULLS LAST")
+        else:
+            cur.execute(f"SELECT {columns} FROM crypto_data WHERE id = ANY(%s)", (sorted(ids),))
+        return [dict(row) for row in cur.fetchall()]
+
+
+def sse_event(event: str, data: bytes, event_id: Optional[int] = None) -> bytes:
+    """One server-sent event; `data` is JSON, which never contains a raw newline."""
+    head = f"id: {event_id}\n".encode() if event_id is not None else b''
+    return head + f"event: {event}\n".encode() + b'data: ' + data + b'\n\n'